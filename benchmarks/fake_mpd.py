@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Stand-in MPD server for benchmarks. Speaks the subset of the MPD protocol used by mpdfront and serves a synthetic
+library and playlist, with an optional delay before every response to simulate a remote server.
+
+The library is not stored: songs are computed from their index, so libraries of hundreds of thousands of songs
+cost no memory. The same size always gives the same library, so results are comparable across runs.
+
+Run standalone to point mpdfront at it: python benchmarks/fake_mpd.py --songs 100000 --playlist 5000
+"""
+import re
+import time
+import select
+import socketserver
+import threading
+import argparse
+
+class SyntheticLibrary:
+    """
+    Library of n_songs songs: artists with albums_per_artist albums of tracks_per_album songs each.
+    Files are laid out as "Artist/Album/NN Title.flac".
+    """
+    def __init__(self, n_songs:int, tracks_per_album:int=12, albums_per_artist:int=4, n_genres:int=40):
+        self.tracks_per_album = tracks_per_album
+        self.albums_per_artist = albums_per_artist
+        self.n_genres = n_genres
+        self.n_albums = max(1, (n_songs + tracks_per_album - 1) // tracks_per_album)
+        self.n_artists = max(1, (self.n_albums + albums_per_artist - 1) // albums_per_artist)
+        self.n_songs = n_songs
+
+    def artist_name(self, artist:int):
+        return "Artist %05d" % artist
+
+    def album_name(self, album:int):
+        return "Album %06d" % album
+
+    def genre_name(self, genre:int):
+        return "Genre %02d" % genre
+
+    def album_artist(self, album:int):
+        return album // self.albums_per_artist
+
+    def album_songs(self, album:int):
+        start = album * self.tracks_per_album
+        return range(start, min(start + self.tracks_per_album, self.n_songs))
+
+    def artist_albums(self, artist:int):
+        start = artist * self.albums_per_artist
+        return range(start, min(start + self.albums_per_artist, self.n_albums))
+
+    def song(self, i:int):
+        """
+        :return: list of (tag, value) pairs, in the order MPD sends them
+        """
+        album = i // self.tracks_per_album
+        track = i % self.tracks_per_album + 1
+        artist = self.artist_name(self.album_artist(album))
+        album_name = self.album_name(album)
+        seconds = 150 + (i * 37) % 300
+        return [
+            ("file", "%s/%s/%02d Song %d.flac" % (artist, album_name, track, i)),
+            ("Last-Modified", "2020-01-01T00:00:00Z"),
+            ("Format", "44100:16:2"),
+            ("Artist", artist),
+            ("AlbumArtist", artist),
+            ("Album", album_name),
+            ("Title", "Song %d" % i),
+            ("Track", str(track)),
+            ("Disc", "1"),
+            ("Date", str(1960 + album % 60)),
+            ("Genre", self.genre_name(album % self.n_genres)),
+            ("Time", str(seconds)),
+            ("duration", "%d.000" % seconds),
+        ]
+
+    def parse_name(self, name:str, prefix:str):
+        """
+        :return: index encoded in a synthetic name, None if name is not one
+        """
+        if not name.startswith(prefix + " "):
+            return None
+        try:
+            return int(name[len(prefix)+1:])
+        except ValueError:
+            return None
+
+    def find_albums(self, filters:dict):
+        """
+        :param filters: dict of lowercase tag -> value
+        :return: list of album indexes matching the filters
+        """
+        if "album" in filters:
+            album = self.parse_name(filters["album"], "Album")
+            albums = [ album ] if album is not None and album < self.n_albums else []
+        else:
+            artist_name = filters.get("albumartist", filters.get("artist"))
+            if artist_name is not None:
+                artist = self.parse_name(artist_name, "Artist")
+                albums = list(self.artist_albums(artist)) if artist is not None else []
+            else:
+                albums = range(self.n_albums)
+        result = []
+        for album in albums:
+            artist = self.artist_name(self.album_artist(album))
+            if filters.get("albumartist", artist) != artist or filters.get("artist", artist) != artist:
+                continue
+            if "genre" in filters and filters["genre"] != self.genre_name(album % self.n_genres):
+                continue
+            result.append(album)
+        return result
+
+    def list(self, tag:str, filters:dict):
+        """
+        :return: list of distinct values of tag among the songs matching filters
+        """
+        albums = self.find_albums(filters)
+        if tag == "album":
+            return [ self.album_name(a) for a in albums ]
+        if tag in ("artist", "albumartist"):
+            return list(dict.fromkeys([ self.artist_name(self.album_artist(a)) for a in albums ]))
+        if tag == "genre":
+            return sorted(set([ self.genre_name(a % self.n_genres) for a in albums ]))
+        if tag == "date":
+            return sorted(set([ str(1960 + a % 60) for a in albums ]))
+        return []
+
+    def find(self, filters:dict):
+        """
+        :return: list of song indexes matching filters
+        """
+        return [ i for a in self.find_albums(filters) for i in self.album_songs(a) ]
+
+    def lsinfo(self, path:str):
+        """
+        :return: list of responses, each a list of (key, value) pairs
+        """
+        parts = [ p for p in path.split("/") if p ]
+        if not parts:
+            return [ [ ("directory", self.artist_name(a)) ] for a in range(self.n_artists) ]
+        artist = self.parse_name(parts[0], "Artist")
+        if artist is None or artist >= self.n_artists:
+            return None
+        if len(parts) == 1:
+            return [ [ ("directory", "%s/%s" % (parts[0], self.album_name(a))) ] for a in self.artist_albums(artist) ]
+        album = self.parse_name(parts[1], "Album")
+        if len(parts) != 2 or album is None or self.album_artist(album) != artist:
+            return None
+        return [ self.song(i) for i in self.album_songs(album) ]
+
+class FakeMpdServer(socketserver.ThreadingTCPServer):
+    """
+    MPD protocol server for the synthetic library. Keeps a playlist and player state, and notifies idling
+    clients of the changes made with edit_playlist() and change().
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, library:SyntheticLibrary, playlist_length:int=1000, latency:float=0.0, host:str="127.0.0.1",
+                 port:int=0):
+        """
+        :param library: library to serve
+        :param playlist_length: number of songs in the playlist
+        :param latency: seconds to wait before every response
+        :param port: TCP port, 0 for any free port
+        """
+        super().__init__((host, port), FakeMpdHandler)
+        self.library = library
+        self.latency = latency
+        self.lock = threading.Condition()
+        self.next_id = 1
+        self.playlist_version = 1
+        self.playlist = []          ## list of [song index, song id, version the position last changed]
+        for p in range(playlist_length):
+            self.playlist.append([ (p * 7919) % library.n_songs, self.next_id, 1 ])
+            self.next_id += 1
+        self.current = 0
+        self.state = "play"
+        self.started = time.monotonic()
+        self.db_update = str(int(time.time()))
+        self.clients = []           ## sets of pending idle events, one per connection
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fakeMpdServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def change(self, *subsystems):
+        """
+        Reports changes to idling clients.
+        """
+        with self.lock:
+            for events in self.clients:
+                events.update(subsystems)
+            self.lock.notify_all()
+
+    def edit_playlist(self, n_changes:int):
+        """
+        Replaces the songs at n_changes positions, spread over the playlist, and notifies idling clients.
+        """
+        with self.lock:
+            self.playlist_version += 1
+            step = max(1, len(self.playlist) // max(1, n_changes))
+            for p in range(0, min(len(self.playlist), n_changes * step), step):
+                entry = self.playlist[p]
+                entry[0] = (entry[0] + 1) % self.library.n_songs
+                entry[1] = self.next_id
+                entry[2] = self.playlist_version
+                self.next_id += 1
+        self.change("playlist")
+
+    def playlist_entries(self, since:int=0):
+        """
+        :return: list of responses for the playlist positions that changed after version since
+        """
+        with self.lock:
+            entries = [ (p, e[0], e[1]) for p, e in enumerate(self.playlist) if e[2] > since ]
+        return [ self.library.song(i) + [ ("Pos", str(p)), ("Id", str(song_id)) ] for p, i, song_id in entries ]
+
+    def status(self):
+        with self.lock:
+            elapsed = (time.monotonic() - self.started) % 150
+            pairs = [ ("volume", "100"), ("repeat", "0"), ("random", "0"), ("single", "0"), ("consume", "0"),
+                      ("playlist", str(self.playlist_version)), ("playlistlength", str(len(self.playlist))),
+                      ("state", self.state) ]
+            if self.playlist:
+                pairs += [ ("song", str(self.current)), ("songid", str(self.playlist[self.current][1])) ]
+                if self.current + 1 < len(self.playlist):
+                    pairs += [ ("nextsong", str(self.current + 1)),
+                               ("nextsongid", str(self.playlist[self.current + 1][1])) ]
+                pairs += [ ("time", "%d:%d" % (elapsed, 180)), ("elapsed", "%.3f" % elapsed),
+                           ("duration", "180.000"), ("bitrate", "1411"), ("audio", "44100:16:2") ]
+        return pairs
+
+    def currentsong(self):
+        with self.lock:
+            if not self.playlist:
+                return []
+            i, song_id, version = self.playlist[self.current]
+            return self.library.song(i) + [ ("Pos", str(self.current)), ("Id", str(song_id)) ]
+
+    def stats(self):
+        return [ ("artists", str(self.library.n_artists)), ("albums", str(self.library.n_albums)),
+                 ("songs", str(self.library.n_songs)), ("uptime", "1"), ("db_playtime", "1"),
+                 ("db_update", self.db_update), ("playtime", "1") ]
+
+arg_re = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+unescape_re = re.compile(r'\\(.)')
+
+def parse_command(line:str):
+    """
+    :return: list of the command and its args
+    """
+    return [ unescape_re.sub(r'\1', quoted) if quoted or not bare else bare for quoted, bare in arg_re.findall(line) ]
+
+def parse_filters(args:list):
+    """
+    :param args: old style filter args, alternating tag and value. A filter expression is taken to match every song,
+                 the only one mpdfront sends is "(file != '')".
+    :return: dict of lowercase tag -> value
+    """
+    if args and args[0].startswith("("):
+        return {}
+    return { args[i].lower(): args[i+1] for i in range(0, len(args) - 1, 2) }
+
+def parse_window(args:list):
+    """
+    Takes the window arg off args.
+    :return: tuple of (args without the window, slice of the results to return)
+    """
+    if len(args) >= 2 and args[-2].lower() == "window":
+        start, end = args[-1].split(":")
+        return args[:-2], slice(int(start), int(end))
+    return args, slice(None)
+
+class FakeMpdHandler(socketserver.StreamRequestHandler):
+    """
+    One client connection.
+    """
+    def setup(self):
+        super().setup()
+        self.events = set()
+        with self.server.lock:
+            self.server.clients.append(self.events)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.clients.remove(self.events)
+        super().finish()
+
+    def send(self, lines:list):
+        self.wfile.write(("".join([ line + "\n" for line in lines ])).encode())
+
+    def handle(self):
+        self.send([ "OK MPD 0.23.5" ])
+        command_list = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = parse_command(line.decode().rstrip("\n"))
+            if not args:
+                continue
+            command = args[0]
+            if command in ("command_list_ok_begin", "command_list_begin"):
+                command_list = []
+                continue
+            if command == "command_list_end":
+                self.delay()
+                out = []
+                for c in command_list:
+                    result = self.run(c[0], c[1:])
+                    if result is None:
+                        out.append('ACK [50@0] {%s} No such file or directory' % c[0])
+                        break
+                    out.extend(result)
+                    out.append("list_OK")
+                else:
+                    out.append("OK")
+                command_list = None
+                self.send(out)
+                continue
+            if command_list is not None:
+                command_list.append(args)
+                continue
+            if command == "close":
+                return
+            if command == "idle":
+                self.idle()
+                continue
+            if command == "noidle":
+                continue
+            self.delay()
+            result = self.run(command, args[1:])
+            if result is None:
+                self.send([ 'ACK [50@0] {%s} No such file or directory' % command ])
+            else:
+                self.send(result + [ "OK" ])
+
+    def delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def idle(self):
+        """
+        Waits until a change is reported or the client sends noidle.
+        """
+        while True:
+            with self.server.lock:
+                if self.events:
+                    changes = sorted(self.events)
+                    self.events.clear()
+                    self.send([ "changed: %s" % c for c in changes ] + [ "OK" ])
+                    return
+                self.server.lock.wait(0.05)
+            readable, _, _ = select.select([ self.connection ], [], [], 0)
+            if readable:
+                line = self.rfile.readline()
+                if not line or line.strip() == b"noidle":
+                    self.send([ "OK" ])
+                    return
+
+    def run(self, command:str, args:list):
+        """
+        :return: list of response lines without the final OK, None for an error
+        """
+        server = self.server
+        library = server.library
+        if command == "ping":
+            return []
+        if command == "status":
+            return [ "%s: %s" % p for p in server.status() ]
+        if command == "stats":
+            return [ "%s: %s" % p for p in server.stats() ]
+        if command == "currentsong":
+            return [ "%s: %s" % p for p in server.currentsong() ]
+        if command == "outputs":
+            return [ "outputid: 0", "outputname: Fake output", "plugin: null", "outputenabled: 1" ]
+        if command == "playlistinfo":
+            return [ "%s: %s" % p for song in server.playlist_entries() for p in song ]
+        if command == "plchanges":
+            return [ "%s: %s" % p for song in server.playlist_entries(int(args[0])) for p in song ]
+        if command == "list":
+            tag = args[0].lower()
+            key = { "albumartist": "AlbumArtist", "artist": "Artist", "album": "Album", "genre": "Genre",
+                    "date": "Date" }.get(tag, args[0])
+            return [ "%s: %s" % (key, v) for v in library.list(tag, parse_filters(args[1:])) ]
+        if command == "find":
+            args, window = parse_window(args)
+            return [ "%s: %s" % p for i in library.find(parse_filters(args))[window] for p in library.song(i) ]
+        if command == "lsinfo":
+            entries = library.lsinfo(args[0] if args else "")
+            if entries is None:
+                return None
+            return [ "%s: %s" % p for entry in entries for p in entry ]
+        if command in ("play", "pause", "stop", "next", "previous", "seekcur", "playid"):
+            with server.lock:
+                if command == "stop":
+                    server.state = "stop"
+                elif command == "pause":
+                    server.state = "pause"
+                else:
+                    server.state = "play"
+            server.change("player")
+            return []
+        ## commands changing state that the benchmarks do not look at
+        return []
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake MPD server with a synthetic library")
+    parser.add_argument("--songs", type=int, default=10000, help="number of songs in the library")
+    parser.add_argument("--playlist", type=int, default=1000, help="number of songs in the playlist")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay before every response")
+    parser.add_argument("--port", type=int, default=6601, help="TCP port")
+    args = parser.parse_args()
+    server = FakeMpdServer(SyntheticLibrary(args.songs), args.playlist, args.latency_ms / 1000, port=args.port)
+    print("serving %d songs on port %d" % (args.songs, server.port))
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Compares the memory used by content tree nodes in the baseline node model (full metadata dict, eager child
+layer) and in the current one (mpdfront.data.ContentTreeNode).
+The baseline ContentTreeNode is the actual class of the baseline revision, loaded with git from the repository
+this script is in.
+Builds a synthetic library of albums and songs in the same shape as a fully browsed "Albums" category and
+reports, per model, the Python heap allocated for the nodes and the growth of the resident set size.
+Each model runs in its own process, so one does not inherit the other's heap.
+
+Usage: python benchmarks/node_memory.py [--albums N] [--tracks N] [--baseline REVISION]
+"""
+import os, sys
+import types
+import argparse
+import json
+import subprocess
+import tracemalloc
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo_dir)
+from mpdfront import data
+from mpdfront.constants import Constants
+
+baseline_revision = "3915f56"   ## revision before the compact node model
+
+def load_baseline_node_class(revision:str):
+    """
+    Loads mpdfront/data.py as it was at revision, as a module of the mpdfront package.
+    :return: ContentTreeNode class of that revision
+    """
+    source = subprocess.run([ "git", "show", "%s:mpdfront/data.py" % revision ], cwd=repo_dir, check=True,
+                            capture_output=True, text=True).stdout
+    module = types.ModuleType("mpdfront.baseline_data")
+    module.__package__ = "mpdfront"
+    exec(compile(source, "%s:mpdfront/data.py" % revision, "exec"), module.__dict__)
+    return module.ContentTreeNode
+
+models = {
+    "baseline": load_baseline_node_class,
+    "compact": lambda revision: data.ContentTreeNode,
+}
+
+def song_metadata(album:int, track:int):
+    """
+    :return: metadata of a synthetic song, with the keys MPD returns for find, built from fresh strings as the
+             MPD client would
+    """
+    artist = "Artist %d" % (album // 5)
+    return {
+        'file': "music/%s/Album %d/%02d Song %d.flac" % (artist, album, track, track),
+        'last-modified': "2020-01-%02dT12:00:00Z" % (album % 28 + 1),
+        'format': "%d:%d:%d" % (44100, 16, 2),
+        'artist': "%s" % artist,
+        'albumartist': "%s" % artist,
+        'album': "Album %d" % album,
+        'title': "Song %d of album %d" % (track, album),
+        'track': "%d" % track,
+        'date': "%d" % (1970 + album % 50),
+        'genre': "Genre %d" % (album % 20),
+        'disc': "%d" % 1,
+        'time': "%d" % (180 + track),
+        'duration': "%d.000" % (180 + track),
+        'type': Constants.node_t_song,
+        'name': "%d Song %d of album %d" % (track, track, album),
+    }
+
+def get_rss():
+    """
+    :return: resident set size of this process in bytes
+    """
+    with open("/proc/self/statm") as fh:
+        return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def build_tree(node_class, n_albums:int, n_tracks:int):
+    """
+    Builds a category node with n_albums albums of n_tracks songs each.
+    :return: tuple of (root node, number of nodes)
+    """
+    root = node_class(metadata={'type': Constants.node_t_category, 'name': Constants.topnode_name_albums,
+                                'next_type': Constants.node_t_album})
+    n_nodes = 1
+    for a in range(n_albums):
+        album = node_class(metadata={'name': "Album %d" % a, 'type': Constants.node_t_album,
+                                     'next_type': Constants.node_t_song}, previous=root)
+        songs = [ node_class(metadata=song_metadata(a, t), previous=album) for t in range(1, n_tracks+1) ]
+        album.get_child_layer().splice(0, 0, songs)
+        root.get_child_layer().append(album)
+        n_nodes += 1 + len(songs)
+    return root, n_nodes
+
+def measure(model:str, n_albums:int, n_tracks:int, revision:str):
+    """
+    :return: dict with the measurements of one model
+    """
+    node_class = models[model](revision)
+    rss_before = get_rss()
+    tracemalloc.start()
+    root, n_nodes = build_tree(node_class, n_albums, n_tracks)
+    heap, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = get_rss()
+    return {
+        "model": model,
+        "nodes": n_nodes,
+        "python_heap_bytes": heap,
+        "python_heap_peak_bytes": heap_peak,
+        "rss_growth_bytes": rss_after - rss_before,
+        "bytes_per_node": (rss_after - rss_before) // n_nodes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory use of the content tree node models")
+    parser.add_argument("--albums", type=int, default=5000, help="number of albums")
+    parser.add_argument("--tracks", type=int, default=12, help="number of songs per album")
+    parser.add_argument("--baseline", default=baseline_revision, help="git revision of the baseline node model")
+    parser.add_argument("--model", choices=list(models), help="measure only this model, in this process")
+    args = parser.parse_args()
+
+    if args.model:
+        print(json.dumps(measure(args.model, args.albums, args.tracks, args.baseline)))
+        return
+    results = []
+    for model in models:
+        out = subprocess.run([ sys.executable, __file__, "--albums", str(args.albums), "--tracks", str(args.tracks),
+                               "--baseline", args.baseline, "--model", model ], check=True, capture_output=True,
+                             text=True).stdout
+        results.append(json.loads(out))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Benchmarks mpdfront against the fake MPD server in fake_mpd.py, without a real MPD or music library.
+
+Measures:
+- startup: creating MpdFrontApp until the category columns are loaded
+- the loading paths: load_category_content, load_album_content, get_files_list
+- PlaylistDisplay.update with the full playlist, if a display is available
+- the idle event path: a playlist change on the server until the delta is queued, and applying it
+- the search index: building it, and every keystroke of queries typed one character at a time
+- peak RSS of the process
+
+Every operation runs once to warm up and then --repeat times. The library is generated from its size only, so runs
+with the same arguments are comparable. Results are printed as JSON.
+
+Usage: python benchmarks/run.py [--songs N] [--playlist N] [--latency-ms MS] [--repeat N] [--output FILE]
+"""
+import os, sys
+import time
+import json
+import queue
+import logging
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+import argparse
+import configparser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import gi
+gi.require_version("Gtk", "4.0")
+from gi.repository import Gtk, GLib
+from mpdfront import mpd, data, search
+from mpdfront.application import MpdFrontApp
+from mpdfront.constants import Constants
+from fake_mpd import FakeMpdServer, SyntheticLibrary
+
+def timed(func, *args):
+    """
+    :return: tuple of (seconds func took, return value of func)
+    """
+    start = time.perf_counter()
+    ret = func(*args)
+    return time.perf_counter() - start, ret
+
+def summarize(samples:list):
+    """
+    :return: dict with statistics of a list of durations in seconds
+    """
+    return {
+        "runs": len(samples),
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+def run_repeated(func, repeat:int, *args):
+    """
+    Runs func once to warm up, then repeat times.
+    :return: summary of the timed runs, see summarize()
+    """
+    func(*args)
+    return summarize([ timed(func, *args)[0] for i in range(repeat) ])
+
+def wait_for(condition, timeout:float):
+    """
+    Runs the GLib main loop until condition() is true.
+    :return: True if condition() became true before the timeout
+    """
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        context.iteration(False)
+        time.sleep(0.001)
+    return True
+
+def get_git_revision():
+    try:
+        return subprocess.run([ "git", "rev-parse", "--short", "HEAD" ], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        return None
+
+def create_config(port:int):
+    config = configparser.ConfigParser()
+    config.read_dict({ Constants.config_section_main: {
+        "host": "127.0.0.1",
+        "port": str(port),
+        "music_dir": "/nonexistent",
+        "cache_dir": "",        ## the library cache would make repeated runs measure the cache instead of loading
+    }})
+    return config
+
+def bench_startup(config:configparser.ConfigParser, timeout:float):
+    """
+    :return: tuple of (seconds until the category columns were loaded, the app)
+    """
+    start = time.perf_counter()
+    app = MpdFrontApp(config=config, application_id=Constants.application_id + ".benchmark")
+    categories = [ app.content_tree.get_item(i) for i in range(app.content_tree.get_n_items()) ]
+    categories = [ c for c in categories if c.next_type not in (Constants.node_t_file, Constants.node_t_directory) ]
+    if not wait_for(lambda: all([ c.loaded for c in categories ]), timeout):
+        raise TimeoutError("categories did not load within %d seconds" % timeout)
+    return time.perf_counter() - start, app
+
+def bench_loading(app:MpdFrontApp, client:mpd.Client, library:SyntheticLibrary, repeat:int):
+    """
+    :return: dict of operation name -> summary
+    """
+    results = {}
+    categories = { n['next_type']: data.ContentTreeNode(metadata=n) for n in Constants.browser_1st_column_rows }
+    for next_type, node in categories.items():
+        if next_type == Constants.node_t_directory:
+            continue
+        results["load_category_content[%s]" % next_type] = run_repeated(app.load_category_content, repeat, client,
+                                                                        node)
+    album = data.ContentTreeNode(metadata={'type': Constants.node_t_album, 'name': library.album_name(0),
+                                           'next_type': Constants.node_t_song},
+                                 previous=categories[Constants.node_t_album])
+    results["load_album_content[category]"] = run_repeated(app.load_album_content, repeat, client, album)
+    artist = data.ContentTreeNode(metadata={'type': Constants.node_t_albumartist, 'name': library.artist_name(0),
+                                            'next_type': Constants.node_t_album},
+                                  previous=categories[Constants.node_t_albumartist])
+    album = data.ContentTreeNode(metadata={'type': Constants.node_t_album, 'name': library.album_name(0),
+                                           'next_type': Constants.node_t_song}, previous=artist)
+    results["load_album_content[albumartist]"] = run_repeated(app.load_album_content, repeat, client, album)
+    results["get_files_list[root]"] = run_repeated(app.get_files_list, repeat, client, "")
+    results["get_files_list[album]"] = run_repeated(app.get_files_list, repeat, client, "%s/%s" %
+                                                    (library.artist_name(0), library.album_name(0)))
+    results["load_first_directory_level"] = run_repeated(app.load_first_directory_level, repeat, client,
+                                                         categories[Constants.node_t_directory])
+    return results
+
+def create_window(app:MpdFrontApp):
+    """
+    :return: main window of app, None if there is no display
+    """
+    if not Gtk.init_check():
+        return None
+    app.register(None)
+    app.on_activate(app)
+    return getattr(app, 'window', None)
+
+def bench_playlist(app:MpdFrontApp, client:mpd.Client, repeat:int):
+    playlist = client.playlistinfo()
+    currentsong = client.currentsong()
+    return run_repeated(app.window.playlist_list.update, repeat, playlist, currentsong)
+
+def bench_idle(app:MpdFrontApp, server:FakeMpdServer, n_changes:int, repeat:int, timeout:float):
+    """
+    Measures a playlist change on the server until its delta is queued by an IdleClientThread, and applying the
+    delta to the playlist display if there is a window.
+    :return: dict of operation name -> summary
+    """
+    idle_queue = queue.Queue()
+    queued = threading.Event()
+    mpd.IdleClientThread(host="127.0.0.1", port=server.port, queue=idle_queue, name="benchIdleThread",
+                         notify=queued.set)
+    if not queued.wait(timeout):
+        raise TimeoutError("idle thread did not send the playlist")
+    idle_queue.get()
+    delivery = []
+    apply = []
+    for i in range(repeat + 1):
+        time.sleep(0.1)     ## let the idle thread go back to idle
+        queued.clear()
+        start = time.perf_counter()
+        server.edit_playlist(n_changes)
+        if not queued.wait(timeout):
+            raise TimeoutError("idle thread did not report the playlist change")
+        elapsed = time.perf_counter() - start
+        msg_data = idle_queue.get().get_data()
+        if i == 0:
+            continue
+        delivery.append(elapsed)
+        if getattr(app, 'window', None):
+            apply.append(timed(app.window.playlist_list.apply_changes, msg_data['playlist'], msg_data['length'],
+                               msg_data['current'])[0])
+    results = { "idle_playlist_delta_delivery[%d]" % n_changes: summarize(delivery) }
+    if apply:
+        results["PlaylistDisplay.apply_changes[%d]" % n_changes] = summarize(apply)
+    return results
+
+def bench_search(app:MpdFrontApp, library:SyntheticLibrary, repeat:int, timeout:float):
+    """
+    :return: dict of operation name -> summary
+    """
+    app.load_search_index()
+    if not wait_for(lambda: app.search_index is not None, timeout):
+        raise TimeoutError("search index was not built within %d seconds" % timeout)
+    rows = [ r for r in app.search_index.rows if r ]
+    results = { "SearchIndex.build[%d]" % len(rows): run_repeated(search.SearchIndex, repeat, rows) }
+    queries = [ library.artist_name(library.n_artists // 2), "%s %s" % (library.album_name(1), "song"),
+                library.genre_name(3) ]
+    keystrokes = []
+    for i in range(repeat):
+        index = search.SearchIndex(rows)     ## nothing cached, as after startup
+        for query in queries:
+            for end in range(1, len(query) + 1):
+                keystrokes.append(timed(index.search, query[:end])[0])
+    results["SearchIndex.search[keystroke]"] = summarize(keystrokes)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mpdfront against a fake MPD server")
+    parser.add_argument("--songs", type=int, default=10000, help="number of songs in the library, eg. 10000, 100000, 500000")
+    parser.add_argument("--playlist", type=int, default=1000, help="number of songs in the playlist, eg. 1000 to 50000")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay of the fake server before every response")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per operation")
+    parser.add_argument("--changes", type=int, default=10, help="songs changed per playlist edit in the idle benchmark")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for loads and events")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    library = SyntheticLibrary(args.songs)
+    server = FakeMpdServer(library, args.playlist, args.latency_ms / 1000).start()
+    results = {
+        "parameters": vars(args),
+        "revision": get_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "operations": {},
+    }
+    try:
+        startup, app = bench_startup(create_config(server.port), args.timeout)
+        results["startup_ms"] = startup * 1000
+        client = mpd.Client("127.0.0.1", server.port)
+        results["operations"].update(bench_loading(app, client, library, args.repeat))
+        results["operations"].update(bench_search(app, library, args.repeat, args.timeout))
+        if create_window(app):
+            results["operations"]["PlaylistDisplay.update[%d]" % args.playlist] = bench_playlist(app, client,
+                                                                                                  args.repeat)
+        else:
+            results["skipped"] = [ "PlaylistDisplay: no display available" ]
+        results["operations"].update(bench_idle(app, server, args.changes, args.repeat, args.timeout))
+    finally:
+        server.stop()
+    results["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    out = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(out + "\n")
+    else:
+        print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import os, re, io
+import hashlib
+import threading
+import collections
+import concurrent.futures
+import logging
+import mutagen
+from mutagen.flac import FLAC
+from mutagen.mp4 import MP4
+from PIL import Image
+import gi
+from .constants import Constants
+
+gi.require_version("Gdk", "4.0")
+from gi.repository import Gdk, GLib
+
+log = logging.getLogger(__name__)
+
+cover_file_re = re.compile(r'.*(cover|albumart|folder).*\.(jpg|png|jpeg)', re.IGNORECASE)
+
+def get_albumart_from_audiofile(audiofile:str):
+    """
+    Extract album art from a file
+    :param audiofile: string, path of the file containing the audio data
+    :return: raw image data
+    """
+    log.debug("audiofile: %s", audiofile)
+    img_data = None
+
+    ## Try to find album art in the media file
+    if not os.path.isfile(audiofile):
+        log.debug("audio file does not exist: %s", audiofile)
+        return None
+    else:
+        try:
+            if re.search(r'\.flac$', audiofile, re.IGNORECASE):
+                log.debug("checking flac file")
+                a = FLAC(audiofile)
+                if len(a.pictures):
+                    img_data = a.pictures[0].data
+            elif re.search(r'\.m4a$', audiofile, re.IGNORECASE):
+                log.debug("checking mp4 file")
+                a = MP4(audiofile)
+                if 'covr' in a.tags:
+                    if len(a.tags['covr']):
+                        img_data = a.tags['covr'][0]
+            else:
+                log.debug("checking generic file")
+                a = mutagen.File(audiofile)
+                for k in a:
+                    if re.match(r'APIC:', k):
+                        img_data = a[k].data
+                        break
+        except Exception as e:
+            log.error("could not open audio file '%s' (%s): %s", audiofile, type(e).__name__, e)
+    return img_data
+
+def get_albumart_filename(audiofile:str):
+    """
+    Look for album art in the directory of the media file
+    :param audiofile: string, path of the file containing the audio data
+    :return: path of the image file, None if there is none
+    """
+    log.debug("audiofile: %s", audiofile)
+    cover_path = ""
+    song_dir = os.path.dirname(audiofile)
+    if os.path.isdir(song_dir):
+        try:
+            log.debug("looking for image files in directory: %s", song_dir)
+            for f in os.listdir(song_dir):
+                if cover_file_re.match(f):
+                    log.debug("found potential cover file: %s", f)
+                    cover_path = song_dir + "/" + f
+                    break
+            log.debug("looking for cover file: %s", cover_path)
+            if os.path.isfile(cover_path):
+                return cover_path
+        except Exception as e:
+            log.error("error finding cover file (%s): %s", type(e).__name__, e)
+    return None
+
+class AlbumArtCache:
+    """
+    Cache of album art, decoded and scaled down to display size, ready to be set on a Gtk.Picture.
+    Entries are keyed by the song's directory, its modification time and the album name, so all songs of an album
+    share one entry. Least recently used entries are evicted when the decoded images exceed the memory budget.
+    Songs without album art are cached too, so they are not looked up again.
+    Optionally keeps the scaled images on disk as thumbnails, so they survive restarts.
+    Lookups, tag parsing and decoding run on a pool of worker threads through load_async().
+    Safe to use from several threads.
+    """
+    log = logging.getLogger(__name__ + ".AlbumArtCache")
+    def __init__(self, max_bytes:int, size:int, thumbnail_dir:str=None, workers:int=Constants.albumart_workers):
+        """
+        :param max_bytes: memory budget for decoded images
+        :param size: maximum width and height of the scaled images
+        :param thumbnail_dir: directory for thumbnails, None to keep no thumbnails
+        :param workers: number of worker threads loading album art
+        """
+        self.max_bytes = max_bytes
+        self.size = size
+        self.thumbnail_dir = thumbnail_dir
+        self.n_bytes = 0
+        self._entries = collections.OrderedDict()   ## key -> (texture or None, size in bytes)
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="albumartThread")
+        ## prefetches get their own thread, so they never delay the album art that is needed now
+        self._prefetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                        thread_name_prefix="albumartPrefetchThread")
+        self._prefetching = set()
+        if thumbnail_dir and not os.path.isdir(thumbnail_dir):
+            try:
+                os.makedirs(thumbnail_dir)
+            except Exception as e:
+                self.log.error("could not create thumbnail directory, not keeping thumbnails (%s): %s", type(e).__name__, e)
+                self.thumbnail_dir = None
+
+    def get_key(self, audiofile:str, album:str=None):
+        """
+        :param audiofile: path of the audio file
+        :param album: album name of the song
+        :return: cache key for the album art of the song
+        """
+        song_dir = os.path.dirname(audiofile)
+        try:
+            mtime = os.stat(song_dir).st_mtime_ns
+        except OSError:
+            mtime = 0
+        return "%s\x1f%d\x1f%s" % (song_dir, mtime, album or "")
+
+    def lookup(self, key:str):
+        """
+        :param key: cache key from get_key()
+        :return: tuple of (True, texture) if cached, the texture is None for songs without album art.
+                 (False, None) if not cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, self._entries[key][0]
+
+    def peek(self, audiofile:str, album:str=None):
+        """
+        Looks up the album art of a song in memory. Uses the same key as load(), so album art replaced on disk is not
+        found. Only the song's directory is looked at, no file is read, so it is meant for the main loop.
+        :param audiofile: path of the audio file
+        :param album: album name of the song
+        :return: same as lookup()
+        """
+        return self.lookup(self.get_key(audiofile, album))
+
+    def store(self, key:str, texture:Gdk.Texture):
+        """
+        Adds an entry and evicts the least recently used entries that no longer fit in the budget.
+        :param key: cache key from get_key()
+        :param texture: scaled album art, None if the song has none
+        """
+        n_bytes = 0
+        if texture:
+            n_bytes = texture.get_width() * texture.get_height() * 3
+        with self._lock:
+            if key in self._entries:
+                self.n_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (texture, n_bytes)
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (evicted, evicted_bytes) = self._entries.popitem(last=False)
+                self.n_bytes -= evicted_bytes
+                self.log.debug("evicted album art: %s", evicted_key)
+
+    def load(self, audiofile:str, album:str=None):
+        """
+        Returns the album art of a song, from memory, from a thumbnail or from the audio file or its directory.
+        :param audiofile: path of the audio file
+        :param album: album name of the song
+        :return: Gdk.Texture, None if the song has no album art
+        """
+        key = self.get_key(audiofile, album)
+        found, texture = self.lookup(key)
+        if found:
+            self.log.debug("album art from memory: %s", audiofile)
+            return texture
+        image = self.load_thumbnail(key)
+        if not image:
+            image = self.load_image(audiofile)
+            if image:
+                self.save_thumbnail(key, image)
+        texture = None
+        if image:
+            texture = image_to_texture(image)
+        self.store(key, texture)
+        return texture
+
+    def load_async(self, audiofile:str, album:str=None):
+        """
+        Runs load() on a worker thread.
+        :return: concurrent.futures.Future with the texture, can be cancelled while it waits for a worker
+        """
+        return self._executor.submit(self.load, audiofile, album)
+
+    def prefetch(self, audiofile:str, album:str=None):
+        """
+        Loads album art into the cache in the background, ahead of the song being played.
+        Does nothing if the art is already cached or being prefetched.
+        :param audiofile: path of the audio file
+        :param album: album name of the song
+        """
+        if self.peek(audiofile, album)[0]:
+            return
+        with self._lock:
+            if audiofile in self._prefetching:
+                return
+            self._prefetching.add(audiofile)
+        self.log.debug("prefetching album art: %s", audiofile)
+        self._prefetch_executor.submit(self._prefetch, audiofile, album)
+
+    def _prefetch(self, audiofile:str, album:str):
+        try:
+            self.load(audiofile, album)
+        finally:
+            with self._lock:
+                self._prefetching.discard(audiofile)
+
+    def load_image(self, audiofile:str):
+        """
+        Finds and decodes the album art of an audio file and scales it to display size.
+        :param audiofile: path of the audio file
+        :return: PIL.Image in RGB mode, None if there is no album art
+        """
+        try:
+            img_data = get_albumart_from_audiofile(audiofile)
+            if img_data:
+                self.log.debug("image data found in audiofile")
+                image = Image.open(io.BytesIO(img_data))
+            else:
+                self.log.debug("no image data found in audiofile")
+                coverfile = get_albumart_filename(audiofile)
+                if not coverfile:
+                    self.log.debug("no albumart found for: %s", audiofile)
+                    return None
+                image = Image.open(coverfile)
+            image.draft("RGB", (self.size, self.size))     ## lets JPEG decode at a reduced scale
+            image = image.convert("RGB")
+            image.thumbnail((self.size, self.size), Image.LANCZOS)
+            return image
+        except Exception as e:
+            self.log.error("could not decode album art for '%s' (%s): %s", audiofile, type(e).__name__, e)
+            return None
+
+    def get_thumbnail_path(self, key:str):
+        return os.path.join(self.thumbnail_dir, hashlib.sha1(key.encode()).hexdigest() + ".jpg")
+
+    def load_thumbnail(self, key:str):
+        if not self.thumbnail_dir:
+            return None
+        path = self.get_thumbnail_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            image = Image.open(path)
+            image = image.convert("RGB")
+            self.log.debug("album art from thumbnail: %s", path)
+            return image
+        except Exception as e:
+            self.log.error("could not load thumbnail '%s' (%s): %s", path, type(e).__name__, e)
+            return None
+
+    def save_thumbnail(self, key:str, image:Image.Image):
+        if not self.thumbnail_dir:
+            return
+        path = self.get_thumbnail_path(key)
+        try:
+            image.save(path, "JPEG", quality=Constants.albumart_thumbnail_quality)
+        except Exception as e:
+            self.log.error("could not save thumbnail '%s' (%s): %s", path, type(e).__name__, e)
+
+def image_to_texture(image:Image.Image):
+    """
+    :param image: PIL.Image in RGB mode
+    :return: Gdk.Texture with the pixels of the image
+    """
+    width, height = image.size
+    return Gdk.MemoryTexture.new(width, height, Gdk.MemoryFormat.R8G8B8, GLib.Bytes.new(image.tobytes()), width * 3)
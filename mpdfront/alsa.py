@@ -0,0 +1,117 @@
+import re
+import collections
+import logging
+from .constants import Constants
+
+log = logging.getLogger(__name__)
+
+hw_params_rate_re = re.compile(r'^rate:\s*(\d+)', re.MULTILINE)
+hw_params_format_re = re.compile(r'^format:\s*(\S+)', re.MULTILINE)
+hw_params_channels_re = re.compile(r'^channels:\s*(\d+)', re.MULTILINE)
+
+## bits per sample of the ALSA sample formats
+format_bits = {
+    "S16_LE": 16, "S16_BE": 16, "U16_LE": 16, "U16_BE": 16,
+    "S24_LE": 24, "S24_BE": 24, "S24_3LE": 24, "S24_3BE": 24, "U24_LE": 24, "U24_BE": 24,
+    "S32_LE": 32, "S32_BE": 32, "U32_LE": 32, "U32_BE": 32,
+    "FLOAT_LE": 32, "FLOAT_BE": 32, "FLOAT64_LE": 64, "FLOAT64_BE": 64,
+}
+## bits of DSD stream packed in one sample of the native DSD formats
+dsd_format_bits = {
+    "DSD_U8": 8, "DSD_U16_LE": 16, "DSD_U16_BE": 16, "DSD_U32_LE": 32, "DSD_U32_BE": 32,
+}
+
+HwParams = collections.namedtuple("HwParams", ("rate", "format", "channels"))
+HwParams.__doc__ = "Parameters of an open ALSA PCM device, as shown in its hw_params file"
+
+def parse_hw_params(text:str):
+    """
+    :param text: contents of a hw_params file
+    :return: HwParams, None if the device is closed or the text can not be parsed
+    """
+    if text.startswith("closed"):
+        return None
+    rate = hw_params_rate_re.search(text)
+    sample_format = hw_params_format_re.search(text)
+    if not rate or not sample_format:
+        return None
+    channels = hw_params_channels_re.search(text)
+    return HwParams(int(rate.group(1)), sample_format.group(1), int(channels.group(1)) if channels else 0)
+
+def format_hw_params(params:HwParams):
+    """
+    :return: text for the DAC status, like "44.1 kHz 24 bit"
+    """
+    if params.format in dsd_format_bits:
+        return "%2.1f MHz DSD" % (params.rate * dsd_format_bits[params.format] / 1000000)
+    bits = format_bits.get(params.format)
+    if bits is None:
+        return "%3.1f kHz %s" % (params.rate / 1000, params.format)
+    return "%3.1f kHz %d bit" % (params.rate / 1000, bits)
+
+class AlsaMonitor:
+    """
+    Watches the hw_params files of one or more ALSA playback devices, to show what the DAC is actually fed.
+    The files are only read by poll(), which runs on player changes and at a configurable rate. The parsed
+    parameters are cached per device, and the callback only runs when they changed.
+    """
+    log = logging.getLogger(__name__ + ".AlsaMonitor")
+    def __init__(self, devices:list=None, callback=None):
+        """
+        :param devices: list of (card, device) tuples
+        :param callback: callable taking a dict of (card, device) -> HwParams or None, run when the parameters of
+                         any device change. None for devices that are closed, devices without a hw_params file are
+                         left out.
+        """
+        self.devices = list(devices or [])
+        self.callback = callback
+        self.params = {}
+
+    def get_path(self, device:tuple):
+        card, pcm = device
+        return Constants.proc_file_fmt % (card, pcm, "0")
+
+    def set_device(self, index:int, card:int, pcm:int):
+        """
+        Replaces one of the watched devices and reads its parameters.
+        :param index: index in devices, a device is added if index is past the end
+        """
+        if index < len(self.devices):
+            self.params.pop(self.devices[index], None)
+            self.devices[index] = (card, pcm)
+        else:
+            self.devices.append((card, pcm))
+        self.poll(force=True)
+
+    def read(self, device:tuple):
+        """
+        :return: tuple of (True if the hw_params file exists, HwParams or None)
+        """
+        path = self.get_path(device)
+        try:
+            with open(path) as fh:
+                text = fh.read()
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            self.log.error("could not read '%s' (%s): %s", path, type(e).__name__, e)
+            return False, None
+        return True, parse_hw_params(text)
+
+    def poll(self, force:bool=False):
+        """
+        Reads the hw_params of every device and runs the callback if anything changed.
+        :param force: run the callback even if nothing changed
+        :return: True, to be usable as a GLib timeout callback
+        """
+        params = {}
+        for device in self.devices:
+            exists, device_params = self.read(device)
+            if exists:
+                params[device] = device_params
+        if params != self.params or force:
+            self.log.debug("hw params changed: %s", params)
+            self.params = params
+            if self.callback:
+                self.callback(params)
+        return True
@@ -1,9 +1,12 @@
-import os, re, inspect
+import os, re
+import collections
+import difflib
 import logging
 import queue
+import threading
 import configparser
 import gi
-from . import mpd, data
+from . import mpd, data, cache, albumart, alsa, search
 from .message import QueueMessage
 from .ui import MpdFrontWindow
 from .constants import Constants
@@ -13,65 +16,88 @@ from gi.repository import Gtk, Gdk, GdkPixbuf, GObject, Pango, GLib, Gio
 
 log = logging.getLogger(__name__)
 
-def node_sort_normal(row1:data.ContentTreeNode, row2:data.ContentTreeNode):
+article_re = re.compile(r'^The ', re.IGNORECASE)
+
+def sort_key_filtered(node:data.ContentTreeNode):
     """
-    Alphanumeric compare function for Gio.ListStore sorting.
-    :param row1: left row
-    :param row2: right now
-    :return: value of comparison expression
+    Sort key for names. Removes from text: /^The /, ignores case.
+    :param node: node to compute the key for
+    :return: string key
     """
-    return row1.metaname > row2.metaname
+    return article_re.sub('', node.metaname).casefold()
 
-def node_sort_filtered(row1:data.ContentTreeNode, row2:data.ContentTreeNode):
+def sort_key_by_track(node:data.ContentTreeNode):
     """
-    Compare function for Gio.ListStore sorting. Modifies the text before comparison.
-    Removes from text: /^The /
-    :param row1: left row
-    :param row2: right now
-    :return: value of comparison expression
+    Sort key for songs, according to disc and track numbers. Songs without numbers sort first.
+    :param node: node to compute the key for
+    :return: tuple of (disc, track)
     """
-    row1_value = re.sub(r'^The ', '', row1.metaname, flags=re.IGNORECASE)
-    row2_value = re.sub(r'^The ', '', row2.metaname, flags=re.IGNORECASE)
-    return row1_value > row2_value
+    return (data.parse_number(node.get_metadata('disc')), data.parse_number(node.get_metadata('track')))
 
-def node_sort_by_track(row1:data.ContentTreeNode, row2:data.ContentTreeNode):
+def get_sort_key_func(node:data.ContentTreeNode):
     """
-    Compare function for Gio.ListStore sorting. Sort according to disc and track numbers
-    :param row1: left row
-    :param row2: right now
-    :return: value of comparison expression
+    :param node: parent node
+    :return: function computing the sort keys of the children of node, None if the children keep the order from MPD
     """
-    log = logging.getLogger(__name__ + "." + inspect.stack()[0].function)
-    try:
-        log.debug("comparing input: %s,%s > %s,%s" % (row1.get_metadata('disc'), row1.get_metadata('track'), row2.get_metadata('disc'), row2.get_metadata('track')))
-        if row1.get_metadata('disc') and row2.get_metadata('disc'):
-            row1_disc = int(row1.get_metadata('disc'))
-            row2_disc = int(row2.get_metadata('disc'))
-            if row1_disc != row2_disc:
-                return row1_disc > row2_disc
-        if not row1.get_metadata('track') or not row2.get_metadata('track'):
-            #log.debug("skipping comparison")
-            return 0
-        row1_value = int(row1.get_metadata('track'))
-        row2_value = int(row2.get_metadata('track'))
-        #log.debug("comparing values: %d > %d" % (row1_value, row2_value))
-        return row1_value > row2_value
-    except Exception as e:
-        log.debug("sort compare failed: %s" % e)
-        return 0
+    if node.metatype == Constants.node_t_category and node.next_type in (Constants.node_t_albumartist,
+                                                                         Constants.node_t_artist):
+        return sort_key_filtered
+    if node.metatype == Constants.node_t_album:
+        return sort_key_by_track
+    return None
+
+def fetch_status_and_current(client:mpd.Client):
+    """
+    Command for the command thread, fetches player status and current song in one request.
+    """
+    return client.status(), client.currentsong()
+
+def fetch_search_rows(client:mpd.Client):
+    """
+    Lists every song of the library for the search index, a window at a time, so no response outgrows the output
+    buffer of MPD.
+    :return: list of rows, see search.get_search_row(), None on failure
+    """
+    rows = []
+    offset = 0
+    while True:
+        songs = client.find("(file != '')", "window", "%d:%d" % (offset, offset + Constants.search_fetch_window))
+        if songs is None:
+            return None
+        rows.extend([ search.get_search_row(s) for s in songs if 'file' in s ])
+        offset += len(songs)
+        if len(songs) < Constants.search_fetch_window:
+            return rows
 
 class MpdFrontApp(Gtk.Application):
     """
     Main application class for mpdfront.
     """
+    log = logging.getLogger(__name__ + ".MpdFrontApp")
     def __init__(self, config:configparser, css_file:str=None, host:str=None, port:int=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.config = config
         self.idle_queue = queue.Queue()
+        self.idle_wakeup_lock = threading.Lock()
+        self.idle_wakeup_pending = False
+        self.command_queue = queue.Queue()
+        self.status_queue = queue.Queue()
+        self.loader_queue = queue.PriorityQueue()     ## foreground loads before prefetches
+        self._playback_refresh_future = None
+        ## sound cards to show the DAC status of, several cards can be given as comma separated lists
+        cards = []
+        pcms = []
         if config.has_option(Constants.config_section_main, "sound_card"):
-            self.card_id = int(config.get(Constants.config_section_main, "sound_card"))
+            cards = [ int(c) for c in config.get(Constants.config_section_main, "sound_card").split(",") if c.strip() ]
         if config.has_option(Constants.config_section_main, "sound_device"):
-            self.device_id = int(config.get(Constants.config_section_main, "sound_device"))
+            pcms = [ int(d) for d in config.get(Constants.config_section_main, "sound_device").split(",") if d.strip() ]
+        devices = [ (c, pcms[i] if i < len(pcms) else 0) for i, c in enumerate(cards) ]
+        self.card_id, self.device_id = devices[0] if devices else (0, 0)
+        self.alsa_monitor = alsa.AlsaMonitor(devices)
+        if config.has_option(Constants.config_section_main, "dac_poll_interval"):
+            self.dac_poll_interval = int(config.get(Constants.config_section_main, "dac_poll_interval"))
+        else:
+            self.dac_poll_interval = Constants.default_dac_poll_interval
         if css_file:
             self.css_file = css_file
         elif config.has_option(Constants.config_section_main, "style"):
@@ -92,342 +118,952 @@ class MpdFrontApp(Gtk.Application):
             self.port = Constants.default_port
         if config.has_option(Constants.config_section_main, "music_dir"):
             self.music_dir = config.get(Constants.config_section_main, "music_dir")
+        if config.has_option(Constants.config_section_main, "cache_dir"):
+            self.cache_dir = os.path.expanduser(config.get(Constants.config_section_main, "cache_dir"))
+        else:
+            self.cache_dir = Constants.default_cache_dir
+        albumart_cache_mb = Constants.default_albumart_cache_mb
+        if config.has_option(Constants.config_section_main, "albumart_cache_mb"):
+            albumart_cache_mb = int(config.get(Constants.config_section_main, "albumart_cache_mb"))
+        albumart_size = Constants.default_albumart_size
+        if config.has_option(Constants.config_section_main, "albumart_size"):
+            albumart_size = int(config.get(Constants.config_section_main, "albumart_size"))
+        thumbnail_dir = None
+        if (self.cache_dir and config.has_option(Constants.config_section_main, "albumart_thumbnails") and
+                re.match(r'yes$', config.get(Constants.config_section_main, "albumart_thumbnails"), re.IGNORECASE)):
+            thumbnail_dir = os.path.join(self.cache_dir, Constants.albumart_thumbnail_dir)
+        self.albumart_cache = albumart.AlbumArtCache(albumart_cache_mb * 1024 * 1024, albumart_size, thumbnail_dir)
+        if config.has_option(Constants.config_section_main, "loader_threads"):
+            self.num_loader_threads = max(1, int(config.get(Constants.config_section_main, "loader_threads")))
+        else:
+            self.num_loader_threads = Constants.default_loader_threads
+        if config.has_option(Constants.config_section_main, "prefetch_neighbours"):
+            self.prefetch_neighbours = max(0, int(config.get(Constants.config_section_main, "prefetch_neighbours")))
+        else:
+            self.prefetch_neighbours = Constants.default_prefetch_neighbours
+        ## leave a loader thread free for foreground loads
+        self.prefetch_budget = min(Constants.prefetch_budget, self.num_loader_threads - 1)
+        self._prefetches = {}       ## node -> future of its prefetch
+        self._prefetch_wanted = []  ## nodes to prefetch when the budget allows, nearest to the selection first
+        if config.has_option(Constants.config_section_main, "content_node_budget"):
+            self.content_node_budget = max(0, int(config.get(Constants.config_section_main, "content_node_budget")))
+        else:
+            self.content_node_budget = Constants.default_content_node_budget
+        self._loaded_layers = collections.OrderedDict()    ## loaded node -> number of children, least recently used first
+        self._loaded_nodes = 0      ## children in the loaded layers
+        if config.has_option(Constants.config_section_main, "connection_pool_size"):
+            self.connection_pool_size = max(1, int(config.get(Constants.config_section_main, "connection_pool_size")))
+        else:
+            self.connection_pool_size = max(Constants.default_connection_pool_size, self.num_loader_threads + 2)
+        if self.connection_pool_size < self.num_loader_threads + 2:
+            self.log.warning("connection_pool_size %d is less than loader_threads + 2, commands may wait for loads",
+                             self.connection_pool_size)
 
-        ## Connect to MPD
+        ## Connect to MPD. The idle thread keeps its own connection, the command, status and loader threads borrow
+        ## connections from the pool, so user commands, status polls and loads do not wait for each other
         try:
-            self.mpd_client = mpd.Client(self.host, self.port)
-            self.mpd_idle_thread = mpd.IdleClientThread(host=self.host, port=self.port, queue=self.idle_queue, name="idleThread")
+            self.mpd_pool = mpd.ClientPool(self.host, self.port, self.connection_pool_size)
+            self.mpd_idle_thread = mpd.IdleClientThread(host=self.host, port=self.port, queue=self.idle_queue,
+                                                        name="idleThread", notify=self.wake_idle_handler)
+            self.mpd_command_thread = mpd.CommandClientThread(self.mpd_pool, queue=self.command_queue,
+                                                              name="commandThread")
+            self.mpd_status_thread = mpd.CommandClientThread(self.mpd_pool, queue=self.status_queue,
+                                                             name="statusThread")
+            ## loader threads share one queue, so several loads run in parallel
+            self.mpd_loader_threads = [ mpd.CommandClientThread(self.mpd_pool, queue=self.loader_queue,
+                                                                name="loaderThread%d" % i)
+                                        for i in range(self.num_loader_threads) ]
         except Exception as e:
-            log.error("could not connect to mpd (%s): %s" % (type(e).__name__, e))
+            self.log.error("could not connect to mpd (%s): %s", type(e).__name__, e)
             raise e
 
-        ## Define callbacks to handle mpd commands
-        self._mpd_callbacks = {
-            'add': self.mpd_client.add,
-            'clear': self.mpd_client.clear,
-            'consume': self.mpd_client.consume,
-            'currentsong': self.mpd_client.currentsong,
-            'deleteid': self.mpd_client.deleteid,
-            'disableoutput': self.mpd_client.disableoutput,
-            'enableoutput': self.mpd_client.enableoutput,
-            'fetch_idle': self.mpd_client.fetch_idle,
-            'find': self.mpd_client.find,
-            'findadd': self.mpd_client.findadd,
-            'list': self.mpd_client.list,
-            'lsinfo': self.mpd_client.lsinfo,
-            'moveid': self.mpd_client.moveid,
-            'next': self.mpd_client.next,
-            'outputs': self.mpd_client.outputs,
-            'pause': self.mpd_client.pause,
-            'play': self.mpd_client.play,
-            'play_or_pause': self.mpd_client.play_or_pause,
-            'playid': self.mpd_client.playid,
-            'playlistinfo': self.mpd_client.playlistinfo,
-            'previous': self.mpd_client.previous,
-            'random': self.mpd_client.random,
-            'repeat': self.mpd_client.repeat,
-            'seekcur': self.mpd_client.seekcur,
-            'send_idle': self.mpd_client.send_idle,
-            'single': self.mpd_client.single,
-            'stats': self.mpd_client.stats,
-            'status': self.mpd_client.status,
-            'stop': self.mpd_client.stop,
-            'toggle': self.mpd_client.play_or_pause,
-        }
+        ## MPD commands that can be called as self.mpd_<command>(), idle is left to the idle thread since a pooled
+        ## connection must be ready for the next command
+        self._mpd_commands = (
+            'add', 'clear', 'command_list', 'consume', 'currentsong', 'deleteid', 'disableoutput', 'enableoutput',
+            'find', 'findadd', 'list', 'lsinfo', 'moveid', 'next', 'outputs', 'pause', 'play', 'play_or_pause',
+            'playid', 'playlistinfo', 'plchanges', 'plchangesposid', 'previous', 'random', 'repeat', 'seekcur',
+            'single', 'stats', 'status', 'stop', 'toggle',
+        )
 
         self.mpd_stats = self.mpd_stats()
-        log.debug("mpd stats: %s" % self.mpd_stats)
+        self.log.debug("mpd stats: %s", self.mpd_stats)
         self.mpd_outputs = self.mpd_outputs()
-        log.debug("mpd outputs: %s" % self.mpd_outputs)
+        self.log.debug("mpd outputs: %s", self.mpd_outputs)
 
-        ## create and initialize content tree
+        ## open the library cache, it is only used if it was filled from the same MPD database
+        self.library_cache = None
+        if self.cache_dir and self.mpd_stats:
+            try:
+                self.library_cache = cache.LibraryCache(os.path.join(self.cache_dir, Constants.library_cache_file_fmt %
+                                                                     (self.host, self.port)),
+                                                        self.mpd_stats.get('db_update'))
+            except Exception as e:
+                self.log.error("could not open library cache (%s): %s", type(e).__name__, e)
+
+        ## the search index is built in the background the first time search is opened, search is unavailable
+        ## until it is ready
+        self.search_index = None
+        self._search_index_loading = False
+        self._search_index_stale = False    ## the database changed while the index was being built
+
+        ## create the content tree, category lists start loading in the background, the file tree waits until
+        ## it is first selected
         self.content_tree = Gio.ListStore()
         for r in Constants.browser_1st_column_rows:
             new_node = data.ContentTreeNode(metadata=r)
             self.content_tree.append(new_node)
-            self.load_content_data(new_node)
+            if new_node.next_type not in (Constants.node_t_file, Constants.node_t_directory):
+                self.load_content_data(new_node)
 
         ## Set timers
-        self.idle_thread_timeout_id = GLib.timeout_add(Constants.idle_thread_interval, self.idle_thread_comms_handler)
-        self.refresh_thread_timeout_id = GLib.timeout_add(Constants.playback_refresh_interval, self.refresh_playback)
+        self.playback_tick_timeout_id = GLib.timeout_add(Constants.playback_tick_interval, self.tick_playback)
+        self.refresh_thread_timeout_id = GLib.timeout_add(Constants.playback_resync_interval, self.refresh_playback)
         self.alive_thread_timeout_id = GLib.timeout_add(Constants.alive_check_interval, self.check_threads)
+        if self.dac_poll_interval > 0:
+            self.dac_poll_timeout_id = GLib.timeout_add(self.dac_poll_interval, self.alsa_monitor.poll)
 
         self.connect('activate', self.on_activate)
         self.connect('shutdown', self.on_quit)
 
     def __getattr__(self, attr):
-        #log.debug("called __getattr__: %s" % attr)
+        #self.log.debug("called __getattr__: %s", attr)
         if attr.startswith("mpd_"):
             command = attr.replace("mpd_", "")
-            if command not in self._mpd_callbacks:
+            if command not in self._mpd_commands:
                 raise AttributeError("object has no attribute %s" % attr)
         else:
             raise AttributeError("object has no attribute %s" % attr)
-        return lambda *args, **kwargs: self._mpd_callbacks[command](*args, **kwargs)
+        if command in Constants.mpd_async_commands:
+            return lambda *args: self.mpd_command(command, *args)
+        return lambda *args: self.mpd_pool.run(command, *args)
+
+    def mpd_command(self, command, *args, callback=None, errback=None, timeout:float=Constants.command_timeout_secs,
+                    **kwargs):
+        """
+        Runs an MPD command on the command thread, so the main loop never waits on the socket.
+        :param command: name of the MPD command, or a callable accepting an mpd.Client and args
+        :param args: args for the command
+        :param callback: function called on the main loop with the command's result
+        :param errback: function called on the main loop with the exception if the command failed or timed out
+        :param timeout: seconds before the command is abandoned
+        :param kwargs: args for a callable command
+        :return: concurrent.futures.Future for the command, can be used to cancel it
+        """
+        future = self.mpd_command_thread.submit(command, *args, timeout=timeout, **kwargs)
+        future.add_done_callback(lambda f: self._command_done(f, callback, errback))
+        return future
+
+    def mpd_poll(self, command, *args, callback=None, errback=None, timeout:float=Constants.command_timeout_secs,
+                 **kwargs):
+        """
+        Same as mpd_command(), but runs on the status thread, so periodic status queries never queue up behind user
+        commands and the other way round.
+        """
+        future = self.mpd_status_thread.submit(command, *args, timeout=timeout, **kwargs)
+        future.add_done_callback(lambda f: self._command_done(f, callback, errback))
+        return future
+
+    def mpd_load(self, command, *args, callback=None, errback=None, timeout:float=Constants.load_timeout_secs,
+                 priority:int=Constants.load_priority_foreground, **kwargs):
+        """
+        Same as mpd_command(), but runs on the loader threads so content loads never hold up user commands.
+        Loads are picked up by whichever loader thread is free, so several of them run in parallel.
+        :param priority: queued loads with a lower priority are picked up first
+        """
+        future = self.mpd_loader_threads[0].submit(command, *args, timeout=timeout, priority=priority, **kwargs)
+        future.add_done_callback(lambda f: self._command_done(f, callback, errback))
+        return future
+
+    def _command_done(self, future, callback, errback):
+        """
+        Runs in the command thread when a command finishes. Hands the result to callback, or the exception to errback,
+        on the main loop. Cancelled commands call neither.
+        """
+        if future.cancelled():
+            return
+        if future.exception():
+            if errback:
+                GLib.idle_add(self._run_command_callback, errback, future.exception())
+            return
+        if callback:
+            GLib.idle_add(self._run_command_callback, callback, future.result())
+
+    def _run_command_callback(self, callback, result):
+        try:
+            callback(result)
+        except Exception as e:
+            self.log.error("command callback failed (%s): %s", type(e).__name__, e)
+        return False
 
     def on_activate(self, app):
         try:
             self.window = MpdFrontWindow(application=self, config=self.config, content_tree=self.content_tree)
         except Exception as e:
-            log.critical("could not create main window (%s): %s" % (type(e).__name__, e))
+            self.log.critical("could not create main window (%s): %s", type(e).__name__, e)
             self.quit()
         else:
+            ## apply the messages the idle thread queued before the window existed
+            self.wake_idle_handler()
             if self.css_file and os.path.isfile(self.css_file):
-                log.debug("reading css file: %s" % self.css_file)
+                self.log.debug("reading css file: %s", self.css_file)
                 self.css_provider = Gtk.CssProvider.new()
                 try:
                     self.css_provider.load_from_path(self.css_file)
                     display = Gtk.Widget.get_display(self.window)
                     Gtk.StyleContext.add_provider_for_display(display, self.css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
                 except Exception as e:
-                    log.error("could not load CSS (%s): %s" % (type(e).__name__, e))
+                    self.log.error("could not load CSS (%s): %s", type(e).__name__, e)
                     #raise e
             self.add_window(self.window)
             self.window.present()
             self.window.set_layout1()
-            self.refresh_playlist()
             self.refresh_playback()
 
     def on_quit(self, app):
+        if self.library_cache:
+            self.library_cache.close()
+        self.mpd_pool.close()
         self.quit()
 
-    def refresh_playback(self):
+    def tick_playback(self):
         """
-        Updates playback, time, info and progress bar.
+        Moves the time and progress bar along, from the last status. Does not talk to MPD.
         """
-        mpd_status = self.mpd_client.status()
-        currentsong = self.mpd_client.currentsong()
-        self.window.playback_display.update(mpd_status, currentsong, self.music_dir)
+        if hasattr(self, 'window'):
+            self.window.playback_display.update_time()
         return True
 
-    def refresh_playlist(self):
+    def refresh_playback(self):
         """
-        Updates playback, time, info and progress bar.
+        Updates playback, time, info and progress bar from MPD.
+        Player changes arrive from the idle thread, this only resyncs the interpolated time once in a while.
+        Skips the refresh while the previous one is still waiting on MPD.
         """
-        playlistinfo = self.mpd_client.playlistinfo()
-        currentsong = self.mpd_client.currentsong()
-        self.window.playlist_list.update(playlistinfo, currentsong)
+        if self._playback_refresh_future and not self._playback_refresh_future.done():
+            return True
+        self._playback_refresh_future = self.mpd_poll(fetch_status_and_current, callback=self.on_playback_refreshed)
         return True
 
-    def get_files_list(self, path=""):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        files = self.mpd_client.lsinfo(path)
-        log.debug("received files: %s" % files)
+    def on_playback_refreshed(self, result):
+        mpd_status, currentsong = result
+        self.window.playback_display.update(mpd_status, currentsong, self.music_dir)
+
+    def get_files_list(self, client:mpd.Client, path=""):
+        files = client.lsinfo(path)
+        self.log.debug("received files: %s", files)
+        return self.files_to_rows(files)
+
+    def files_to_rows(self, files:list):
+        """
+        Builds rows for the file browser from an lsinfo response. The response already carries the tags of each file,
+        no further queries are needed.
+        :param files: list of dicts returned by lsinfo
+        :return: list of metadata dicts for directory and file nodes
+        """
         rows = []
+        if not files:
+            return rows
         for f in files:
             if 'directory' in f:
                 dirname = os.path.basename(f['directory'])
                 rows.append({'type': Constants.node_t_directory, 'name': dirname, 'path': f['directory']})
             elif 'file' in f:
-                filename = os.path.basename(f['file'])
-                finfo = self.mpd_client.lsinfo(f['file'])[0]
-                if not finfo:
-                    finfo = {'file': f['file']}
-                finfo.update({'type': Constants.node_t_file, 'name': filename})
+                finfo = dict(f)
+                finfo.update({'type': Constants.node_t_file, 'name': os.path.basename(f['file'])})
                 rows.append(finfo)
             else:
-                log.error("unhandled type: %s" % f)
+                self.log.error("unhandled type: %s", f)
         return rows
 
+    def wake_idle_handler(self):
+        """
+        Called by the idle thread after it queued a message. Schedules one run of idle_thread_comms_handler() on the
+        main loop, however many messages arrive before it runs.
+        """
+        with self.idle_wakeup_lock:
+            if self.idle_wakeup_pending:
+                return
+            self.idle_wakeup_pending = True
+        GLib.idle_add(self.idle_thread_comms_handler)
+
     def idle_thread_comms_handler(self):
-        msg = None
+        """
+        Runs on the main loop when the idle thread queued messages. Drains the queue and applies the messages
+        coalesced, see coalesce_idle_messages().
+        :return: False, to be usable as a GLib idle callback
+        """
+        with self.idle_wakeup_lock:
+            self.idle_wakeup_pending = False
+        if not hasattr(self, 'window'):     ## leave messages queued until the window exists, on_activate() wakes us
+            return False
+        messages = []
+        while True:
+            try:
+                messages.append(self.idle_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not messages:
+            return False
+        self.log.debug("processing %d queued messages", len(messages))
+        playlist, player, database = self.coalesce_idle_messages(messages)
+        if playlist:
+            if playlist['full']:
+                self.window.playlist_list.update(playlist['playlist'], playlist['current'])
+            else:
+                self.window.playlist_list.apply_changes(playlist['playlist'], playlist['length'], playlist['current'])
+        if database:
+            self.mpd_poll("stats", callback=self.on_database_changed)
+        if player:
+            self.window.playback_display.update(player['status'], player['current'], self.music_dir)
+            self.window.playlist_list.set_current(player['current'])
+            self.window.playlist_list.prefetch_albumart(player['status'])
+        return False
+
+    def coalesce_idle_messages(self, messages:list):
+        """
+        Reduces a burst of messages from the idle thread to the state that has to be applied.
+        Only the latest player state is kept. Playlist messages before the last full playlist are dropped, the deltas
+        after it are merged into one, later changes to a position replacing earlier ones.
+        :param messages: list of QueueMessage in the order they were queued
+        :return: tuple of (playlist message data or None, player message data or None, bool database changed)
+        """
+        playlist = player = None
+        database = False
+        for msg in messages:
+            if not isinstance(msg, QueueMessage) or msg.get_type() != Constants.message_type_change:
+                continue
+            self.log.debug("queued message item: %s", msg.get_item())
+            if msg.get_item() == Constants.message_item_playlist:
+                msg_data = msg.get_data()
+                if msg_data['full'] or not playlist:
+                    playlist = dict(msg_data)
+                    if not playlist['full']:
+                        playlist['playlist'] = { int(song['pos']): song for song in msg_data['playlist'] }
+                elif playlist['full']:
+                    ## a delta on top of a full playlist, apply it to the song list
+                    songs = list(playlist['playlist'] or [])[:msg_data['length']]
+                    for song in msg_data['playlist']:
+                        pos = int(song['pos'])
+                        if pos < len(songs):
+                            songs[pos] = song
+                        else:
+                            songs.append(song)
+                    playlist.update(msg_data, playlist=songs, full=True)
+                else:
+                    playlist['playlist'].update({ int(song['pos']): song for song in msg_data['playlist'] })
+                    playlist['length'] = msg_data['length']
+                    playlist['current'] = msg_data['current']
+            elif msg.get_item() == Constants.message_item_player:
+                player = msg.get_data()
+            elif msg.get_item() == Constants.message_item_database:
+                database = True
+        if playlist and not playlist['full']:
+            playlist['playlist'] = list(playlist['playlist'].values())
+        return playlist, player, database
+
+    def on_database_changed(self, stats:dict):
+        """
+        Called with fresh stats after MPD reported a database change. Drops the library cache.
+        """
+        if not stats:
+            return
+        self.log.info("database updated: %s", stats.get('db_update'))
+        self.mpd_stats = stats
+        if self.library_cache:
+            self.library_cache.invalidate(stats.get('db_update'))
+        self.refresh_content_tree()
+        self.update_search_index()
+
+    def load_search_index(self):
+        """
+        Starts building the search index, unless it is built or being built already. Listing the library and
+        indexing it takes seconds and tens of MB on large libraries, so it waits until search is first opened.
+        """
+        if self.search_index or self._search_index_loading:
+            return
+        self._search_index_loading = True
+        self._search_index_stale = False
+        self.mpd_load(self.fetch_search_index, callback=self.on_search_index_loaded,
+                      errback=lambda e: self.on_search_index_loaded(None))
+
+    def fetch_search_index(self, client:mpd.Client):
+        """
+        Runs on a loader thread. Builds the search index from the library cache, or from MPD if it is not cached.
+        :return: search.SearchIndex, None on failure
+        """
+        library_cache = self.library_cache
+        rows = None
+        if library_cache:
+            generation = library_cache.generation
+            rows = library_cache.get(Constants.search_cache_key)
+        if rows is None:
+            rows = fetch_search_rows(client)
+            if rows is None:
+                return None
+            if library_cache:
+                library_cache.put(Constants.search_cache_key, rows, generation)
+        return search.SearchIndex(rows)
+
+    def on_search_index_loaded(self, index:search.SearchIndex):
+        self._search_index_loading = False
+        if index is None:
+            self.log.error("could not build the search index, will retry when search is opened")
+            return
+        self.search_index = index
+        if self._search_index_stale:
+            self.update_search_index()
+        if hasattr(self, 'window'):
+            self.window.search_panel.refresh()
+
+    def update_search_index(self):
+        """
+        Brings the search index up to date after a database change. The library is listed again and compared with
+        the index in the background. Only the songs that changed are reindexed, unless so many changed that a new
+        index is built instead.
+        """
+        index = self.search_index
+        if not index:
+            ## not built yet, or being built from a listing that may predate the change
+            self._search_index_stale = self._search_index_loading
+            return
+        self.mpd_load(self.fetch_search_index_changes, index,
+                      callback=lambda result: self.on_search_index_changes(index, result))
+
+    def fetch_search_index_changes(self, client:mpd.Client, index:search.SearchIndex):
+        """
+        Runs on a loader thread.
+        :return: tuple of (new search.SearchIndex or None, return value of index.diff() or None), None on failure
+        """
+        library_cache = self.library_cache
+        if library_cache:
+            generation = library_cache.generation
+        rows = fetch_search_rows(client)
+        if rows is None:
+            return None
+        if library_cache:
+            library_cache.put(Constants.search_cache_key, rows, generation)
+        changes = index.diff(rows)
+        if index.needs_rebuild(*changes):
+            self.log.info("rebuilding the search index: %d songs changed, %d removed", len(changes[0]),
+                          len(changes[1]))
+            return search.SearchIndex(rows), None
+        return None, changes
+
+    def on_search_index_changes(self, index:search.SearchIndex, result:tuple):
+        if result is None:
+            self.log.error("could not update the search index")
+            return
+        if index is not self.search_index:
+            return
+        new_index, changes = result
+        if new_index:
+            self.search_index = new_index
+        else:
+            index.apply(*changes)
+        if hasattr(self, 'window'):
+            self.window.search_panel.refresh()
+
+    def refresh_content_tree(self):
+        """
+        Brings the loaded layers up to date after a database change. The layers shown in the browser and the most
+        recently used ones are reloaded in the background, behind the loads for the selection, and the differences
+        are merged into the tree in place. The other loaded layers are dropped, they are loaded fresh when selected.
+        """
+        bound = self.window.browser.get_bound_nodes() if hasattr(self, 'window') else set()
+        recent = list(self._loaded_layers)[-Constants.refresh_recent_layers:]
+        ## the layers above a refreshed layer are kept, they hold it
+        keep = set()
+        for node in list(bound) + recent:
+            while node is not None and node not in keep:
+                keep.add(node)
+                node = node.previous
+        stale = set([ n for n in self._loaded_layers if n not in keep ])
+        n_dropped = self.drop_content_layers(stale) if stale else 0
+        ## shown layers first, then the most recently used
+        refresh = [ n for n in reversed(self._loaded_layers) if n in bound ]
+        refresh.extend([ n for n in reversed(self._loaded_layers) if n not in bound ])
+        n_refreshed = 0
+        for node in refresh:
+            if node.loading:
+                continue
+            layer = node.get_child_layer()
+            old_children = [ layer.get_item(i) for i in range(layer.get_n_items()) ]
+            self.mpd_load(self.fetch_content_changes, node, old_children, priority=Constants.load_priority_refresh,
+                          callback=lambda changes, node=node, jump_index=node.jump_index:
+                              self.merge_content_data(node, jump_index, changes))
+            n_refreshed += 1
+        self.log.debug("refreshing %d loaded layers, dropped %d", n_refreshed, n_dropped)
+
+    def fetch_content_changes(self, client:mpd.Client, node:data.ContentTreeNode, old_children:list):
+        """
+        Runs on a loader thread. Reloads the children of node and works out how the child layer has to change, so the
+        main loop only applies the result, see merge_content_data().
+        Children that still exist keep their node object, so their loaded subtrees, the selection and the columns
+        bound to them stay as they are.
+        :param old_children: list of the children of node when the reload was queued
+        :return: tuple of (number of children, list of (existing child, reloaded copy) whose metadata changed, list of
+                 splices as (position, number of removed children, list of added children) from the end of the layer
+                 to its start, set of removed children, new data.JumpIndex or None if nothing was spliced),
+                 None on failure
+        """
+        children = self.fetch_content_data(client, node)
+        if children is None:
+            return None
+        old_by_identity = { c.get_identity(): c for c in old_children }
+        merged = []
+        updates = []
+        for c in children:
+            existing = old_by_identity.get(c.get_identity())
+            if existing:
+                if not existing.same_metadata(c):
+                    updates.append((existing, c))
+                merged.append(existing)
+            else:
+                merged.append(c)
+        matcher = difflib.SequenceMatcher(None, [ c.get_identity() for c in old_children ],
+                                          [ c.get_identity() for c in merged ], autojunk=False)
+        ## from the end, so the positions of earlier ranges stay valid
+        splices = [ (i1, i2 - i1, merged[j1:j2]) for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes())
+                    if tag != 'equal' ]
+        kept = set(merged)
+        removed = set([ c for c in old_children if c not in kept ])
+        return len(merged), updates, splices, removed, data.JumpIndex(merged) if splices else None
+
+    def merge_content_data(self, node:data.ContentTreeNode, jump_index:data.JumpIndex, changes:tuple):
+        """
+        Runs on the main loop. Applies the changes of a reloaded child layer. Nothing is applied if the layer changed
+        since the reload was queued.
+        :param node: node the children belong to
+        :param jump_index: jump index of node when the reload was queued, it is replaced whenever the layer changes
+        :param changes: return value of fetch_content_changes()
+        """
+        if changes is None:
+            self.log.error("could not reload: %s", node.metaname)
+            return
+        if node.loading or not node.loaded or not node.in_tree() or node.jump_index is not jump_index:
+            self.log.debug("layer changed since the reload was queued, or was dropped: %s", node.metaname)
+            return
+        n_children, updates, splices, removed, new_jump_index = changes
+        for existing, c in updates:
+            existing.copy_metadata(c)
+        layer = node.get_child_layer()
+        for position, n_removed, added in splices:
+            layer.splice(position, n_removed, added)
+        if splices:
+            self.log.info("merged %d changed ranges into: %s", len(splices), node.metaname)
+            node.jump_index = new_jump_index
+        if node in self._loaded_layers:
+            self._loaded_nodes += n_children - self._loaded_layers[node]
+            self._loaded_layers[node] = n_children
+        if removed:
+            for c in removed:
+                c.detached = True
+            self.drop_content_layers(removed)
+
+    def load_content_data(self, node:data.ContentTreeNode, priority:int=Constants.load_priority_foreground):
+        """
+        Loads the children of node on the loader thread. A placeholder row is shown in the child layer until the data
+        arrives. Does nothing if the children are already loaded or being loaded, except that a prefetch of node still
+        waiting in the queue is replaced with a foreground load, and that loaded children count as recently used.
+        :param node: node to load children for
+        :param priority: priority of the load, see mpd_load()
+        :return: concurrent.futures.Future of the load, None if nothing was loaded
+        """
+        self.log.debug("load data for node: %s", node)
+        prefetch = self._prefetches.get(node)
+        if prefetch and priority < Constants.load_priority_prefetch and self.cancel_content_load(node, prefetch):
+            self.log.debug("prefetch becomes a foreground load: %s", node.metaname)
+            del self._prefetches[node]
+        if node.loaded or node.loading:
+            self.log.debug("node child data already loaded, type: %s, name: %s", node.metatype, node.metaname)
+            if node in self._loaded_layers:
+                self._loaded_layers.move_to_end(node)
+            return None
+        if node.metatype in (Constants.node_t_song, Constants.node_t_file, Constants.node_t_placeholder):
+            self.log.debug("nothing to load for a %s: %s", node.metatype, node.metaname)
+            return None
+        node.loading = True
+        node.get_child_layer().append(data.ContentTreeNode(metadata={'type': Constants.node_t_placeholder,
+                                                                     'name': Constants.placeholder_name}, previous=node))
+        return self.mpd_load(self.fetch_content_data, node,
+                             callback=lambda result: self.publish_content_data(node, result),
+                             errback=lambda e: self.publish_content_data(node, None), priority=priority)
+
+    def prefetch_neighbour_content(self, layer:Gio.ListModel, position:int):
+        """
+        Loads the children of the rows around position at low priority, so moving the selection to one of them shows
+        its children at once. Queued prefetches of rows that are no longer near the selection are cancelled.
+        :param layer: layer with the selected row
+        :param position: position of the selected row
+        """
+        if not self.prefetch_neighbours or self.prefetch_budget <= 0:
+            return
+        n_items = layer.get_n_items()
+        neighbours = []
+        for distance in range(1, self.prefetch_neighbours + 1):
+            for p in (position + distance, position - distance):
+                if 0 <= p < n_items:
+                    neighbours.append(layer.get_item(p))
+        for node, future in list(self._prefetches.items()):
+            if node not in neighbours and self.cancel_content_load(node, future):
+                del self._prefetches[node]
+        ## categories are left out, the file tree is only loaded when it is selected
+        self._prefetch_wanted = [ n for n in neighbours if not n.loaded and not n.loading and
+                                  n.metatype not in (Constants.node_t_category, Constants.node_t_song,
+                                                     Constants.node_t_file, Constants.node_t_placeholder) ]
+        self.run_prefetches()
+
+    def run_prefetches(self):
+        """
+        Starts wanted prefetches while fewer than prefetch_budget are queued or running.
+        :return: False, to be usable as a GLib idle callback
+        """
+        for node, future in list(self._prefetches.items()):
+            if future.done():
+                del self._prefetches[node]
+        while self._prefetch_wanted and len(self._prefetches) < self.prefetch_budget:
+            node = self._prefetch_wanted.pop(0)
+            future = self.load_content_data(node, priority=Constants.load_priority_prefetch)
+            if not future:
+                continue
+            self._prefetches[node] = future
+            future.add_done_callback(lambda f: GLib.idle_add(self.run_prefetches))
+        return False
+
+    def cancel_content_load(self, node:data.ContentTreeNode, future):
+        """
+        Cancels a load started by load_content_data(), if no loader thread has picked it up yet. The node goes back
+        to not loaded, so selecting it again starts a new load. A load already running is left to finish.
+        :param future: return value of load_content_data()
+        :return: True if the load was cancelled
+        """
+        if not future.cancel():
+            return False
+        self.log.debug("cancelled load of: %s", node.metaname)
+        node.loading = False
+        node.get_child_layer().remove_all()
+        return True
+
+    def fetch_content_data(self, client:mpd.Client, node:data.ContentTreeNode):
+        """
+        Runs on a loader thread. Fetches the children of node and sorts them.
+        Sort keys are computed once per child, then the list is sorted in one go, ready to be spliced into the layer.
+        :param client: mpd.Client owned by the loader thread
+        :param node: node to fetch children for
+        :return: sorted list of child nodes, None on failure
+        """
+        sort_key_func = get_sort_key_func(node)
+        library_cache = self.library_cache
+        if library_cache:
+            key = cache.node_key(node)
+            generation = library_cache.generation
+            rows = library_cache.get(key)
+            if rows is not None:
+                self.log.debug("loaded %d children from cache: %s", len(rows), node.metaname)
+                children = [ data.ContentTreeNode(metadata=r, previous=node) for r in rows ]
+                if sort_key_func:
+                    for c in children:
+                        c.sort_key = sort_key_func(c)
+                return children
+        children = self.fetch_unsorted_content_data(client, node)
+        if children is None:
+            return None
+        if sort_key_func:
+            for c in children:
+                c.sort_key = sort_key_func(c)
+            children.sort(key=lambda c: c.sort_key)
+        if library_cache:
+            library_cache.put(key, [ c.get_metadata() for c in children ], generation)
+        return children
+
+    def fetch_unsorted_content_data(self, client:mpd.Client, node:data.ContentTreeNode):
+        """
+        Fetches the children of node, see fetch_content_data().
+        :return: list of child nodes in the order returned by MPD, None on failure
+        """
         try:
-            if not self.idle_queue.empty():
-                msg = self.idle_queue.get_nowait()
+            if node.metatype == Constants.node_t_category:
+                return self.load_category_content(client, node)
+            elif node.metatype == Constants.node_t_albumartist:
+                self.log.debug("loading albums by albumartist")
+                return self.load_items_list(client, node, Constants.node_t_song, False, "album", "albumartist", node.metaname)
+            elif node.metatype == Constants.node_t_artist:
+                self.log.debug("loading albums by artist")
+                return self.load_items_list(client, node, Constants.node_t_song, False, "album", "artist", node.metaname)
+            elif node.metatype == Constants.node_t_genre:
+                self.log.debug("loading albums by genre")
+                return self.load_items_list(client, node, Constants.node_t_song, False, "album", "genre", node.metaname)
+            elif node.metatype == Constants.node_t_directory:
+                return self.load_directories(client, node)
+            elif node.metatype == Constants.node_t_album:
+                return self.load_album_content(client, node)
+            else:
+                self.log.debug("unhandled metatype: %s", node.metatype)
+                return []
         except Exception as e:
-            return True
+            self.log.error("could not load %s '%s' (%s): %s", node.metatype, node.metaname, type(e).__name__, e)
+            return None
 
-        if msg and isinstance(msg, QueueMessage):
-            log.debug("processing queued message type: %s, item: %s" % (msg.get_type(), msg.get_item()))
-            log.debug("data: %s" % msg.get_data())
-            if msg.get_type() == Constants.message_type_change:
-                if msg.get_item() == Constants.message_item_playlist:
-                    self.window.playlist_list.update(msg.get_data()['playlist'], msg.get_data()['current'])
-                if msg.get_item() == Constants.message_item_player:
-                    self.window.playback_display.update(msg.get_data()['status'], msg.get_data()['current'], self.music_dir)
-        return True
+    def publish_content_data(self, node:data.ContentTreeNode, children:list, offset:int=0):
+        """
+        Runs on the main loop. Replaces the placeholder in the child layer of node with the loaded children.
+        Long lists are published in chunks, one chunk per main loop iteration, so the UI keeps responding. The jump
+        index of the layer is built along with the chunks.
+        :param node: node the children belong to
+        :param children: return value of fetch_content_data()
+        :param offset: index of the first child to publish
+        :return: False, to be usable as a GLib idle callback
+        """
+        layer = node.get_child_layer()
+        if not node.in_tree():
+            self.log.debug("dropped from the tree while loading: %s", node.metaname)
+            node.loading = False
+            layer.remove_all()
+            return False
+        if children is None:
+            self.log.error("loading failed, will retry on next selection: %s", node.metaname)
+            node.loading = False
+            layer.remove_all()
+            return False
+        chunk = children[offset:offset+Constants.publish_chunk_size]
+        if offset == 0:
+            layer.splice(0, layer.get_n_items(), chunk)
+            node.jump_index = data.JumpIndex()
+        else:
+            layer.splice(layer.get_n_items(), 0, chunk)
+        node.jump_index.add(chunk, offset)
+        offset += len(chunk)
+        if offset < len(children):
+            GLib.idle_add(self.publish_content_data, node, children, offset, priority=GLib.PRIORITY_DEFAULT_IDLE)
+        else:
+            self.log.debug("published %d children of: %s", len(children), node.metaname)
+            node.loading = False
+            node.loaded = True
+            self._loaded_layers[node] = len(children)
+            self._loaded_nodes += len(children)
+            self.evict_content_layers()
+        return False
 
-    def load_content_data(self, node):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("load data for node, metadata: %s" % node.get_metadata())
-        if node.get_child_layer().get_n_items(): # if data has already been loaded, skip
-            log.debug("node child data already loaded, type: %s, name: %s" % (node.metatype, node.metaname))
+    def evict_content_layers(self):
+        """
+        Drops the least recently used child layers until the loaded nodes fit in content_node_budget. Layers shown in
+        a browser column and layers still loading are kept. A dropped layer takes the layers below it along, and is
+        loaded again when its node is selected.
+        """
+        if not self.content_node_budget or self._loaded_nodes <= self.content_node_budget:
             return
-        if node.metatype == Constants.node_t_category:
-            self.load_category_content(node)
-        elif node.metatype == Constants.node_t_albumartist:
-            log.debug("loading albums by albumartist")
-            self.load_items_list(node, Constants.node_t_song, False, "album", "albumartist", node.metaname)
-        elif node.metatype == Constants.node_t_artist:
-            log.debug("loading albums by artist")
-            self.load_items_list(node, Constants.node_t_song, False, "album", "artist", node.metaname)
-        elif node.metatype == Constants.node_t_genre:
-            log.debug("loading albums by genre")
-            self.load_items_list(node, Constants.node_t_song, False, "album", "genre", node.metaname)
-        elif node.metatype == Constants.node_t_directory:
-            self.load_directories(node)
-        elif node.metatype == Constants.node_t_album:
-            self.load_album_content(node)
-        elif node.metatype == Constants.node_t_song:
-            log.debug("nothing to do for a song: %s" % node.metaname)
-        else:
-            log.debug("unhandled metatype: %s" % node.metatype)
+        bound = self.window.browser.get_bound_nodes() if hasattr(self, 'window') else set()
+        excess = self._loaded_nodes - self.content_node_budget
+        evicted = set()
+        for node, n_children in self._loaded_layers.items():
+            if excess <= 0:
+                break
+            if node in bound or node.loading:
+                continue
+            evicted.add(node)
+            excess -= n_children
+        if not evicted:
+            self.log.debug("%d nodes loaded, nothing to drop", self._loaded_nodes)
+            return
+        n_layers = self.drop_content_layers(evicted)
+        self.log.debug("dropped %d layers, %d nodes loaded", n_layers, self._loaded_nodes)
+
+    def drop_content_layers(self, nodes:set):
+        """
+        Drops the child layers of nodes and of the nodes below them, and takes them out of the loaded node count.
+        Queued prefetches below nodes are cancelled. Loads already running below nodes are not published, as their
+        nodes are detached from the tree.
+        :param nodes: set of nodes
+        :return: number of layers dropped
+        """
+        n_layers = 0
+        for node in list(self._loaded_layers):
+            if node in nodes or node.has_ancestor(nodes):
+                self._loaded_nodes -= self._loaded_layers.pop(node)
+                node.clear_child_layer()
+                n_layers += 1
+        for node, future in list(self._prefetches.items()):
+            if (node in nodes or node.has_ancestor(nodes)) and self.cancel_content_load(node, future):
+                del self._prefetches[node]
+        return n_layers
 
-    def load_category_content(self, node:data.ContentTreeNode):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
+    def load_category_content(self, client:mpd.Client, node:data.ContentTreeNode):
         if node.next_type == Constants.node_t_albumartist:
-            log.debug("loading albumartists")
-            self.load_items_list(node, Constants.node_t_album, False,"albumartist")
-            node.get_child_layer().sort(node_sort_filtered)
+            self.log.debug("loading albumartists")
+            return self.load_items_list(client, node, Constants.node_t_album, False,"albumartist")
         elif node.next_type == Constants.node_t_artist:
-            log.debug("loading artists")
-            self.load_items_list(node, Constants.node_t_album, False, "artist")
-            node.get_child_layer().sort(node_sort_filtered)
+            self.log.debug("loading artists")
+            return self.load_items_list(client, node, Constants.node_t_album, False, "artist")
         elif node.next_type == Constants.node_t_album:
-            log.debug("loading albums")
-            self.load_items_list(node, Constants.node_t_song, False, "album")
+            self.log.debug("loading albums")
+            return self.load_items_list(client, node, Constants.node_t_song, False, "album")
         elif node.next_type == Constants.node_t_genre:
-            log.debug("loading genres")
-            self.load_items_list(node, Constants.node_t_album, True, "genre")
+            self.log.debug("loading genres")
+            return self.load_items_list(client, node, Constants.node_t_album, True, "genre")
         elif node.next_type in (Constants.node_t_file, Constants.node_t_directory):
-            log.debug("loading directories")
-            self.load_first_directory_level(node)
+            self.log.debug("loading directories")
+            return self.load_first_directory_level(client, node)
         else:
-            log.error("unknown node next type: %s" % (node.next_type))
+            self.log.error("unknown node next type: %s", node.next_type)
+            return []
 
-    def load_album_content(self, node:data.ContentTreeNode):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("loading song by albums by: %s" % node.previous.metatype)
+    def load_album_content(self, client:mpd.Client, node:data.ContentTreeNode):
+        self.log.debug("loading song by albums by: %s", node.previous.metatype)
         if node.previous.metatype == Constants.node_t_albumartist:
-            self.load_songs(node, "albumartist", node.previous.metaname, "album", node.metaname)
+            return self.load_songs(client, node, "albumartist", node.previous.metaname, "album", node.metaname)
         elif node.previous.metatype == Constants.node_t_artist:
-            self.load_songs(node, "artist", node.previous.metaname, "album", node.metaname)
+            return self.load_songs(client, node, "artist", node.previous.metaname, "album", node.metaname)
         elif node.previous.metatype == Constants.node_t_category:
-            self.load_songs(node, "album", node.metaname)
+            return self.load_songs(client, node, "album", node.metaname)
         elif node.previous.metatype == Constants.node_t_genre:
-            self.load_songs(node, "genre", node.previous.metaname, "album", node.metaname)
-        node.get_child_layer().sort(node_sort_by_track)
+            return self.load_songs(client, node, "genre", node.previous.metaname, "album", node.metaname)
+        return []
 
-    def load_items_list(self, node:data.ContentTreeNode, next_type:str, load_empty_string:bool=False, *args, **kwargs):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        try:
-            log.debug("loading item: %s" % node.get_metadata())
-            recv = self.mpd_list(*args, **kwargs)
-            if not recv:
-                log.error("no data feteched for node: %s" % node.metaname)
-                return
-            log.debug("items: %s" % recv)
-            for r in recv:
-                if r or (load_empty_string and r == ""):
-                    new_node = data.ContentTreeNode(metadata={'name': r, 'type': node.next_type, 'next_type': next_type}, previous=node)
-                    node.get_child_layer().append(new_node)
-        except Exception as e:
-            log.error("could not load item (%s): %s" % (type(e).__name__, e))
+    def load_items_list(self, client:mpd.Client, node:data.ContentTreeNode, next_type:str, load_empty_string:bool=False, *args, **kwargs):
+        nodes = []
+        self.log.debug("loading item: %s", node)
+        recv = client.list(*args, **kwargs)
+        if not recv:
+            self.log.error("no data feteched for node: %s", node.metaname)
+            return nodes
+        self.log.debug("items: %s", recv)
+        for r in recv:
+            if r or (load_empty_string and r == ""):
+                nodes.append(data.ContentTreeNode(metadata={'name': r, 'type': node.next_type, 'next_type': next_type}, previous=node))
+        return nodes
 
-    def load_songs(self, node:data.ContentTreeNode, *args, **kwargs):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        try:
-            recv = self.mpd_find(*args, **kwargs)
-            if not recv:
-                log.error("no songs for: %s" % node.metaname)
-                return
-            log.debug("songs from '%s': %s" % (node.metaname, recv))
-            for r in recv:
-                if r:
-                    node.get_child_layer().append(self.create_song_node(metadata=r, previous=node))
-            node.get_child_layer().sort(node_sort_by_track)
-        except Exception as e:
-            log.error("could not load songs by albums by albumartist '%s', '%s': %s" % (node.previous.metaname, node.metaname, e))
+    def load_songs(self, client:mpd.Client, node:data.ContentTreeNode, *args, **kwargs):
+        recv = client.find(*args, **kwargs)
+        if not recv:
+            self.log.error("no songs for: %s", node.metaname)
+            return []
+        self.log.debug("songs from '%s': %s", node.metaname, recv)
+        return [ self.create_song_node(metadata=r, previous=node) for r in recv if r ]
 
-    def load_first_directory_level(self, node:data.ContentTreeNode):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("directory node metadata: %s" % node.get_metadata())
-        try:
-            path = ""
-            if 'path' in node.get_metadata():
-                path = node.get_metadata('path')
-            files = self.get_files_list(path)
-            log.debug("files: %s" % files)
-            if not files or not isinstance(files, list):
-                log.error("could not get files successfully: %s" % files)
-                return
-            for f1 in files:
-                log.debug("1st level file: %s" % f1)
-                subf = self.get_files_list(f1['path'])
-                for f2 in subf:
-                    log.debug("2nd level file: %s" % f2)
-                    metadata = {'type': f2['type'], 'name': f1['name'] + "/" + f2['name'], 'path': f2['path']}
-                    log.debug("adding metadata: %s" % metadata)
-                    new_node = data.ContentTreeNode(metadata=metadata, previous=node)
-                    node.get_child_layer().append(new_node)
-        except Exception as e:
-            log.error("could not load 1st level (%s): %s" % (type(e).__name__, e))
+    def load_first_directory_level(self, client:mpd.Client, node:data.ContentTreeNode):
+        self.log.debug("directory node: %s", node)
+        nodes = []
+        path = ""
+        if node.get_metadata('path') is not None:
+            path = node.get_metadata('path')
+        files = self.get_files_list(client, path)
+        self.log.debug("files: %s", files)
+        if not files or not isinstance(files, list):
+            self.log.error("could not get files successfully: %s", files)
+            return nodes
+        ## list the 1st level directories with command lists, a chunk at a time, so no response outgrows the output
+        ## buffer of MPD
+        dirs = [ f1 for f1 in files if f1['type'] == Constants.node_t_directory ]
+        listings = []
+        for i in range(0, len(dirs), Constants.directory_list_chunk_size):
+            chunk = dirs[i:i+Constants.directory_list_chunk_size]
+            chunk_listings = client.command_list([ ("lsinfo", f1['path']) for f1 in chunk ])
+            if chunk_listings is None:
+                ## one failing directory fails the whole list, list them one by one so only that one is missing
+                self.log.warning("could not list %d directories together, listing them one by one", len(chunk))
+                chunk_listings = []
+                for f1 in chunk:
+                    listing = client.lsinfo(f1['path'])
+                    if listing is None:
+                        self.log.error("could not list directory: %s", f1['path'])
+                    chunk_listings.append(listing)
+            listings.extend(chunk_listings)
+        for f1, listing in zip(dirs, listings):
+            self.log.debug("1st level file: %s", f1)
+            for f2 in self.files_to_rows(listing):
+                self.log.debug("2nd level file: %s", f2)
+                metadata = dict(f2)
+                metadata['name'] = f1['name'] + "/" + f2['name']
+                if f2['type'] == Constants.node_t_directory:
+                    metadata = {'type': f2['type'], 'name': metadata['name'], 'path': f2['path']}
+                self.log.debug("adding metadata: %s", metadata)
+                nodes.append(data.ContentTreeNode(metadata=metadata, previous=node))
+        for f1 in files:
+            if f1['type'] == Constants.node_t_file:
+                nodes.append(data.ContentTreeNode(metadata=f1, previous=node))
+        return nodes
 
-    def load_directories(self, node:data.ContentTreeNode):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        try:
-            log.debug("dir metadata: %s" % node.get_metadata())
-            files = self.get_files_list(node.get_metadata('path'))
-            log.debug("received files: %s" % files)
-            for f in files:
-                node.get_child_layer().append(data.ContentTreeNode(metadata=f, previous=node))
-        except Exception as e:
-            log.error("could not load 2nd level (%s): %s" % (type(e).__name__, e))
+    def load_directories(self, client:mpd.Client, node:data.ContentTreeNode):
+        self.log.debug("directory: %s", node)
+        files = self.get_files_list(client, node.get_metadata('path'))
+        self.log.debug("received files: %s", files)
+        return [ data.ContentTreeNode(metadata=f, previous=node) for f in files ]
 
     def create_song_node(self, metadata:dict, previous:data.ContentTreeNode):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("create song node: %s" % metadata)
+        self.log.debug("create song node: %s", metadata)
         metadata['type'] = Constants.node_t_song
         if 'title' in metadata and 'track' in metadata:
             metadata['name'] = "%s %s" % (metadata['track'], metadata['title'])
         else:
             metadata['name'] = os.path.basename(metadata['file'])
         new_node = data.ContentTreeNode(metadata=metadata, previous=previous)
-        log.debug("new node: %s" % new_node.metaname)
+        self.log.debug("new node: %s", new_node.metaname)
         return new_node
 
     def check_threads(self):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         try:
             self.mpd_idle_thread.thread.join(0)
-            log.debug("join() returned")
+            self.log.debug("join() returned")
         except Exception as e:
-            log.error("error running join (%s): %s" % (type(e).__name__, e))
+            self.log.error("error running join (%s): %s", type(e).__name__, e)
         if not self.mpd_idle_thread.thread.is_alive():
-            log.error("idle thread has stopped, restarting")
+            self.log.error("idle thread has stopped, restarting")
             try:
                 self.mpd_idle_thread = mpd.IdleClientThread(host=self.host, port=self.port, queue=self.idle_queue,
-                                                            name="idleThread")
+                                                            name="idleThread", notify=self.wake_idle_handler)
             except Exception as e:
-                log.error("could not restart idle thread (%s): %s" % (type(e).__name__, e))
+                self.log.error("could not restart idle thread (%s): %s", type(e).__name__, e)
         else:
-            log.debug("idle thread is alive")
+            self.log.debug("idle thread is alive")
+        if not self.mpd_command_thread.thread.is_alive():
+            self.log.error("command thread has stopped, restarting")
+            try:
+                self.mpd_command_thread = mpd.CommandClientThread(self.mpd_pool, queue=self.command_queue,
+                                                                  name="commandThread")
+            except Exception as e:
+                self.log.error("could not restart command thread (%s): %s", type(e).__name__, e)
+        if not self.mpd_status_thread.thread.is_alive():
+            self.log.error("status thread has stopped, restarting")
+            try:
+                self.mpd_status_thread = mpd.CommandClientThread(self.mpd_pool, queue=self.status_queue,
+                                                                 name="statusThread")
+            except Exception as e:
+                self.log.error("could not restart status thread (%s): %s", type(e).__name__, e)
+        for i, loader_thread in enumerate(self.mpd_loader_threads):
+            if loader_thread.thread.is_alive():
+                continue
+            self.log.error("loader thread %d has stopped, restarting", i)
+            try:
+                self.mpd_loader_threads[i] = mpd.CommandClientThread(self.mpd_pool, queue=self.loader_queue,
+                                                                     name="loaderThread%d" % i)
+            except Exception as e:
+                self.log.error("could not restart loader thread (%s): %s", type(e).__name__, e)
         return True
 
     def add_to_playlist(self, node:data.ContentTreeNode):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("adding to playlist: %s" % node.get_metadata())
+        self.log.debug("adding to playlist: %s", node)
         if node.metatype == Constants.node_t_song:
             self.mpd_add(node.get_metadata('file'))
         elif node.metatype == Constants.node_t_file:
             self.mpd_add(node.get_metadata('file'))
         elif node.metatype == Constants.node_t_album:
-            log.debug("adding album: %s" % node.metaname)
+            self.log.debug("adding album: %s", node.metaname)
             if node.previous.metatype == Constants.node_t_artist:
-                log.debug("adding album by artist: %s" % node.previous.metaname)
+                self.log.debug("adding album by artist: %s", node.previous.metaname)
                 self.mpd_findadd("artist", node.previous.metaname, "album", node.metaname)
             elif node.previous.metatype == Constants.node_t_albumartist:
-                log.debug("adding album by albumartist: %s" % node.previous.metaname)
+                self.log.debug("adding album by albumartist: %s", node.previous.metaname)
                 self.mpd_findadd("albumartist", node.previous.metaname, "album", node.metaname)
             elif node.previous.metatype == Constants.node_t_genre:
-                log.debug("adding album by genre: %s" % node.previous.metaname)
+                self.log.debug("adding album by genre: %s", node.previous.metaname)
                 self.mpd_findadd("genre", node.previous.metaname, "album", node.metaname)
             elif node.previous.metatype == Constants.node_t_category:
-                log.debug("adding album from toplevel: %s" % node.previous.metaname)
+                self.log.debug("adding album from toplevel: %s", node.previous.metaname)
                 self.mpd_findadd("album", node.metaname)
             else:
-                log.error("unhandled type 2: %s" % node.previous.metatype)
+                self.log.error("unhandled type 2: %s", node.previous.metatype)
         elif node.metatype == Constants.node_t_directory:
-            log.debug("not adding dir: %s" % node.get_metadata())
+            self.log.debug("not adding dir: %s", node)
         else:
-            log.error("unhandled type 1: %s" % node.metatype)
+            self.log.error("unhandled type 1: %s", node.metatype)
@@ -0,0 +1,107 @@
+import os
+import json, zlib
+import sqlite3
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+class LibraryCache:
+    """
+    On-disk cache of the content tree, stored in SQLite.
+    Each entry holds the metadata of the children of one node, keyed by the node's path in the tree.
+    The cache belongs to one state of the MPD database, identified by stats()['db_update'], and is emptied when
+    the database changes.
+    Safe to use from the loader threads.
+    """
+    log = logging.getLogger(__name__ + ".LibraryCache")
+    _meta_db_update = "db_update"
+
+    def __init__(self, path:str, db_update:str):
+        """
+        :param path: path of the SQLite file, created if it does not exist
+        :param db_update: db_update value from MPD stats, entries from another db_update are dropped
+        """
+        self.path = path
+        self.generation = 0
+        self._lock = threading.Lock()
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS layers (key TEXT PRIMARY KEY, rows BLOB)")
+            self._db.commit()
+        if self.get_db_update() != str(db_update):
+            self.log.info("library cache is stale, clearing: %s", path)
+            self.invalidate(db_update)
+        else:
+            self.log.info("library cache is valid: %s", path)
+
+    def get_db_update(self):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (self._meta_db_update,)).fetchone()
+        if not row:
+            return None
+        return row[0]
+
+    def invalidate(self, db_update:str):
+        """
+        Drops all entries and marks the cache as belonging to db_update.
+        Entries fetched before this call are refused by put().
+        :param db_update: new db_update value from MPD stats
+        """
+        with self._lock:
+            self.generation += 1
+            self._db.execute("DELETE FROM layers")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             (self._meta_db_update, str(db_update)))
+            self._db.commit()
+
+    def get(self, key:str):
+        """
+        :param key: node key, see node_key()
+        :return: list of metadata dicts, None if not cached
+        """
+        with self._lock:
+            row = self._db.execute("SELECT rows FROM layers WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(zlib.decompress(row[0]))
+        except Exception as e:
+            self.log.error("could not decode cache entry '%s' (%s): %s", key, type(e).__name__, e)
+            return None
+
+    def put(self, key:str, rows:list, generation:int):
+        """
+        Stores the children's metadata of a node.
+        :param key: node key, see node_key()
+        :param rows: list of metadata dicts
+        :param generation: value of self.generation when the rows were fetched
+        """
+        blob = zlib.compress(json.dumps(rows, separators=(',', ':')).encode())
+        with self._lock:
+            if generation != self.generation:
+                self.log.debug("dropping cache entry fetched before invalidation: %s", key)
+                return
+            self._db.execute("INSERT OR REPLACE INTO layers (key, rows) VALUES (?, ?)", (key, sqlite3.Binary(blob)))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def node_key(node):
+    """
+    Builds the cache key of a node from the types and names of the node and its ancestors.
+    :param node: data.ContentTreeNode
+    :return: string key
+    """
+    parts = []
+    while node:
+        parts.append("%s:%s" % (node.metatype, node.metaname))
+        node = node.previous
+    return "\x1f".join(reversed(parts))
@@ -8,6 +8,8 @@ class Constants:
     default_width = 1920
     default_height = 1080
     default_config_file = os.environ['HOME'] + "/.config/mpdfront/mpdfront.cfg"
+    default_cache_dir = os.environ['HOME'] + "/.cache/mpdfront"
+    library_cache_file_fmt = "library-%s-%d.db"    ## cache file name in cache_dir, formatted with MPD host and port
     default_log_format = "%(asctime)s %(levelname)s %(threadName)s %(module)s::%(funcName)s(%(lineno)d): %(message)s"
     browser_num_columnns = 4
 
@@ -39,6 +41,27 @@ class Constants:
     node_t_directory = "directory"
     node_t_file = "file"
     node_t_song = "song"
+    node_t_placeholder = "placeholder"
+
+    placeholder_name = "Loading..."     ## name of the row shown while a node's children are loading
+    ## metadata values that repeat across many nodes, one copy of each value is kept in memory
+    interned_metadata_keys = frozenset(('type', 'next_type', 'previous_type', 'artist', 'albumartist', 'album',
+                                        'genre', 'date', 'composer', 'performer', 'disc', 'track', 'format', 'time',
+                                        'duration'))
+    max_metadata_key_sets = 1024    ## distinct sets of metadata keys whose key index is shared between nodes
+
+    ## library search
+    search_index_keys = ('artist', 'albumartist', 'album', 'title', 'genre')    ## tags searched
+    search_row_keys = ('file', 'last-modified', 'artist', 'albumartist', 'album', 'title', 'genre', 'disc', 'track',
+                       'time')      ## tags kept per song in the search index
+    search_result_limit = 200       ## maximum number of results shown
+    search_prefix_cache_size = 256  ## number of prefixes whose matching songs are kept
+    search_bitmap_fraction = 64     ## words in at least 1/64 of the songs keep a bitmap of them
+    search_bitmap_min_songs = 256   ## and in at least this many songs
+    search_fetch_window = 5000      ## songs fetched per command when building the search index
+    search_cache_key = "search"     ## library cache entry with the search index rows
+    search_apply_max_changes = 200  ## larger library changes rebuild the search index instead of updating it
+    search_compact_fraction = 4     ## rebuild when a quarter of the song ids in the index are unused
 
     ## Rows for 1st column of browser
     browser_1st_column_rows = [
@@ -49,20 +72,54 @@ class Constants:
         {'type': node_t_category, 'name': topnode_name_files, 'next_type': node_t_directory},
     ]
 
+    default_albumart_cache_mb = 64         ## memory budget for decoded album art
+    default_albumart_size = 800             ## album art is scaled down to fit in a square of this many pixels
+    albumart_thumbnail_dir = "thumbnails"   ## directory in cache_dir for scaled album art
+    albumart_thumbnail_quality = 90         ## JPEG quality of the thumbnails
+    albumart_workers = 2                    ## threads loading and decoding album art
+    albumart_prefetch_count = 3             ## number of upcoming playlist songs to prefetch album art for
+
     proc_file_fmt = "/proc/asound/card%s/pcm%sp/sub%s/hw_params"  ## proc file with DAC information
     #proc_file_fmt = "./hw_params"
+    default_dac_poll_interval = 2000        ## milliseconds between reads of the proc file, besides player changes
 
     ## QueueMessage types and items
     message_type_change = "change"
     message_item_playlist = "playlist"
     message_item_player = "player"
+    message_item_database = "database"
 
     ## sleep/wait intervals
-    idle_thread_interval = 334              ## milliseconds
-    playback_refresh_interval = 1000        ## milliseconds
-    reconnect_retry_sleep_secs = 1          ## seconds
+    playback_tick_interval = 1000           ## milliseconds between updates of the interpolated time
+    playback_resync_interval = 30000        ## milliseconds between status queries resyncing the time
+    reconnect_backoff_min_secs = 0.5        ## seconds before the first retry of a failed connection
+    reconnect_backoff_max_secs = 30         ## the wait doubles with every failure in a row, up to this many seconds
+    connect_timeout_secs = 60               ## seconds a new pooled connection is retried when no deadline is given
+    connection_check_secs = 30              ## pooled connections unused for this many seconds are pinged before reuse
+    command_timeout_secs = 10               ## seconds before a queued command is abandoned
+    load_timeout_secs = 120                 ## seconds before a content load is abandoned
+
+    default_loader_threads = 3      ## number of loader threads, running content loads in parallel
+    default_connection_pool_size = 5    ## connections shared by the command, status and loader threads
+    publish_chunk_size = 2000       ## number of nodes added to a browser column per main loop iteration
+    directory_list_chunk_size = 100 ## 1st level directories listed per command list in the file browser
+    browser_load_delay = 120        ## milliseconds the cursor rests on a browser row before its children are loaded
+    default_prefetch_neighbours = 2 ## rows above and below the selection whose children are loaded in advance
+    prefetch_budget = 2             ## prefetches queued or running at a time, at most loader_threads - 1
+    load_priority_foreground = 0    ## priority of loads for the selection, see CommandRequest
+    load_priority_prefetch = 10     ## priority of prefetches, they wait until no foreground load is queued
+    load_priority_refresh = 20      ## priority of reloads after a database change, they wait for prefetches too
+    refresh_recent_layers = 50      ## loaded layers reloaded after a database change besides the shown ones, the
+                                    ## others are dropped
+    default_content_node_budget = 200000    ## loaded nodes kept in the content tree, least recently used layers are dropped
     alive_check_interval = 5000             ## milliseconds
 
+    ## MPD commands that change state and are run on the command thread without waiting for the result
+    mpd_async_commands = (
+        "add", "clear", "consume", "deleteid", "disableoutput", "enableoutput", "findadd", "moveid", "next", "pause",
+        "play", "play_or_pause", "playid", "previous", "random", "repeat", "seekcur", "single", "stop", "toggle",
+    )
+
     config_section_main = "main"
     config_section_keys = "keys"
 
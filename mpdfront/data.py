@@ -1,4 +1,5 @@
 import sys
+import bisect
 import logging
 import gi
 from .constants import Constants
@@ -6,73 +7,277 @@ from gi.repository import GObject, Gio
 
 log = logging.getLogger(__name__)
 
+_metadata_keys = {}   ## sorted tuple of metadata keys -> dict of key to index, shared by all nodes with the same keys
+
+def compact_metadata(metadata:dict):
+    """
+    Splits metadata into a shared key index and a tuple of values. Nodes of the same kind have the same keys, so they
+    all share one key index and only keep their values. Keys are sorted, so the order MPD sends tags in does not
+    matter, and at most max_metadata_key_sets key indexes are shared. Keys and repeating values are interned.
+    :param metadata: metadata dict
+    :return: tuple of (dict of key to index, tuple of values)
+    """
+    keys = tuple(sorted([ sys.intern(k) for k in metadata ]))
+    index = _metadata_keys.get(keys)
+    if index is None:
+        index = { k: i for i, k in enumerate(keys) }
+        if len(_metadata_keys) < Constants.max_metadata_key_sets:
+            index = _metadata_keys.setdefault(keys, index)
+    values = tuple([ sys.intern(metadata[k]) if isinstance(metadata[k], str) and k in Constants.interned_metadata_keys
+                     else metadata[k] for k in keys ])
+    return index, values
+
+def parse_number(value):
+    """
+    Parses disc and track numbers, which can come as "3" or "3/12". Repeated tags come as a list, the first value
+    counts.
+    :return: int, 0 if the value is missing or not a number
+    """
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if not value or not isinstance(value, str):
+        return 0
+    try:
+        return int(value.split('/', 1)[0])
+    except Exception:
+        return 0
+
+def get_jump_char(node):
+    """
+    :return: first character of the sort key of node, or of its casefolded name if it is not sorted by name
+    """
+    key = node.sort_key
+    if not isinstance(key, str):
+        key = (node.metaname or "").casefold()
+    return key[:1]
+
+class JumpIndex:
+    """
+    Position of the first child for each first character of the sort keys in a child layer, so a browser column can
+    jump to a letter without scanning its rows. Built while the layer is published, see add().
+    Layers that keep the order from MPD are not sorted by casefolded name, their first characters are tracked to tell
+    if the positions still follow the characters.
+    """
+    def __init__(self, children:list=None):
+        self.chars = []         ## sorted first characters
+        self.positions = []     ## position of the first child starting with each of chars
+        self.ordered = True     ## whether the first characters of the children never decrease
+        self._last_char = ""    ## first character of the last indexed child
+        if children:
+            self.add(children)
+
+    def add(self, children:list, offset:int=0):
+        """
+        Indexes children appended to the layer.
+        :param offset: position of the first of children in the layer
+        """
+        seen = set(self.chars)
+        for i, child in enumerate(children, offset):
+            char = get_jump_char(child)
+            if not char:
+                continue
+            if char < self._last_char:
+                self.ordered = False
+            self._last_char = char
+            if char in seen:
+                continue
+            seen.add(char)
+            j = bisect.bisect_left(self.chars, char)
+            self.chars.insert(j, char)
+            self.positions.insert(j, i)
+
+    def find(self, char:str):
+        """
+        :param char: casefolded character
+        :return: position of the first child starting with char, or with the next character that has any if the layer
+                 is ordered by first character, None if there is none
+        """
+        j = bisect.bisect_left(self.chars, char)
+        if j == len(self.chars):
+            return None
+        if self.chars[j] != char and not self.ordered:
+            return None
+        return self.positions[j]
+
 class ContentTreeNode(GObject.GObject):
+    """
+    Node of the content tree. Kept small, as a fully browsed library has hundreds of thousands of them:
+    metadata is stored as a tuple of values with a key index shared between nodes, the child layer is only created
+    when it is first needed, and optional attributes default to class attributes until they are set.
+    """
+    _previous = None
+    _child_layer = None
+    _loaded = False
+    _loading = False
+    _sort_key = None
+    _jump_index = None
+    _detached = False
+
     def __init__(self, metadata:dict, previous=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._metadata = metadata
-        self._child_layer = Gio.ListStore()
-        if 'name' in metadata:
-            self._metaname = metadata['name']
-        else:
-            self._metaname = None
-        if 'type' in metadata:
-            self._metatype = metadata['type']
-        else:
-            self._metatype = None
+        self._keys, self._values = compact_metadata(metadata)
         if previous:
             self._previous = previous
-        if 'previous_type' in metadata:
-            self._previous_type = metadata['previous_type']
-        if 'next_type' in metadata:
-            self._next_type = metadata['next_type']
 
-    def get_child_layer(self):
-        if not hasattr(self, "_child_layer"):
-            return None
+    def __repr__(self):
+        return "<%s %s %r>" % (type(self).__name__, self.metatype, self.metaname)
+
+    def get_child_layer(self, create:bool=True):
+        """
+        :param create: whether to create the child layer if the node has none yet
+        :return: Gio.ListStore with the child nodes, None if there is none and create is False
+        """
+        if self._child_layer is None and create:
+            self._child_layer = Gio.ListStore()
         return self._child_layer
 
+    def clear_child_layer(self):
+        """
+        Drops the child layer and everything below it. The node counts as not loaded again, so its children are
+        loaded the next time they are needed. The dropped children are marked detached.
+        """
+        if self._child_layer is not None:
+            for i in range(self._child_layer.get_n_items()):
+                self._child_layer.get_item(i).detached = True
+            self._child_layer.remove_all()
+        self._child_layer = None
+        self._jump_index = None
+        self._loaded = False
+
+    def has_ancestor(self, nodes):
+        """
+        :param nodes: set of nodes
+        :return: True if one of nodes is above this node in the tree
+        """
+        node = self._previous
+        while node is not None:
+            if node in nodes:
+                return True
+            node = node.previous
+        return False
+
+    def in_tree(self):
+        """
+        :return: False if the node or one of its ancestors was dropped from the tree
+        """
+        node = self
+        while node is not None:
+            if node.detached:
+                return False
+            node = node.previous
+        return True
+
     def get_metadata(self, key:str=None):
+        """
+        :param key: metadata key, None for all metadata
+        :return: value of key, None if the node has no such key. Without a key, a new dict with all metadata, which
+                 is built on every call, read single keys where possible.
+        """
         if not key:
-            return self._metadata
-        if not key in self._metadata:
+            return dict(zip(self._keys, self._values))
+        i = self._keys.get(key)
+        if i is None:
             return None
-        return self._metadata[key]
+        return self._values[i]
 
     def set_metadata(self, key:str, value):
-        self._metadata[key] = value
+        metadata = self.get_metadata()
+        metadata[key] = value
+        self._keys, self._values = compact_metadata(metadata)
+
+    def same_metadata(self, other):
+        """
+        :param other: reloaded copy of this node
+        :return: True if other has the same metadata and sort key
+        """
+        return self._keys == other._keys and self._values == other._values and self.sort_key == other.sort_key
+
+    def copy_metadata(self, other):
+        """
+        Takes over the metadata and sort key of other, a reloaded copy of this node, keeping the node and its child
+        layer.
+        """
+        self._keys, self._values = other._keys, other._values
+        self.sort_key = other.sort_key
+
+    def get_identity(self):
+        """
+        :return: tuple that tells the node apart from its siblings, also across reloads of the same layer
+        """
+        return (self.metatype, self.metaname, self.get_metadata('file') or self.get_metadata('path'))
 
     def get_metaname(self):
-        if not hasattr(self, "_metaname"):
-            return None
-        return self._metaname
+        return self.get_metadata('name')
     def set_metaname(self, name:str):
-        self._metaname = name
+        self.set_metadata('name', name)
     metaname = property(fget=get_metaname, fset=set_metaname)
 
     def get_metatype(self):
-        if not hasattr(self, "_metatype"):
-            return None
-        return self._metatype
+        return self.get_metadata('type')
     def set_metatype(self, metatype:str):
-        self._metatype = metatype
+        self.set_metadata('type', metatype)
     metatype = property(fget=get_metatype, fset=set_metatype)
 
     def get_previous(self):
-        if not hasattr(self, "_previous"):
-            return None
         return self._previous
     def set_previous(self, previous):
         self._previous = previous
     previous = property(fget=get_previous, fset=set_previous)
 
     def get_next_type(self):
-        if not hasattr(self, "_next_type"):
-            return None
-        return self._next_type
+        return self.get_metadata('next_type')
     def set_next_type(self, next_type:str):
-        self._next_type = next_type
+        self.set_metadata('next_type', next_type)
     next_type = property(fget=get_next_type, fset=set_next_type)
 
+    def get_loaded(self):
+        return self._loaded
+    def set_loaded(self, loaded:bool):
+        self._loaded = loaded
+    loaded = property(fget=get_loaded, fset=set_loaded)
+
+    def get_loading(self):
+        return self._loading
+    def set_loading(self, loading:bool):
+        self._loading = loading
+    loading = property(fget=get_loading, fset=set_loading)
+
+    def get_sort_key(self):
+        return self._sort_key
+    def set_sort_key(self, sort_key):
+        self._sort_key = sort_key
+    sort_key = property(fget=get_sort_key, fset=set_sort_key)
+
+    def get_jump_index(self):
+        return self._jump_index
+    def set_jump_index(self, jump_index:JumpIndex):
+        self._jump_index = jump_index
+    jump_index = property(fget=get_jump_index, fset=set_jump_index)
+
+    def get_detached(self):
+        return self._detached
+    def set_detached(self, detached:bool):
+        self._detached = detached
+    detached = property(fget=get_detached, fset=set_detached)
+
+def get_tree_size(tree:Gio.ListStore):
+    """
+    :return: tuple of (number of nodes, number of loaded child layers) below tree
+    """
+    n_nodes = 0
+    n_layers = 0
+    pending = [ tree ]
+    while pending:
+        layer = pending.pop()
+        n_items = layer.get_n_items()
+        n_nodes += n_items
+        for i in range(n_items):
+            child_layer = layer.get_item(i).get_child_layer(create=False)
+            if child_layer is not None:
+                n_layers += 1
+                pending.append(child_layer)
+    return n_nodes, n_layers
+
 def dump(tree:Gio.ListStore, indent:str=""):
     n_items = tree.get_n_items()
     for i in range(0, n_items):
@@ -85,5 +290,8 @@ def dump(tree:Gio.ListStore, indent:str=""):
             i_char1 = "+"
             i_char2 = " "
         sys.stdout.write("%s%s-%s\n" % (indent, i_char1, n.get_metaname()))
-        dump(n.get_child_layer(), indent+i_char2+"  ")
+        if n.get_child_layer(create=False):
+            dump(n.get_child_layer(create=False), indent+i_char2+"  ")
         i += 1
+    if not indent:
+        sys.stdout.write("%d nodes in %d child layers\n" % get_tree_size(tree))
@@ -1,5 +1,8 @@
-import time, inspect
+import time, math
 import threading, queue
+import contextlib
+import itertools
+import concurrent.futures
 import logging
 import musicpd
 from . import Constants
@@ -7,16 +10,32 @@ from .message import QueueMessage
 
 log = logging.getLogger(__name__)
 
+class CommandTimeoutError(Exception):
+    """
+    Raised when an MPD command could not be completed before its deadline.
+    """
+    pass
+
+def backoff_delay(attempt:int):
+    """
+    :param attempt: number of failed attempts so far, starting at 1
+    :return: seconds to wait before the next attempt, doubling with every attempt up to a maximum
+    """
+    return min(Constants.reconnect_backoff_max_secs, Constants.reconnect_backoff_min_secs * 2 ** (attempt - 1))
+
 class Client:
+    log = logging.getLogger(__name__ + ".Client")
     def __init__(self, host:str, port:int):
         self.host = host
         self.port = port
+        self.deadline = None    ## time.monotonic() value after which run_command gives up, None for no limit
+        self.last_used = time.monotonic()
         try:
             self.mpd_client = musicpd.MPDClient()
             self.mpd_client.connect(host, port)
-            log.info("connected to mpd %s:%d" % (host, port))
+            self.log.info("connected to mpd %s:%d", host, port)
         except Exception as e:
-            log.critical("could not connect to mpd %s:%d: %s" % (host, port, e))
+            self.log.critical("could not connect to mpd %s:%d: %s", host, port, e)
             raise e
         
         self._mpd_callbacks = {
@@ -36,10 +55,13 @@ class Client:
             'next': self.mpd_client.next,
             'outputs': self.mpd_client.outputs,
             'pause': self.mpd_client.pause,
+            'ping': self.mpd_client.ping,
             'play': self.mpd_client.play,
             'play_or_pause': self.play_or_pause,
             'playid': self.mpd_client.playid,
             'playlistinfo': self.mpd_client.playlistinfo,
+            'plchanges': self.mpd_client.plchanges,
+            'plchangesposid': self.mpd_client.plchangesposid,
             'previous': self.mpd_client.previous,
             'random': self.mpd_client.random,
             'repeat': self.mpd_client.repeat,
@@ -53,76 +75,127 @@ class Client:
         }
 
     def __getattr__(self, attr):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("called __getattr__: %s" % attr)
+        self.log.debug("called __getattr__: %s", attr)
         if attr not in self._mpd_callbacks:
             raise AttributeError("object has no attribute %s" % attr)
         return lambda *args: self.run_command(self._mpd_callbacks[attr], *args)
 
     def reconnect(self):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         try:
-            log.debug("attempting disconnect")
+            self.log.debug("attempting disconnect")
             self.mpd_client.disconnect()
         except Exception as e:
-            log.debug("disconnect failed (%s): %s" % (type(e).__name__, e))
+            self.log.debug("disconnect failed (%s): %s", type(e).__name__, e)
         try:
-            log.debug("attempting reconnect")
-            self.mpd_client.connect()
-            log.info("reconnected to mpd")
+            self.log.debug("attempting reconnect")
+            self.mpd_client.connect(self.host, self.port)
+            self.log.info("reconnected to mpd")
         except Exception as e:
-            log.critical("could not reconnect to mpd %s:%d: %s" % (self.host, self.port, e))
+            self.log.critical("could not reconnect to mpd %s:%d: %s", self.host, self.port, e)
             raise e
 
+    def reset_connection(self):
+        """
+        Reconnects a connection that is out of step with MPD, for use in error handlers.
+        :raise musicpd.ConnectionError: if the reconnect fails, the connection is unusable
+        """
+        try:
+            self.reconnect()
+        except Exception as e:
+            raise musicpd.ConnectionError("could not reset connection to mpd %s:%d: %s" % (self.host, self.port, e)) from e
+
+    def close(self):
+        try:
+            self.mpd_client.disconnect()
+        except Exception as e:
+            self.log.debug("disconnect failed (%s): %s", type(e).__name__, e)
+
     def run_command(self, callback, *args, **kwargs):
         """
         Calls callback(), assuming it is an MPD command. If it fails on connection-related errors, attempt to reconnect
-        to MPD. Keeps trying until the connection and command stop throwing connection-related exceptions or abort on
-        unknown exceptions.
+        to MPD, waiting longer after every failure, see backoff_delay(). Keeps trying until the connection and command
+        stop throwing connection-related exceptions or abort on unknown exceptions. If self.deadline is set, retries
+        stop once it has passed and CommandTimeoutError is raised.
+        A PendingCommandError means the connection is out of step with MPD, it is reset and the error raised. If the
+        reset fails, musicpd.ConnectionError is raised instead.
         :param callback: function to call
         :param args: args for callback
         :param kwargs: args for callback
         :return:
         """
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         try_reconnect = False
         retries = 0
         while True:
             if retries > 0:
-                log.info("retry #%d try_reconnect: %s" % (retries, try_reconnect))
+                self.log.info("retry #%d try_reconnect: %s", retries, try_reconnect)
+            if self.deadline is not None:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandTimeoutError("command timed out after %d retries" % retries)
+                self.mpd_client.socket_timeout = max(1, math.ceil(remaining))
             if try_reconnect:
                 try:
                     self.reconnect()
                     try_reconnect = False
                 except Exception as e:
-                    log.error("reconnect failed (%s): %s" % (type(e).__name__, e))
-                    time.sleep(Constants.reconnect_retry_sleep_secs)
-                    try_reconnect = True
+                    self.log.error("reconnect failed (%s): %s", type(e).__name__, e)
                     retries += 1
+                    self.sleep_before_retry(retries)
+                    try_reconnect = True
                     continue
             try:
-                #log.debug("callback: %s" % callback.__name__)
+                #self.log.debug("callback: %s", callback.__name__)
                 ret = callback(*args, **kwargs)
-                log.debug("callback returned: %s" % ret)
+                self.log.debug("callback returned: %s", ret)
                 return ret
             except (musicpd.ConnectionError, BrokenPipeError, ConnectionResetError, ConnectionError,
-                    ConnectionAbortedError, ConnectionRefusedError) as e:
-                log.error("command failed (%s): %s" % (type(e).__name__, e))
+                    ConnectionAbortedError, ConnectionRefusedError, TimeoutError) as e:
+                self.log.error("command failed (%s): %s", type(e).__name__, e)
                 try_reconnect = True
-                time.sleep(Constants.reconnect_retry_sleep_secs)
                 retries += 1
+                self.sleep_before_retry(retries)
                 continue
             except musicpd.PendingCommandError as e:
-                log.error("PendingCommandError: %s" % e)
-                return []
+                self.log.error("PendingCommandError: %s", e)
+                self.reset_connection()
+                raise e
             except Exception as e:
-                log.error("unhandled exception, type: %s message: %s" % (type(e).__name__, e))
+                self.log.error("unhandled exception, type: %s message: %s", type(e).__name__, e)
                 return None
             #else:
-            #    log.debug("else pass")
+            #    self.log.debug("else pass")
             #finally:
             #    retries += 1
 
+    def sleep_before_retry(self, attempt:int):
+        """
+        Waits before retrying, see backoff_delay(). Never sleeps past self.deadline.
+        """
+        delay = backoff_delay(attempt)
+        if self.deadline is not None:
+            delay = min(delay, max(0, self.deadline - time.monotonic()))
+        time.sleep(delay)
+
+    def command_list(self, commands:list):
+        """
+        Sends several commands in a single command list, so they cost one round trip instead of one each.
+        :param commands: list of tuples, each with the command name followed by its args
+        :return: list with the result of each command, in order
+        """
+        return self.run_command(self._run_command_list, commands)
+
+    def _run_command_list(self, commands:list):
+        self.mpd_client.command_list_ok_begin()
+        try:
+            for c in commands:
+                getattr(self.mpd_client, c[0])(*c[1:])
+        except (musicpd.CommandError, musicpd.CommandListError) as e:
+            ## the command list is half written, start over with a clean connection
+            self.log.error("could not queue command list (%s): %s", type(e).__name__, e)
+            self.reset_connection()
+            raise e
+        return self.mpd_client.command_list_end()
+
     def play_or_pause(self):
         """
         Check the player status, play if stopped, pause otherwise.
@@ -132,7 +205,142 @@ class Client:
         else:
             return self.pause()
 
+class ClientPool:
+    """
+    A fixed number of connections to MPD, shared by the command, status and loader threads so that none of them waits
+    on another one's socket. Connections are opened when first needed, pinged before reuse when they sat unused for a
+    while, since MPD drops idle clients, and replaced when they fail. Failed connects are retried with backoff.
+    """
+    log = logging.getLogger(__name__ + ".ClientPool")
+    def __init__(self, host:str, port:int, size:int=Constants.default_connection_pool_size):
+        self.host = host
+        self.port = port
+        self.size = max(1, size)
+        self.free = []              ## connected Clients not lent out, the most recently used last
+        self.lock = threading.Lock()
+        self.available = threading.Semaphore(self.size)
+        self.connect_failures = 0
+        self.next_connect = 0       ## time.monotonic() value before which no new connection is attempted
+
+    def acquire(self, deadline:float=None):
+        """
+        Lends out a connected Client, opening a new connection if there is no free one.
+        Blocks while all connections are lent out.
+        :param deadline: time.monotonic() value after which CommandTimeoutError is raised, None to wait forever
+        :return: Client, must be given back with release()
+        """
+        timeout = None
+        if deadline is not None:
+            timeout = max(0, deadline - time.monotonic())
+        if not self.available.acquire(timeout=timeout):
+            raise CommandTimeoutError("no free connection to mpd")
+        try:
+            while True:
+                with self.lock:
+                    client = self.free.pop() if self.free else None
+                if client is None:
+                    return self.connect(deadline)
+                if self.check(client):
+                    return client
+                client.close()
+        except Exception as e:
+            self.available.release()
+            raise e
+
+    def release(self, client:Client, reuse:bool=True):
+        """
+        Gives back a Client lent out by acquire().
+        :param reuse: False if the connection may be in an unknown state, it is closed instead of reused
+        """
+        client.deadline = None
+        if reuse:
+            client.mpd_client.socket_timeout = musicpd.SOCKET_TIMEOUT
+            client.last_used = time.monotonic()
+            with self.lock:
+                self.free.append(client)
+        else:
+            client.close()
+        self.available.release()
+
+    @contextlib.contextmanager
+    def client(self, deadline:float=None):
+        """
+        Lends out a Client for a with block. Its commands give up at deadline, see Client.run_command().
+        The connection is closed instead of reused if the block raises, a command may have been cut off halfway.
+        """
+        client = self.acquire(deadline)
+        client.deadline = deadline
+        reuse = False
+        try:
+            yield client
+            reuse = True
+        finally:
+            self.release(client, reuse)
+
+    def run(self, command:str, *args, timeout:float=Constants.command_timeout_secs):
+        """
+        Runs a single command on a pooled connection and waits for the result.
+        :param timeout: seconds before the command is abandoned, None to wait forever
+        """
+        deadline = None
+        if timeout:
+            deadline = time.monotonic() + timeout
+        with self.client(deadline) as client:
+            return getattr(client, command)(*args)
+
+    def check(self, client:Client):
+        """
+        Pings connections that were not used for a while.
+        :return: True if the connection can be used
+        """
+        if time.monotonic() - client.last_used < Constants.connection_check_secs:
+            return True
+        try:
+            client.mpd_client.ping()
+        except Exception as e:
+            self.log.info("dropping stale connection (%s): %s", type(e).__name__, e)
+            return False
+        return True
+
+    def connect(self, deadline:float=None):
+        """
+        Opens a new connection. After a failure, the next attempt waits, longer after every failure in a row, so
+        threads do not hammer an unreachable server.
+        :param deadline: time.monotonic() value after which CommandTimeoutError is raised, None for
+            Constants.connect_timeout_secs from now
+        :return: Client
+        """
+        if deadline is None:
+            deadline = time.monotonic() + Constants.connect_timeout_secs
+        while True:
+            with self.lock:
+                wait = self.next_connect - time.monotonic()
+            if wait > 0:
+                if time.monotonic() + wait > deadline:
+                    raise CommandTimeoutError("could not connect to mpd %s:%d" % (self.host, self.port))
+                time.sleep(wait)
+            try:
+                client = Client(self.host, self.port)
+            except Exception as e:
+                with self.lock:
+                    self.connect_failures += 1
+                    self.next_connect = time.monotonic() + backoff_delay(self.connect_failures)
+                continue
+            with self.lock:
+                self.connect_failures = 0
+            return client
+
+    def close(self):
+        """
+        Closes the free connections, lent out ones are closed when they are given back.
+        """
+        with self.lock:
+            free, self.free = self.free, []
+        for client in free:
+            client.close()
+
 class ClientThread:
+    log = logging.getLogger(__name__ + ".ClientThread")
     def __init__(self, host:str, port:int, queue:queue.Queue=None, name:str=""):
         self.host = host
         self.port = port
@@ -145,21 +353,23 @@ class ClientThread:
             self.thread = threading.Thread(target=self.run, args=(), name=self.name, daemon=True)
             self.thread.start()
         except Exception as e:
-            log.critical("Could not spawn thread '%s': %s" % (self.name, e))
+            self.log.critical("Could not spawn thread '%s': %s", self.name, e)
             raise e
         return self.thread
 
     def run(self):
+        self.connect()
+        self.pre_run()
+        while True:
+            self.one_run()
+
+    def connect(self):
         try:
             self.mpd = Client(self.host, self.port)
         except Exception as e:
-            log.error("client thread '%s' could not connect to host %s at port %d: %s" % (self.name, self.host, self.port, e))
+            self.log.error("client thread '%s' could not connect to host %s at port %d: %s", self.name, self.host, self.port, e)
             raise e
-        log.debug("client thread '%s' connected to mpd %s:%d" % ((self.name, self.host, self.port)))
-
-        self.pre_run()
-        while True:
-            self.one_run()
+        self.log.debug("client thread '%s' connected to mpd %s:%d", self.name, self.host, self.port)
 
     def pre_run(self):
         pass
@@ -167,60 +377,200 @@ class ClientThread:
     def one_run(self):
         pass
 
+class CommandRequest:
+    """
+    A single command queued for a CommandClientThread.
+    command is either the name of a command known to Client, or a callable that takes the Client as its first arg.
+    The result, or the exception raised, is delivered through the future.
+    Requests order by priority, lowest first, then by submission, so a queue.PriorityQueue runs them in that order.
+    """
+    _counter = itertools.count()
+
+    def __init__(self, command, args:tuple=(), kwargs:dict=None, timeout:float=None, priority:int=0):
+        self.command = command
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.deadline = None
+        if timeout:
+            self.deadline = time.monotonic() + timeout
+        self.priority = priority
+        self.sequence = next(self._counter)
+        self.future = concurrent.futures.Future()
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def get_name(self):
+        if callable(self.command):
+            return self.command.__name__
+        return self.command
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+class CommandClientThread(ClientThread):
+    """
+    Runs commands taken from its queue on connections borrowed from a ClientPool, keeping network round trips off the
+    GTK main loop. Requests that were cancelled or expired while waiting in the queue are never sent.
+    """
+    log = logging.getLogger(__name__ + ".CommandClientThread")
+    def __init__(self, pool:ClientPool, queue:queue.Queue=None, name:str=""):
+        self.pool = pool
+        super().__init__(pool.host, pool.port, queue, name)
+
+    def connect(self):
+        """
+        Nothing to do, every request borrows a connection from the pool.
+        """
+        pass
+
+    def submit(self, command, *args, timeout:float=None, priority:int=0, **kwargs):
+        """
+        Queues a command to run in the thread.
+        :param command: name of the MPD command, or a callable accepting the Client and args
+        :param args: args for the command
+        :param timeout: seconds before the command is abandoned, None to wait forever
+        :param priority: requests with a lower priority run first if the queue is a queue.PriorityQueue
+        :param kwargs: args for a callable command
+        :return: concurrent.futures.Future with the command's result
+        """
+        request = CommandRequest(command, args, kwargs, timeout, priority)
+        self.queue.put(request)
+        return request.future
+
+    def one_run(self):
+        request = self.queue.get()
+        if not request.future.set_running_or_notify_cancel():
+            self.log.debug("skipping cancelled command: %s", request.get_name())
+            return
+        if request.expired():
+            self.log.info("command expired in queue: %s", request.get_name())
+            request.future.set_exception(CommandTimeoutError("%s expired before it was sent" % request.get_name()))
+            return
+        try:
+            with self.pool.client(request.deadline) as client:
+                if callable(request.command):
+                    ret = request.command(client, *request.args, **request.kwargs)
+                else:
+                    ret = getattr(client, request.command)(*request.args)
+        except Exception as e:
+            self.log.error("command %s failed (%s): %s", request.get_name(), type(e).__name__, e)
+            request.future.set_exception(e)
+        else:
+            request.future.set_result(ret)
+
 class IdleClientThread(ClientThread):
     """
     Connects to mpd and runs idle commands waiting for notification of state changes.
+    Tracks the playlist version so that playlist changes are sent as plchanges deltas.
     """
+    log = logging.getLogger(__name__ + ".IdleClientThread")
+    def __init__(self, host:str, port:int, queue:queue.Queue=None, name:str="", notify=None):
+        """
+        :param notify: callable run after every queued message, to wake up the consumer of the queue
+        """
+        self.notify = notify
+        super().__init__(host, port, queue, name)
+
+    def put(self, msg:QueueMessage):
+        self.queue.put(msg)
+        if self.notify:
+            self.notify()
+
+    def pre_run(self):
+        """
+        Sends the full playlist once, this is the baseline the following deltas apply to.
+        """
+        self.playlist_version = None
+        self.put_playlist(self.mpd.currentsong())
+
+    def put_playlist(self, currentsong:dict):
+        """
+        Queues a playlist change message, see fetch_playlist(). Nothing is queued if the playlist could not be
+        fetched, the next change sends the full playlist.
+        """
+        msg_data = self.fetch_playlist(currentsong)
+        if msg_data is None:
+            return
+        self.put(QueueMessage(type=Constants.message_type_change, item=Constants.message_item_playlist,
+                              data=msg_data))
+
+    def fetch_playlist(self, currentsong:dict):
+        """
+        Fetches the songs that changed since the last fetch, or the whole playlist on the first run. If the changes
+        can not be fetched, the whole playlist is fetched instead.
+        :param currentsong: current song to pass along with the playlist
+        :return: dict with message data for a playlist change, None if the playlist could not be fetched
+        """
+        status = self.mpd.status()
+        if not status:
+            self.log.error("could not get status, fetching full playlist")
+            self.playlist_version = None
+            songs = self.mpd.playlistinfo()
+            if songs is None:
+                self.log.error("could not fetch the playlist")
+                return None
+            return {"playlist": songs, "current": currentsong, "full": True, "length": len(songs)}
+        full = self.playlist_version is None
+        if not full:
+            self.log.debug("fetching playlist changes from version %s to %s", self.playlist_version, status['playlist'])
+            songs = self.mpd.plchanges(self.playlist_version)
+            if songs is None:
+                self.log.error("could not fetch playlist changes from version %s, fetching full playlist",
+                               self.playlist_version)
+                full = True
+        if full:
+            self.log.debug("fetching full playlist, version: %s", status['playlist'])
+            songs = self.mpd.playlistinfo()
+        if songs is None:
+            ## the changes were not delivered, start over from a full playlist on the next change
+            self.log.error("could not fetch the playlist")
+            self.playlist_version = None
+            return None
+        self.playlist_version = status['playlist']
+        return {"playlist": songs, "current": currentsong, "full": full, "length": int(status['playlistlength'])}
+
     def one_run(self):
         """
         Function that runs in the idle thread created by spawn_idle_thread().
         Listens for changes from MPD, using the idle command.
         Updates UI to idle()
         """
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         try:
-            log.debug("sending idle")
+            self.log.debug("sending idle")
             self.mpd.send_idle()
-            log.debug("idle sent")
+            self.log.debug("idle sent")
             changes = self.mpd.fetch_idle()
-            log.debug("fetched idle")
+            self.log.debug("fetched idle")
         except Exception as e:
-            log.error("idle failed (%s): %s" % (type(e).__name__, e))
+            self.log.error("idle failed (%s): %s", type(e).__name__, e)
             return
 
         else:
-            log.debug("changes: %s" % changes)
+            self.log.debug("changes: %s", changes)
             playlist_refreshed = False
             if not changes or not isinstance(changes, list):
-                log.debug("changes not expected value/type")
+                self.log.debug("changes not expected value/type")
                 return
             for c in changes:
                 if c == "playlist" and not playlist_refreshed:
-                    log.debug("playlist changes")
-                    playlistinfo = self.mpd.playlistinfo()
-                    currentsong = self.mpd.currentsong()
-                    self.queue.put(QueueMessage(type=Constants.message_type_change, item="playlist",
-                                                data={"playlist": playlistinfo, "current": currentsong }))
+                    self.log.debug("playlist changes")
+                    self.put_playlist(self.mpd.currentsong())
                     playlist_refreshed = True
                 elif c == "player":
-                    log.debug("player changes")
+                    self.log.debug("player changes")
                     status = self.mpd.status()
                     currentsong = self.mpd.currentsong()
-                    self.queue.put(QueueMessage(type=Constants.message_type_change, item="player",
-                                                data={"status": status, "current": currentsong }))
-                    if not playlist_refreshed:
-                        playlistinfo = self.mpd.playlistinfo()
-                        self.queue.put(QueueMessage(type=Constants.message_type_change, item="playlist",
-                                                    data={"playlist": playlistinfo, "current": currentsong }))
-                        playlist_refreshed = True
+                    self.put(QueueMessage(type=Constants.message_type_change, item="player",
+                                          data={"status": status, "current": currentsong }))
                 elif c == "database":
-                    log.debug("database changes")
-                    self.queue.put(QueueMessage(type=Constants.message_type_change, item="database"))
+                    self.log.debug("database changes")
+                    self.put(QueueMessage(type=Constants.message_type_change, item="database"))
                 elif c == "outputs":
-                    log.debug("outputs changes")
-                    self.queue.put(QueueMessage(type=Constants.message_type_change, item="outputs"))
+                    self.log.debug("outputs changes")
+                    self.put(QueueMessage(type=Constants.message_type_change, item="outputs"))
                 elif c == "mixer":
-                    log.debug("mixer changes")
-                    self.queue.put(QueueMessage(type=Constants.message_type_change, item="mixer"))
+                    self.log.debug("mixer changes")
+                    self.put(QueueMessage(type=Constants.message_type_change, item="mixer"))
                 else:
-                    log.info("Unhandled change: %s" % c)
+                    self.log.info("Unhandled change: %s", c)
@@ -0,0 +1,297 @@
+import re
+import bisect
+import unicodedata
+import logging
+from .constants import Constants
+from .data import parse_number
+
+log = logging.getLogger(__name__)
+
+token_re = re.compile(r'\w+')
+
+def fold(text:str):
+    """
+    Folds text for matching: accents are dropped and case is folded, so "Björk" matches "bjork".
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join([ c for c in decomposed if not unicodedata.combining(c) ]).casefold()
+
+def tokenize(text:str):
+    """
+    :return: list of the folded words in text
+    """
+    return token_re.findall(fold(text))
+
+def get_text(value):
+    """
+    :param value: tag value, repeated tags come as a list from MPD
+    :return: str with the values of a repeated tag joined, "" if value is None
+    """
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "; ".join([ str(v) for v in value ])
+    return str(value)
+
+def get_search_row(song:dict):
+    """
+    :param song: song metadata as returned by MPD
+    :return: dict with only the metadata the search index keeps. Values of repeated tags are joined, only the first
+             disc and track number is kept.
+    """
+    row = {}
+    for k in Constants.search_row_keys:
+        if k not in song:
+            continue
+        value = song[k]
+        if isinstance(value, list) and k in ('disc', 'track'):
+            value = value[0] if value else None
+        row[k] = get_text(value)
+    return row
+
+def get_sort_key(row:dict):
+    """
+    Sort key for search results: by album artist, album, disc and track.
+    """
+    return (fold(get_text(row.get('albumartist') or row.get('artist'))), fold(get_text(row.get('album'))),
+            parse_number(row.get('disc')), parse_number(row.get('track')), row['file'])
+
+def get_bitmap(ids):
+    """
+    :param ids: iterable of song ids
+    :return: int with the bits of the ids set
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    bitmap = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bitmap[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bitmap, "little")
+
+nonzero_re = re.compile(b'[^\x00]')
+
+def get_ids(bitmap:int, limit:int):
+    """
+    :return: list of the lowest limit song ids set in bitmap, ascending
+    """
+    ids = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for match in nonzero_re.finditer(data):
+        byte = data[match.start()]
+        base = match.start() * 8
+        for bit in range(8):
+            if byte >> bit & 1:
+                ids.append(base + bit)
+        if len(ids) >= limit:
+            return ids[:limit]
+    return ids
+
+class SearchIndex:
+    """
+    In-memory inverted index over the songs of the library, for search as you type without asking MPD.
+    Every folded word of the indexed tags maps to the ids of the songs containing it. A query matches the songs that
+    have, for each of its words, a word starting with it.
+    The songs matching a prefix are kept as a bitmap in an int, so the words of a query are combined with a few
+    bitwise ands, and the results come out in id order, which is the sort order of the library. Words are kept sorted,
+    the words with a prefix are found by bisection. To keep short prefixes cheap, the bitmaps of single letters and
+    of words in many songs are kept up to date, the other prefixes are cached until the index changes.
+    Not thread safe. It is built on a loader thread and only used and updated on the main loop after that.
+    """
+    log = logging.getLogger(__name__ + ".SearchIndex")
+    def __init__(self, rows:list=None):
+        """
+        :param rows: list of song metadata dicts, see get_search_row()
+        """
+        self.rows = []              ## song id -> row, None for removed songs
+        self.ids = {}               ## file -> song id
+        self.postings = {}          ## word -> set of song ids
+        self.words = []             ## sorted words
+        self.letters = {}           ## first letter of words -> bitmap
+        self.bitmaps = {}           ## frequent word -> bitmap
+        self._prefix_cache = {}     ## prefix -> bitmap
+        if rows:
+            self.build(rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, rows:list):
+        """
+        Indexes rows in bulk. Song ids follow the sort order of the rows, so results come out sorted.
+        """
+        rows = sorted(rows, key=get_sort_key)
+        folded = {}     ## tag values repeat a lot, fold each one once
+        for row in rows:
+            song_id = len(self.rows)
+            self.rows.append(row)
+            self.ids[row['file']] = song_id
+            for word in self.get_words(row, folded):
+                postings = self.postings.get(word)
+                if postings is None:
+                    self.postings[word] = { song_id }
+                else:
+                    postings.add(song_id)
+        self.words = sorted(self.postings)
+        ## songs per first letter, and bitmaps of the words in a good part of the library
+        letters = {}
+        min_postings = max(Constants.search_bitmap_min_songs, len(rows) // Constants.search_bitmap_fraction)
+        for word, postings in self.postings.items():
+            letters.setdefault(word[0], set()).update(postings)
+            if len(postings) >= min_postings:
+                self.bitmaps[word] = get_bitmap(postings)
+        for letter, ids in letters.items():
+            self.letters[letter] = get_bitmap(ids)
+        self._prefix_cache.clear()
+        self.log.info("indexed %d songs, %d words", len(self.ids), len(self.words))
+
+    def get_words(self, row:dict, folded:dict=None):
+        """
+        :param folded: dict caching the words of tag values
+        :return: set of the words in the indexed tags of row
+        """
+        words = set()
+        for key in Constants.search_index_keys:
+            value = row.get(key)
+            if not value:
+                continue
+            if isinstance(value, list):
+                value = " ".join(value)
+            if folded is None:
+                words.update(tokenize(value))
+                continue
+            value_words = folded.get(value)
+            if value_words is None:
+                value_words = folded[value] = tokenize(value)
+            words.update(value_words)
+        return words
+
+    def add(self, row:dict):
+        """
+        Indexes a song, replacing it if it is already indexed. It sorts after the songs of the bulk build.
+        """
+        self.remove(row['file'])
+        song_id = len(self.rows)
+        self.rows.append(row)
+        self.ids[row['file']] = song_id
+        bit = 1 << song_id
+        words = self.get_words(row)
+        for word in words:
+            postings = self.postings.get(word)
+            if postings is None:
+                self.postings[word] = { song_id }
+                bisect.insort(self.words, word)
+            else:
+                postings.add(song_id)
+            if word in self.bitmaps:
+                self.bitmaps[word] |= bit
+        for letter in set([ w[0] for w in words ]):
+            self.letters[letter] = self.letters.get(letter, 0) | bit
+        self._prefix_cache.clear()
+
+    def remove(self, file:str):
+        """
+        Drops a song from the index.
+        :return: True if the song was indexed
+        """
+        song_id = self.ids.pop(file, None)
+        if song_id is None:
+            return False
+        bit = 1 << song_id
+        words = self.get_words(self.rows[song_id])
+        for word in words:
+            postings = self.postings[word]
+            postings.discard(song_id)
+            if not postings:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+                self.bitmaps.pop(word, None)
+            elif word in self.bitmaps:
+                self.bitmaps[word] &= ~bit
+        for letter in set([ w[0] for w in words ]):
+            self.letters[letter] &= ~bit
+        self.rows[song_id] = None
+        self._prefix_cache.clear()
+        return True
+
+    def diff(self, rows:list):
+        """
+        Compares the index with a fresh listing of the library. Only reads the index, so it can run on a loader
+        thread while the main loop keeps searching.
+        :param rows: list of song metadata dicts, see get_search_row()
+        :return: tuple of (list of new or changed rows, list of files of removed songs)
+        """
+        changed = []
+        files = set()
+        for row in rows:
+            files.add(row['file'])
+            song_id = self.ids.get(row['file'])
+            if song_id is None or self.rows[song_id] != row:
+                changed.append(row)
+        removed = [ f for f in list(self.ids) if f not in files ]
+        return changed, removed
+
+    def needs_rebuild(self, changed:list, removed:list):
+        """
+        Tells if the result of diff() is better served by building a new index than by applying it. Applying runs on
+        the main loop and costs a fraction of a millisecond per song, and every changed or removed song leaves an
+        unused id behind.
+        :return: True if there are many changes, or if the unused ids would make up a large part of the index
+        """
+        n_changes = len(changed) + len(removed)
+        if n_changes > Constants.search_apply_max_changes:
+            return True
+        n_unused = len(self.rows) - len(self.ids) + n_changes
+        return n_unused * Constants.search_compact_fraction > len(self.rows) + len(changed)
+
+    def apply(self, changed:list, removed:list):
+        """
+        Applies the result of diff().
+        """
+        for file in removed:
+            self.remove(file)
+        for row in changed:
+            self.add(row)
+        self.log.info("index updated: %d songs changed, %d removed", len(changed), len(removed))
+
+    def match_prefix(self, prefix:str):
+        """
+        :param prefix: folded word or start of a word
+        :return: bitmap of the songs with a word starting with prefix
+        """
+        if len(prefix) == 1:
+            return self.letters.get(prefix, 0)
+        bitmap = self._prefix_cache.get(prefix)
+        if bitmap is not None:
+            return bitmap
+        bitmap = 0
+        ids = []
+        i = bisect.bisect_left(self.words, prefix)
+        while i < len(self.words) and self.words[i].startswith(prefix):
+            word = self.words[i]
+            if word in self.bitmaps:
+                bitmap |= self.bitmaps[word]
+            else:
+                ids.extend(self.postings[word])
+            i += 1
+        bitmap |= get_bitmap(ids)
+        if len(self._prefix_cache) >= Constants.search_prefix_cache_size:
+            self._prefix_cache.clear()
+        self._prefix_cache[prefix] = bitmap
+        return bitmap
+
+    def search(self, text:str, limit:int=Constants.search_result_limit):
+        """
+        :param text: query as typed
+        :param limit: maximum number of rows to return
+        :return: tuple of (list of matching rows in sort order, total number of matches)
+        """
+        words = tokenize(text)
+        if not words:
+            return [], 0
+        bitmap = -1
+        for word in set(words):
+            bitmap &= self.match_prefix(word)
+            if not bitmap:
+                return [], 0
+        return [ self.rows[i] for i in get_ids(bitmap, limit) ], bitmap.bit_count()
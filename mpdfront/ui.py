@@ -1,11 +1,9 @@
 import configparser
-import re, os, html, inspect
+import re, os, html
+import time
 import logging
-import mutagen
-from mutagen.flac import FLAC
-from mutagen.mp4 import MP4
 import gi
-from . import data
+from . import data, alsa
 from .constants import Constants
 
 gi.require_version("Gtk", "4.0")
@@ -27,6 +25,7 @@ def pp_file_format(format:str):
     return "%.1fkHz %s bits %s channels" % (rate, s[1], s[2])
 
 class KeyPressedReceiver(Gtk.Widget):
+    log = logging.getLogger(__name__ + ".KeyPressedReceiver")
     @property
     def key_pressed_callbacks(self):
         if not hasattr(self, '_key_pressed_callbacks'):
@@ -72,24 +71,23 @@ class KeyPressedReceiver(Gtk.Widget):
         """
         Keypress handler for toplevel widget. Responds to global keys for playback control.
         """
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         ctrl_pressed = state & Gdk.ModifierType.CONTROL_MASK
         meta_pressed = state & Gdk.ModifierType.META_MASK   ## Cmd
         alt_pressed = state & Gdk.ModifierType.ALT_MASK
         shift_pressed = state & Gdk.ModifierType.SHIFT_MASK
 
         ## Attempt to run the pre-defined callback.
-        log.debug("Key pressed: 0x%x, 0x%x" % (keyval, keycode))
+        self.log.debug("Key pressed: 0x%x, 0x%x", keyval, keycode)
         try:
             tup = None
             if meta_pressed:
-                log.debug("meta modifier pressed")
+                self.log.debug("meta modifier pressed")
                 tup = self.key_pressed_callbacks_mod_meta.get(keyval)
             elif ctrl_pressed:
-                log.debug("ctrl meta modifier pressed")
+                self.log.debug("ctrl meta modifier pressed")
                 tup = self.key_pressed_callbacks_mod_ctrl.get(keyval)
             elif alt_pressed:
-                log.debug("alt meta modifier pressed")
+                self.log.debug("alt meta modifier pressed")
                 tup = self.key_pressed_callbacks_mod_alt.get(keyval)
             else:
                 tup = self.key_pressed_callbacks.get(keyval)
@@ -99,41 +97,40 @@ class KeyPressedReceiver(Gtk.Widget):
                 if len(tup) >= 2:
                     cb_args = tup[1]
                 if callback:
-                    log.debug("calling : %s" % callback)
-                    log.debug("with args: %s" % (cb_args,))
+                    self.log.debug("calling : %s", callback)
+                    self.log.debug("with args: %s", cb_args)
                     if cb_args and isinstance(cb_args, tuple) and len(cb_args):
-                        log.debug("calling with args")
+                        self.log.debug("calling with args")
                         callback(*cb_args)
                     else:
-                        log.debug("calling with no args")
+                        self.log.debug("calling with no args")
                         callback()
             else:
-                log.debug("no action defined for keyval: 0x%x" % keyval)
+                self.log.debug("no action defined for keyval: 0x%x", keyval)
         except KeyError as e:
-            log.debug("KeyError on callback: %s" % e)
+            self.log.debug("KeyError on callback: %s", e)
         except Exception as e:
-            log.error("could not call callback (%s): %s" % (type(e).__name__, e))
+            self.log.error("could not call callback (%s): %s", type(e).__name__, e)
 
     def add_config_keys(self, callbacks:dict, addition:dict, config:configparser):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         for k in addition:
-            log.debug("callback key:%s, value:%s" % (k, addition.get(k)))
+            self.log.debug("callback key:%s, value:%s", k, addition.get(k))
             if config.has_option(*k):
-                log.debug("option exists")
+                self.log.debug("option exists")
                 callbacks[ord(config.get(*k))] = addition[k]
-        log.debug("keypress callbacks: %s" % callbacks)
+        self.log.debug("keypress callbacks: %s", callbacks)
 
 class SongInfoDialog(Gtk.Window):
+    log = logging.getLogger(__name__ + ".SongInfoDialog")
     def __init__(self, window:Gtk.Window, node:data.ContentTreeNode, *args, **kwargs):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         super().__init__(title=Constants.songinfo_title, *args, **kwargs)
         self._builder = Gtk.Builder.new_from_file(Constants.ui_xml_songinfo)
         if not self._builder:
-            log.error("could not create builder")
+            self.log.error("could not create builder")
             return
         main_box = self._builder.get_object('main-box')
         if not main_box:
-            log.error("main_box is None")
+            self.log.error("main_box is None")
             return
         self.set_child(main_box)
         self.set_transient_for(window)
@@ -141,44 +138,44 @@ class SongInfoDialog(Gtk.Window):
         self.set_vexpand(False)
         self.set_default_size(100, 100)
 
-        song = node.get_metadata()
-        log.debug("song: %s" % song)
-        if 'title' in song:
-            self._builder.get_object('songtitle').set_label(song['title'])
-        if 'artist' in song:
-            self._builder.get_object('artist-label').set_label(song['artist'])
-        if 'albumartist' in song:
-            self._builder.get_object('albumartist-label').set_label(song['albumartist'])
+        tag = node.get_metadata
+        self.log.debug("song: %s", node)
+        if tag('title') is not None:
+            self._builder.get_object('songtitle').set_label(tag('title'))
+        if tag('artist') is not None:
+            self._builder.get_object('artist-label').set_label(tag('artist'))
+        if tag('albumartist') is not None:
+            self._builder.get_object('albumartist-label').set_label(tag('albumartist'))
         else:
             self._builder.get_object('albumartist-title').set_visible(False)
             self._builder.get_object('albumartist-label').set_visible(False)
-        if 'album' in song:
-            self._builder.get_object('album-label').set_label(song['album'])
-        if 'time' in song:
-            self._builder.get_object('time-label').set_label(pp_time(song['time']))
-        if 'track' in song:
-            self._builder.get_object('track-label').set_label(song['track'])
-        if 'date' in song:
-            self._builder.get_object('date-label').set_label(song['date'])
+        if tag('album') is not None:
+            self._builder.get_object('album-label').set_label(tag('album'))
+        if tag('time') is not None:
+            self._builder.get_object('time-label').set_label(pp_time(tag('time')))
+        if tag('track') is not None:
+            self._builder.get_object('track-label').set_label(tag('track'))
+        if tag('date') is not None:
+            self._builder.get_object('date-label').set_label(tag('date'))
         else:
             self._builder.get_object('date-title').set_visible(False)
             self._builder.get_object('date-label').set_visible(False)
-        if 'genre' in song:
-            self._builder.get_object('genre-label').set_label(song['genre'])
+        if tag('genre') is not None:
+            self._builder.get_object('genre-label').set_label(tag('genre'))
         else:
-            self._builder.get_object('genre-title').set_label(song['genre'])
-            self._builder.get_object('genre-label').set_label(song['genre'])
-        if 'composer' in song:
-            self._builder.get_object('composer-label').set_label(song['composer'])
+            self._builder.get_object('genre-title').set_visible(False)
+            self._builder.get_object('genre-label').set_visible(False)
+        if tag('composer') is not None:
+            self._builder.get_object('composer-label').set_label(tag('composer'))
         else:
             self._builder.get_object('composer-title').set_visible(False)
             self._builder.get_object('composer-label').set_visible(False)
-        if 'format' in song:
-            self._builder.get_object('format-label').set_label(pp_file_format(song['format']))
-        if 'file' in song:
-            self._builder.get_object('file-label').set_label(song['file'])
-        if 'disc' in song:
-            self._builder.get_object('disc-label').set_label(song['disc'])
+        if tag('format') is not None:
+            self._builder.get_object('format-label').set_label(pp_file_format(tag('format')))
+        if tag('file') is not None:
+            self._builder.get_object('file-label').set_label(tag('file'))
+        if tag('disc') is not None:
+            self._builder.get_object('disc-label').set_label(tag('disc'))
         else:
             self._builder.get_object('disc-title').set_visible(False)
             self._builder.get_object('disc-label').set_visible(False)
@@ -252,6 +249,7 @@ class OutputsDialog(Gtk.Dialog):
     Display dialog with list of outputs as individual CheckButtons. These are outputs defined in MPD.
     Button click events are handled by a callback function passed to __init__.
     """
+    log = logging.getLogger(__name__ + ".OutputsDialog")
     def __init__(self, parent, button_pressed_callback, *args, **kwargs):
         """
         :param parent: parent window
@@ -266,7 +264,7 @@ class OutputsDialog(Gtk.Dialog):
         self.set_name("outputs-dialog")
         self.get_content_area().set_size_request(300, 200)
         for o in parent.app.mpd_outputs:
-            log.debug("output: %s" % o)
+            self.log.debug("output: %s", o)
             button = Gtk.CheckButton.new_with_label(o['outputname'])
             button.set_active(int(o['outputenabled']))
             self.get_content_area().append(button)
@@ -332,6 +330,7 @@ class PlaylistConfirmDialog(Gtk.Dialog):
         self.add_button(self._button_text_add, Constants.playlist_confirm_reponse_add)
         self.add_button(self._button_text_replace, Constants.playlist_confirm_reponse_replace)
         self.add_button(self._button_text_cancel, Constants.playlist_confirm_reponse_cancel)
+        self.add_item = add_item
         self.get_content_area().append(Gtk.Label(label="Selected: " + add_item.metaname))
         self.get_content_area().set_size_request(300, 100)
 
@@ -341,7 +340,10 @@ class PlaylistEditDialog(Gtk.Dialog):
     _button_text_down       = "Down"
     _button_text_delete     = "Delete"
     _button_text_cancel     = "Cancel"
-    def __init__(self, parent, song, *args, **kwargs):
+    def __init__(self, parent, song:data.ContentTreeNode, *args, **kwargs):
+        """
+        :param song: node of the playlist row to edit
+        """
         super().__init__(title="Edit playlist", *args, **kwargs)
         self.set_transient_for(parent)
         self.set_modal(True)
@@ -352,10 +354,8 @@ class PlaylistEditDialog(Gtk.Dialog):
                              (self._button_text_delete, Constants.playlist_edit_response_delete), 
                              (self._button_text_cancel, Constants.playlist_confirm_reponse_cancel)):
             self.add_button(tup[0], tup[1])
-        if 'title' in song:
-            self.get_content_area().append(Gtk.Label(label="Edit: " + song['title']))
-        else:
-            self.get_content_area().append(Gtk.Label(label="Edit: " + song['file']))
+        self.get_content_area().append(Gtk.Label(label="Edit: " + (song.get_metadata('title') or
+                                                                    song.get_metadata('file'))))
         self.get_content_area().set_size_request(300, 100)
 
 class ContentTreeLabel(Gtk.Label):
@@ -372,14 +372,14 @@ class ContentTreeLabel(Gtk.Label):
         return self._node
     node = property(fget=get_node, fset=set_node)
 
-class IndexedListBox(Gtk.ListBox):
+class IndexedListView(Gtk.ListView):
     """
-    Gtk.ListBox with an index variable. This allows ListBoxes to track their position in list of ListBoxes.
+    Gtk.ListView with an index variable. This allows ListViews to track their position in list of ListViews.
     """
     def set_index(self, index):
         """
-        Sets the index of the ListBox
-        :param index:  int, the ListBox's position in the parent's list
+        Sets the index of the ListView
+        :param index:  int, the ListView's position in the parent's list
         """
         self._index = index
 
@@ -390,11 +390,27 @@ class IndexedListBox(Gtk.ListBox):
 
     index = property(fget=get_index, fset=set_index)
 
+def new_selection(model:Gio.ListModel=None):
+    """
+    :param model: list model to select from
+    :return: Gtk.SingleSelection that starts with nothing selected
+    """
+    selection = Gtk.SingleSelection.new(model)
+    selection.set_autoselect(False)
+    selection.set_can_unselect(True)
+    selection.set_selected(Gtk.INVALID_LIST_POSITION)
+    return selection
+
 class ColumnBrowser(Gtk.Box, KeyPressedReceiver):
     """
     Column browser for a tree data structure. Inherits from GtkBox.
-    Creates columns with a list of GtkScrolledWindows containing a GtkListBox.
+    Creates columns with a list of GtkScrolledWindows containing a GtkListView.
+    The list views only create row widgets for the visible rows and recycle them while scrolling.
+    Children of a selected row are loaded once the cursor rests on it for Constants.browser_load_delay, loads for rows
+    the cursor left are cancelled, so scrolling through a column does not queue a load per row. The rows around it
+    are prefetched then, see MpdFrontApp.prefetch_neighbour_content().
     """
+    log = logging.getLogger(__name__ + ".ColumnBrowser")
     def __init__(self, parent:Gtk.Window, app:Gtk.Application, content_tree:Gio.ListStore, cols=2, spacing=0, hexpand=True, vexpand=True, *args, **kwargs):
         """
         Constructor for the column browser.
@@ -416,108 +432,378 @@ class ColumnBrowser(Gtk.Box, KeyPressedReceiver):
         self.set_spacing(spacing)
         self.num_columns = cols
         self._columns = []
+        self._selected_nodes = [ None ] * cols     ## node selected in each column, to ignore moves of the same node
+        self._column_loads = [ None ] * cols       ## (node, future) of the load started from each column
+        self._load_timeout_id = None
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_factory_setup)
+        factory.connect("bind", self.on_factory_bind)
+        factory.connect("unbind", self.on_factory_unbind)
         ## Initialize the columns
         for i in range(0, cols):
             scroll = Gtk.ScrolledWindow()
-            listbox = IndexedListBox()
-            listbox.set_hexpand(hexpand)
-            listbox.set_vexpand(vexpand)
-            listbox.index = i
-            listbox.connect("row-selected", self.on_row_selected)
-            #listbox.connect("row-activated", self.on_row_activated)
-            scroll.set_child(listbox)
+            listview = IndexedListView()
+            listview.set_factory(factory)
+            listview.set_hexpand(hexpand)
+            listview.set_vexpand(vexpand)
+            listview.index = i
+            listview.connect("activate", self.on_row_activated)
+            scroll.set_child(listview)
             self.append(scroll)
-            self._columns.append(listbox)
+            self._columns.append(listview)
         ## Initialize data in 1st column
-        self._columns[0].bind_model(model=content_tree, create_widget_func=self.create_list_label)
+        self.set_column_model(0, content_tree)
+
+        ## in jump mode, letter and digit keys jump to the first row starting with them, see on_key_pressed()
+        self.jump_mode = False
+        self.jump_keyval = None
+        if self.app.config.has_option(Constants.config_section_keys, "jump"):
+            self.jump_keyval = ord(self.app.config.get(Constants.config_section_keys, "jump"))
+        self.root_jump_index = data.JumpIndex([ content_tree.get_item(i) for i in range(content_tree.get_n_items()) ])
 
         self.set_key_pressed_controller()
-        self.key_pressed_callbacks = {
-            Gdk.KEY_Return:     (self.parent.add_to_playlist,),
-        }
+        ## Return is handled by the list views' activate signal, see on_row_activated()
+        self.key_pressed_callbacks = {}
         callback_config_tuples = {
             (Constants.config_section_keys, "info"):       (self.info_popup,),
+            (Constants.config_section_keys, "jump"):       (self.toggle_jump_mode,),
         }
         self.add_config_keys(self.key_pressed_callbacks, callback_config_tuples, self.app.config)
 
-    def get_last_selected_row(self):
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
+    def on_key_pressed(self, controller, keyval, keycode, state):
+        """
+        In jump mode, letters and digits jump in the focused column and are not passed on to the window.
+        Escape and the jump key leave jump mode.
+        """
+        if not self.jump_mode or state & (Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.META_MASK |
+                                          Gdk.ModifierType.ALT_MASK):
+            return super().on_key_pressed(controller, keyval, keycode, state)
+        if keyval in (Gdk.KEY_Escape, self.jump_keyval):
+            self.toggle_jump_mode()
+            return True
+        char = chr(Gdk.keyval_to_unicode(keyval))
+        if not char.isalnum():
+            return super().on_key_pressed(controller, keyval, keycode, state)
+        self.jump_to(char.casefold())
+        return True
+
+    def toggle_jump_mode(self):
+        self.jump_mode = not self.jump_mode
+        self.log.debug("jump mode: %s", self.jump_mode)
+        if self.jump_mode:
+            self.add_css_class("jump-mode")
+        else:
+            self.remove_css_class("jump-mode")
+
+    def get_focused_index(self):
+        """
+        :return: index of the column with the keyboard focus, None if no column has it
+        """
+        focus_child = self.get_focus_child()
+        for i, listview in enumerate(self._columns):
+            if listview.get_parent() is focus_child:
+                return i
+        return None
+
+    def jump_to(self, char:str):
+        """
+        Selects the first row of the focused column starting with char, or with the next character that has any.
+        Only the row jumped to is selected, so only its children are loaded.
+        """
+        index = self.get_focused_index()
+        if index is None:
+            return
+        if index == 0:
+            jump_index = self.root_jump_index
+        else:
+            jump_index = self._selected_nodes[index-1].jump_index if self._selected_nodes[index-1] else None
+        if not jump_index:
+            self.log.debug("column %d has no jump index", index)
+            return
+        position = jump_index.find(char)
+        if position is None:
+            return
+        listview = self._columns[index]
+        listview.get_model().set_selected(position)
+        listview.scroll_to(position, Gtk.ListScrollFlags.FOCUS, None)
+
+    def set_column_model(self, index:int, model:Gio.ListModel=None):
+        """
+        Shows a layer of the content tree in a column, with nothing selected.
+        :param index: index of the column
+        :param model: child layer of a node, None to clear the column
+        """
+        self._selected_nodes[index] = None
+        if model is None:
+            self._columns[index].set_model(None)
+            return
+        selection = new_selection(model)
+        selection.connect("notify::selected", self.on_row_selected, index)
+        self._columns[index].set_model(selection)
+
+    def get_bound_nodes(self):
+        """
+        :return: set of the nodes selected in the columns, their child layers are shown or about to be
+        """
+        return set([ n for n in self._selected_nodes if n ])
+
+    def get_last_selected_index(self):
+        """
+        :return: index of the right-most column with a selected row, None if nothing is selected
+        """
         for i in range(self.num_columns-1, -1, -1):
-            row = self._columns[i].get_selected_row()
-            if not row:
-                log.debug("no selected row: %d" % i)
+            selection = self._columns[i].get_model()
+            if not selection or selection.get_selected() == Gtk.INVALID_LIST_POSITION:
+                self.log.debug("no selected row: %d", i)
                 continue
-            return row
+            return i
+        return None
+
+    def get_selected_node(self):
+        """
+        :return: node of the selected row in the right-most column with a selection, None if nothing is selected
+        """
+        index = self.get_last_selected_index()
+        if index is None:
+            return None
+        return self._columns[index].get_model().get_selected_item()
 
-    def create_list_label(self, node):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        label = ContentTreeLabel(label=node.metaname, node=node)
+    def focus_selected(self):
+        """
+        Moves the keyboard focus to the selected row of the right-most column with a selection.
+        """
+        index = self.get_last_selected_index()
+        if index is None:
+            self._columns[0].grab_focus()
+            return
+        listview = self._columns[index]
+        listview.scroll_to(listview.get_model().get_selected(), Gtk.ListScrollFlags.FOCUS, None)
+
+    def on_factory_setup(self, factory, list_item):
+        label = ContentTreeLabel()
         label.set_halign(Gtk.Align.START)
         label.set_valign(Gtk.Align.START)
-        log.debug("returning label for: %s" % label.get_label())
-        return label
-
-    def on_row_selected(self, listbox, row):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("row selected args: %s, %s" % (listbox, row))
-        if not row:
-            log.debug("row is None")
-            return
-        label = row.get_child()
-        if not label:
-            log.error("label is None")
+        list_item.set_child(label)
+
+    def on_factory_bind(self, factory, list_item):
+        label = list_item.get_child()
+        label.node = list_item.get_item()
+        label.set_label(label.node.metaname or "")
+
+    def on_factory_unbind(self, factory, list_item):
+        list_item.get_child().node = None
+
+    def on_row_selected(self, selection, pspec, index:int):
+        node = selection.get_selected_item()
+        if node is self._selected_nodes[index]:
+            ## same node, only its position changed
             return
-        node = label.node
+        self._selected_nodes[index] = node
+        ## the rows passed over while scrolling are not loaded
+        self.cancel_loads(index)
+        ## clear out all columns to the right
+        for i in range(index+1, self.num_columns):
+            self.set_column_model(i, None)
         if not node:
-            log.error("node is None")
+            self.log.debug("no row selected in column: %d", index)
             return
-        log.debug("row selected: %s %s" % (node.metatype, node.get_metadata()))
-        ## clear out all columns to the right
-        for i in range(listbox.get_index()+1, self.num_columns):
-            self._columns[i].bind_model(model=None, create_widget_func=None)
-        ## load and show the next column to the right based on the current column
-        self.app.load_content_data(node=node)
-        if node.metatype not in (Constants.node_t_song, Constants.node_t_file) and listbox.get_index() < self.num_columns-1:
-            self._columns[listbox.get_index()+1].bind_model(model=node.get_child_layer(), create_widget_func=self.create_list_label)
-
-    def on_row_activated(self, listbox, listboxrow):
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
-        try:
-            label = listboxrow.get_child()
-            if label.metatype in ('song', 'album'):
-                self.parent.add_to_playlist()
-        except Exception as e:
-            log.error("error on row_activated (%s): %s" % (type(e).__name__, e))
+        self.log.debug("row selected: %s", node)
+        if node.metatype == Constants.node_t_placeholder:
+            return
+        shown = node.loaded or node.loading
+        if shown:
+            self.show_children(index, node)
+        ## load, and prefetch the rows around, once the cursor rests on the row
+        self._load_timeout_id = GLib.timeout_add(Constants.browser_load_delay, self.on_load_timeout, index, node,
+                                                 shown)
+
+    def on_load_timeout(self, index:int, node:data.ContentTreeNode, shown:bool):
+        self._load_timeout_id = None
+        if node is not self._selected_nodes[index]:
+            return False
+        if not shown:
+            self.show_children(index, node)
+        selection = self._columns[index].get_model()
+        self.app.prefetch_neighbour_content(selection.get_model(), selection.get_selected())
+        return False
+
+    def show_children(self, index:int, node:data.ContentTreeNode):
+        """
+        Loads the children of the node selected in a column in the background and shows them in the next column.
+        """
+        future = self.app.load_content_data(node=node)
+        if future:
+            self._column_loads[index] = (node, future)
+        if node.metatype not in (Constants.node_t_song, Constants.node_t_file) and index < self.num_columns-1:
+            self.set_column_model(index+1, node.get_child_layer())
+
+    def cancel_loads(self, index:int):
+        """
+        Drops the pending load, and cancels the loads started from a column and the columns to its right that are
+        still waiting for a loader thread.
+        """
+        if self._load_timeout_id:
+            GLib.source_remove(self._load_timeout_id)
+            self._load_timeout_id = None
+        for i in range(index, self.num_columns):
+            if self._column_loads[i]:
+                self.app.cancel_content_load(*self._column_loads[i])
+                self._column_loads[i] = None
+
+    def on_row_activated(self, listview, position):
+        """
+        Handles Return and double-clicks on a row.
+        """
+        self.parent.add_to_playlist()
 
     def info_popup(self):
         """
         Call SongInfoDialog to display the song data from the selected browser row
         """
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        selected = self.get_last_selected_row()
-        if not selected:
-            log.error("no row selected")
-            return
-        log.debug("selected: %s" % selected)
-        label = selected.get_child()
-        if not label and not isinstance(label, ContentTreeLabel):
-            log.error("ColumnBrowser selected row child is of type: %s" % type(selected.get_child()).__name__)
+        node = self.get_selected_node()
+        if not node:
+            self.log.error("no row selected")
             return
-        log.debug("song info: %s" % label.node.get_metadata())
-        if not label.node.metatype in (Constants.node_t_song, Constants.node_t_file):
-            log.debug("not showing info popup for type: %s" % label.node.metatype)
+        self.log.debug("song info: %s", node)
+        if not node.metatype in (Constants.node_t_song, Constants.node_t_file):
+            self.log.debug("not showing info popup for type: %s", node.metatype)
             return
-        dialog = SongInfoDialog(self.parent, label.node)
+        dialog = SongInfoDialog(self.parent, node)
         dialog.show()
 
+class SearchPanel(Gtk.Box, KeyPressedReceiver):
+    """
+    Search entry with a list of the matching songs, answered from the application's search index as you type.
+    Return in the entry or on a result adds the song to the playlist, Down moves from the entry to the results and
+    Escape goes back to the browser.
+    """
+    log = logging.getLogger(__name__ + ".SearchPanel")
+    def __init__(self, parent:Gtk.Window, app:Gtk.Application, *args, **kwargs):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, *args, **kwargs)
+        self.parent = parent
+        self.app = app
+        self.entry = Gtk.SearchEntry()
+        self.entry.set_name("searchentry")
+        ## "changed" runs on every keystroke, "search-changed" would wait for a pause in typing
+        self.entry.connect("changed", self.on_search_changed)
+        self.entry.connect("activate", self.on_entry_activated)
+        self.entry.connect("stop-search", self.on_stop_search)
+        self.append(self.entry)
+        self.status = Gtk.Label()
+        self.status.set_halign(Gtk.Align.START)
+        self.append(self.status)
+
+        self.liststore = Gio.ListStore()
+        self.selection = new_selection(self.liststore)
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_factory_setup)
+        factory.connect("bind", self.on_factory_bind)
+        factory.connect("unbind", self.on_factory_unbind)
+        self.listview = Gtk.ListView(model=self.selection, factory=factory)
+        self.listview.set_vexpand(True)
+        self.listview.connect("activate", self.on_row_activated)
+        scroll = Gtk.ScrolledWindow()
+        scroll.set_child(self.listview)
+        self.append(scroll)
+
+        self.set_key_pressed_controller()
+        self.key_pressed_callbacks = {
+            Gdk.KEY_Down:       (self.focus_results,),
+        }
+
+    def start(self):
+        """
+        Focuses the entry and shows the results of the query in it. The search index is built the first time.
+        """
+        self.app.load_search_index()
+        self.entry.grab_focus()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Runs the query in the entry again, after the index changed.
+        """
+        self.on_search_changed(self.entry)
+
+    def on_search_changed(self, entry):
+        text = entry.get_text()
+        index = self.app.search_index
+        if index is None:
+            self.liststore.remove_all()
+            self.status.set_label("Search index is loading..." if text else "")
+            return
+        rows, total = index.search(text)
+        nodes = [ data.ContentTreeNode(metadata=self.get_node_metadata(r)) for r in rows ]
+        self.liststore.splice(0, self.liststore.get_n_items(), nodes)
+        if not text.strip():
+            self.status.set_label("")
+        elif total > len(rows):
+            self.status.set_label("%d of %d songs" % (len(rows), total))
+        else:
+            self.status.set_label("%d songs" % total)
+
+    def get_node_metadata(self, row:dict):
+        metadata = dict(row)
+        metadata['type'] = Constants.node_t_song
+        metadata['name'] = " - ".join([ str(row.get(k)) for k in ('artist', 'album', 'title') if row.get(k) ])
+        return metadata
+
+    def get_selected_node(self):
+        return self.selection.get_selected_item()
+
+    def focus_results(self):
+        if not self.liststore.get_n_items() or self.get_focus_child() is not self.entry:
+            return
+        position = self.selection.get_selected()
+        if position == Gtk.INVALID_LIST_POSITION:
+            position = 0
+            self.selection.set_selected(position)
+        self.listview.scroll_to(position, Gtk.ListScrollFlags.FOCUS, None)
+
+    def on_factory_setup(self, factory, list_item):
+        label = ContentTreeLabel()
+        label.set_halign(Gtk.Align.START)
+        label.set_valign(Gtk.Align.START)
+        list_item.set_child(label)
+
+    def on_factory_bind(self, factory, list_item):
+        label = list_item.get_child()
+        label.node = list_item.get_item()
+        label.set_label(label.node.metaname or "")
+
+    def on_factory_unbind(self, factory, list_item):
+        list_item.get_child().node = None
+
+    def on_entry_activated(self, entry):
+        """
+        Return in the entry adds the selected result, or the first one.
+        """
+        node = self.get_selected_node()
+        if not node and self.liststore.get_n_items():
+            node = self.liststore.get_item(0)
+        if node:
+            self.parent.add_to_playlist(node)
+
+    def on_row_activated(self, listview, position):
+        self.parent.add_to_playlist(self.liststore.get_item(position))
+
+    def on_stop_search(self, entry):
+        self.parent.event_focus_browser()
+
 class PlaybackDisplay(Gtk.Grid):
-    def __init__(self, parent:Gtk.Window, app:Gtk.Application, sound_card:int=None, sound_device:int=None, *args, **kwargs):
+    log = logging.getLogger(__name__ + ".PlaybackDisplay")
+    def __init__(self, parent:Gtk.Window, app:Gtk.Application, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.last_audiofile = None
+        ## playback position from the last status, update_time() moves it along between statuses
+        self.state = "stop"
+        self.elapsed = 0.0
+        self.duration = 0.0
+        self.status_time = time.monotonic()     ## when the last status was received
+        self.shown_time = None                  ## (seconds, state) shown in the time label
+        self.albumart_future = None
         self.parent = parent
         self.app = app
-        self.sound_card = sound_card
-        self.sound_device = sound_device
         self.set_name("playback-display")
         self.set_halign(Gtk.Align.FILL)
         self.set_valign(Gtk.Align.FILL)
@@ -625,6 +911,10 @@ class PlaybackDisplay(Gtk.Grid):
         self.attach(self.playback_button_box, 1, 3, 1, 1)
         self._set_controllers()
 
+        ## DAC status comes from the ALSA monitor
+        self.app.alsa_monitor.callback = self.on_hw_params_changed
+        self.app.alsa_monitor.poll(force=True)
+
     def _create_progressbar(self):
         ## Song progress bar
         self.song_progress = Gtk.LevelBar()
@@ -685,9 +975,8 @@ class PlaybackDisplay(Gtk.Grid):
         self.next_button.add_controller(next_button_ctrlr)
 
     def update(self, mpd_status:dict, mpd_currentsong:dict, music_dir:str):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         if not mpd_status:
-            log.error("mpd_status not defined: %s" % mpd_status)
+            self.log.error("mpd_status not defined: %s", mpd_status)
             return
         ## Set labels with song information. Set to empty if there is no current song.
         if mpd_currentsong:
@@ -717,7 +1006,7 @@ class PlaybackDisplay(Gtk.Grid):
             bitrate = mpd_status['bitrate']
 
         ## Format and set stream/dac information. Set to empty if there is no info to display
-        format_text = dac_text = ""
+        format_text = ""
         if freq and bits and chs and bitrate:
             if bits == "dsd":
                 if re.match(r'dsd', freq):
@@ -729,165 +1018,127 @@ class PlaybackDisplay(Gtk.Grid):
             else:
                 format_text = "%3.1f kHz %s bit PCM" % (float(freq) / 1000, bits)
             self.stats2_label.set_markup("<small><b>src:</b></small> " + format_text + " @ " + bitrate + " kbps")
-
-            ## Get and format DAC rate, format
-            dac_freq = dac_bits = ""
-            proc_file = Constants.proc_file_fmt % (self.sound_card, self.sound_device, "0")
-            #proc_file = Constants.proc_file_fmt
-            log.debug("proc file: %s" % proc_file)
-            if os.path.exists(proc_file):
-                lines = ()
-                try:
-                    fh = open(proc_file)
-                    lines = fh.readlines()
-                    fh.close()
-                except Exception as e:
-                    log.error("opening up proc file (%s): %s" % (type(e).__name__, e))
-                for line in lines:
-                    line = line.rstrip()
-                    #log.debug("procfile line: %s" % line)
-                    if re.match(r'rate:', line):
-                        (junk1, dac_freq, junk2) = re.split(r' ', line, maxsplit=2)
-                    elif re.match(r'format:', line):
-                        (junk1, dac_bits) = re.split(r': ', line, maxsplit=1)
-                    elif re.match(r'closed', line):
-                        break
-                if dac_freq and dac_bits:
-                    num_bits = 0
-                    if dac_bits in ("S32_LE"):
-                        num_bits = 32
-                    elif dac_bits in ("S24_LE", "S24_3LE"):
-                        num_bits = 24
-                    elif dac_bits in ("S16_LE"):
-                        num_bits = 16
-                    dac_text = "%3.1f kHz %d bit" % (float(dac_freq) / 1000, num_bits)
-                self.stats1_label.set_visible(True)
-                self.stats1_label.set_markup("<small><b>dac:</b></small> " + dac_text)
-            else:
-                log.debug("proc file does not exist")
-                self.stats1_label.set_visible(False)
-                self.stats1_label.set_markup("")
         else:
-            self.stats1_label.set_text(" ")
             self.stats2_label.set_text(" ")
+        ## the output format may have changed with the player state, the monitor only calls back if it did
+        self.app.alsa_monitor.poll()
 
-        ## Format and set time information and state
-        if 'time' in mpd_status:
-            print_state = "Playing"
-            if mpd_status['state'] == "pause":
-                print_state = "Paused"
-            self.song_progress.set_max_value(int(float(mpd_status['duration'])))
-            self.song_progress.set_value(int(float(mpd_status['elapsed'])))
-            self.current_time_label.set_text(pp_time(int(float(mpd_status['elapsed']))) + " / " + pp_time(
-                int(float(mpd_status['duration']))) + " " + print_state)
-        elif mpd_status['state'] == "stop":
-            self.song_progress.set_value(0)
-            self.current_time_label.set_text("Stopped")
-            self.last_update_offset = 0
+        self.sync_time(mpd_status)
         self.set_current_albumart(mpd_currentsong, music_dir)
 
-    def get_albumart_from_audiofile(self, audiofile:str):
+    def sync_time(self, mpd_status:dict):
         """
-        Extract album art from a file
-        :param audiofile: string, path of the file containing the audio data
-        :return: raw image data
+        Takes the playback position and state from a status, update_time() continues from there.
         """
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("audiofile: %s" % audiofile)
-        img_data = None
-
-        ## Try to find album art in the media file
-        if not os.path.isfile(audiofile):
-            log.debug("audio file does not exist: %s" % audiofile)
-            return None
+        self.state = mpd_status.get('state', "stop")
+        self.elapsed = float(mpd_status.get('elapsed', 0))
+        duration = float(mpd_status.get('duration', 0))
+        if duration != self.duration:
+            self.duration = duration
+            self.song_progress.set_max_value(max(1, int(duration)))
+        self.status_time = time.monotonic()
+        self.shown_time = None
+        self.update_time()
+
+    def update_time(self):
+        """
+        Updates the time label and the progress bar from the position of the last status and the time passed since.
+        Meant to run every second, it does not talk to MPD. Widgets are only touched when the shown second changes.
+        """
+        if self.state == "stop":
+            if self.shown_time != (0, self.state):
+                self.song_progress.set_value(0)
+                self.current_time_label.set_text("Stopped")
+                self.shown_time = (0, self.state)
+            return
+        elapsed = self.elapsed
+        if self.state == "play":
+            elapsed += time.monotonic() - self.status_time
+        if self.duration:
+            elapsed = min(elapsed, self.duration)
+        seconds = int(elapsed)
+        if self.shown_time == (seconds, self.state):
+            return
+        self.shown_time = (seconds, self.state)
+        print_state = "Playing"
+        if self.state == "pause":
+            print_state = "Paused"
+        self.song_progress.set_value(seconds if self.duration else 0)
+        self.current_time_label.set_text(pp_time(seconds) + " / " + pp_time(int(self.duration)) + " " + print_state)
+
+    def on_hw_params_changed(self, params:dict):
+        """
+        Callback of the ALSA monitor, shows the format the DAC is fed with.
+        :param params: dict of (card, device) -> alsa.HwParams, None for closed devices
+        """
+        if not params:
+            self.stats1_label.set_visible(False)
+            self.stats1_label.set_markup("")
+            return
+        texts = []
+        for (card, pcm), device_params in params.items():
+            if not device_params:
+                continue
+            text = alsa.format_hw_params(device_params)
+            if len(params) > 1:
+                text = "hw:%s,%s %s" % (card, pcm, text)
+            texts.append(text)
+        self.stats1_label.set_visible(True)
+        if texts:
+            self.stats1_label.set_markup("<small><b>dac:</b></small> " + html.escape("  ".join(texts)))
         else:
-            try:
-                if re.search(r'\.flac$', audiofile, re.IGNORECASE):
-                    log.debug("checking flac file")
-                    a = FLAC(audiofile)
-                    if len(a.pictures):
-                        img_data = a.pictures[0].data
-                elif re.search(r'\.m4a$', audiofile, re.IGNORECASE):
-                    log.debug("checking mp4 file")
-                    a = MP4(audiofile)
-                    if 'covr' in a.tags:
-                        if len(a.tags['covr']):
-                            img_data = a.tags['covr'][0]
-                else:
-                    log.debug("checking generic file")
-                    a = mutagen.File(audiofile)
-                    for k in a:
-                        if re.match(r'APIC:', k):
-                            img_data = a[k].data
-                            break
-            except Exception as e:
-                log.error("could not open audio file '%s' (%s): %s" % (audiofile, type(e).__name__, e))
-        return img_data
-
-    def get_albumart_filename(self, audiofile:str):
-        ## Look for album art on the directory of the media file
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("audiofile: %s" % audiofile)
-        cover_path = ""
-        song_dir = os.path.dirname(audiofile)
-        if os.path.isdir(song_dir):
-            try:
-                log.debug("looking for image files in directory: %s" % song_dir)
-                for f in os.listdir(song_dir):
-                    if re.match(r'.*(cover|albumart|folder).*\.(jpg|png|jpeg)', f, re.IGNORECASE):
-                        log.debug("found potential cover file: %s" % f)
-                        cover_path = song_dir + "/" + f
-                        break
-                log.debug("looking for cover file: %s" % cover_path)
-                if os.path.isfile(cover_path):
-                    return cover_path
-            except Exception as e:
-                log.error("error finding cover file (%s): %s" % (type(e).__name__, e))
-        return None
+            self.stats1_label.set_text(" ")
 
     def set_current_albumart(self, mpd_currentsong:dict, music_dir:str):
         """
         Load and display image of current song if it has changed since the last time this function was run, or on the first run.
+        Images already in the album art cache are shown right away, others are loaded on the cache's worker threads.
+        A load still running for a previous song is cancelled, or its result ignored.
         """
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         if not mpd_currentsong or not 'file' in mpd_currentsong:
-            self.current_albumart.set_paintable(None)
-            self.current_albumart.set_size_request(0, 0)
+            self.last_audiofile = None
+            self.show_albumart(None)
             return
 
         audiofile = music_dir + "/" + mpd_currentsong['file']
-        if not hasattr(self, 'last_audiofile') or self.last_audiofile != audiofile:
-            ## The file has changed since the last update, get the new album art.
-            log.debug("new cover file, updating")
-            ## Try to load image from audiofile 1st
-            img_data = self.get_albumart_from_audiofile(audiofile)
-            if img_data:
-                log.debug("image data found in audiofile")
-                try:
-                    tex = Gdk.Texture.new_from_bytes(GLib.Bytes(img_data))
-                    log.debug("from bytes image size: %d x %d" % (tex.get_width(), tex.get_height()))
-                    self.current_albumart.set_paintable(tex)
-                except Exception as e:
-                    log.error("error loading image from bytes (%s): %s" % (type(e).__name__, e))
-            else:
-                log.debug("no image data found in audiofile")
-                coverfile = self.get_albumart_filename(audiofile)
-                if coverfile:
-                    try:
-                        self.current_albumart.set_filename(coverfile)
-                        paintable = self.current_albumart.get_paintable()
-                        if not paintable:
-                            log.debug("no paintable object")
-                        else:
-                            log.debug("from file image size: %d x %d" % (paintable.get_width(), paintable.get_height()))
-                    except Exception as e:
-                        log.error("error loading image from file (%s): %s" % (type(e).__name__, e))
-                else:
-                    ## No album art, clear the image in the UI.
-                    log.debug("no albumart found for: %s" % audiofile)
-                    self.current_albumart.set_paintable(None)
-                    self.current_albumart.set_size_request(0,0)
-            self.last_audiofile = audiofile
+        if self.last_audiofile == audiofile:
+            return
+        ## The file has changed since the last update, get the new album art.
+        self.log.debug("new cover file, updating")
+        self.last_audiofile = audiofile
+        if self.albumart_future:
+            self.albumart_future.cancel()
+            self.albumart_future = None
+        found, texture = self.app.albumart_cache.peek(audiofile, mpd_currentsong.get('album'))
+        if found:
+            self.show_albumart(texture)
+            return
+        self.albumart_future = self.app.albumart_cache.load_async(audiofile, mpd_currentsong.get('album'))
+        self.albumart_future.add_done_callback(lambda f: GLib.idle_add(self.on_albumart_loaded, audiofile, f))
+
+    def on_albumart_loaded(self, audiofile:str, future):
+        """
+        Runs on the main loop when an album art load finished. Drops results for songs that are no longer current.
+        """
+        if future.cancelled() or audiofile != self.last_audiofile:
+            self.log.debug("dropping stale album art: %s", audiofile)
+            return False
+        self.albumart_future = None
+        if future.exception():
+            self.log.error("could not load album art (%s): %s", type(future.exception()).__name__, future.exception())
+            self.show_albumart(None)
+        else:
+            self.show_albumart(future.result())
+        return False
+
+    def show_albumart(self, texture:Gdk.Texture):
+        if texture:
+            self.log.debug("image size: %d x %d", texture.get_width(), texture.get_height())
+            self.current_albumart.set_paintable(texture)
+        else:
+            ## No album art, clear the image in the UI.
+            self.current_albumart.set_paintable(None)
+            self.current_albumart.set_size_request(0,0)
 
     ##  Click handlers
 
@@ -933,23 +1184,35 @@ class PlaybackDisplay(Gtk.Grid):
         self.app.mpd_next()
         controller.reset()
 
-class PlaylistDisplay(Gtk.ListBox, KeyPressedReceiver):
+class PlaylistDisplay(Gtk.ListView, KeyPressedReceiver):
     """
-    Handles display and updates of the playlist. The listbox entries are controlled by a Gio.ListStore listmodel.
+    Handles display and updates of the playlist. The listview entries are controlled by a Gio.ListStore listmodel.
+    Row widgets are only created for the visible rows and recycled while scrolling.
     """
+    log = logging.getLogger(__name__ + ".PlaylistDisplay")
     last_selected = 0  ## Points to last selected song in playlist
+    current_pos = None  ## Position of the row marked as the current song
+    current_row_name = "current-track"
 
     def __init__(self, parent:Gtk.Window, app:Gtk.Application,  *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.set_name("playlist-display")
         self.liststore = Gio.ListStore()
-        self.bind_model(model=self.liststore, create_widget_func=self.create_list_label)
+        self.selection = new_selection(self.liststore)
+        self.bound_items = set()    ## list items with a row widget, only those can carry the current song mark
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_factory_setup)
+        factory.connect("bind", self.on_factory_bind)
+        factory.connect("unbind", self.on_factory_unbind)
+        self.set_factory(factory)
+        self.set_model(self.selection)
         self.parent = parent
         self.app = app
 
+        ## Return is handled by the activate signal
+        self.connect("activate", self.on_row_activated)
         self.set_key_pressed_controller()
         self.key_pressed_callbacks = {
-            Gdk.KEY_Return:         (self.edit_popup,),
             Gdk.KEY_Delete:         (self.track_delete,),
             Gdk.KEY_BackSpace:      (self.track_delete,),
         }
@@ -962,42 +1225,153 @@ class PlaylistDisplay(Gtk.ListBox, KeyPressedReceiver):
         self.add_config_keys(self.key_pressed_callbacks, callback_config_tuples, self.app.config)
 
     def update(self, playlist:dict, mpd_currentsong:dict):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        self.liststore.remove_all()
-        if playlist:
-            log.debug("playlist: %s" % playlist)
-            ## Add songs to the list
-            for song in playlist:
-                log.debug("adding song to playlist: %s" % song['title'])
-                self.liststore.append(data.ContentTreeNode(metadata=song))
-            if not self.last_selected is None:
-                self.select_row(self.get_row_at_index(self.last_selected))
-            if self.parent.focus_on == "playlist" and self.get_row_at_index(self.last_selected):
-                self.get_row_at_index(self.last_selected).grab_focus()
-            if 'pos' in mpd_currentsong:
-                self.get_row_at_index(int(mpd_currentsong['pos'])).set_name("current-track")
-            log.debug("playlist refresh complete")
-
-    def create_list_label(self, node):
+        if not playlist:
+            self.liststore.remove_all()
+            return
+        self.log.debug("playlist: %s", playlist)
+        ## Replace all songs in the list at once
+        nodes = [ data.ContentTreeNode(metadata=song) for song in playlist ]
+        self.liststore.splice(0, self.liststore.get_n_items(), nodes)
+        self.restore_selection(mpd_currentsong)
+        self.log.debug("playlist refresh complete")
+
+    def apply_changes(self, changes:list, length:int, mpd_currentsong:dict):
+        """
+        Applies a delta from plchanges in place. Every changed song replaces the row at its position,
+        consecutive positions are replaced with one splice. Rows past the new length are removed.
+        :param changes: list of songs returned by plchanges
+        :param length: length of the playlist after the changes
+        :param mpd_currentsong: current song
+        """
+        self.log.debug("applying %d playlist changes, new length: %d", len(changes), length)
+        runs = []   ## list of [start position, nodes]
+        for song in sorted(changes, key=lambda s: int(s['pos'])):
+            pos = int(song['pos'])
+            if runs and runs[-1][0] + len(runs[-1][1]) == pos:
+                runs[-1][1].append(data.ContentTreeNode(metadata=song))
+            else:
+                runs.append([pos, [data.ContentTreeNode(metadata=song)]])
+        for start, nodes in runs:
+            n_items = self.liststore.get_n_items()
+            n_removals = max(0, min(len(nodes), n_items - start))
+            self.liststore.splice(min(start, n_items), n_removals, nodes)
+        n_items = self.liststore.get_n_items()
+        if n_items > length:
+            self.liststore.splice(length, n_items - length, [])
+        if runs or n_items != length:
+            self.restore_selection(mpd_currentsong)
+
+    def restore_selection(self, mpd_currentsong:dict):
+        """
+        Selects the last selected row and marks the current song after the list has changed.
+        """
+        if not self.last_selected is None and self.last_selected < self.liststore.get_n_items():
+            self.selection.set_selected(self.last_selected)
+            if self.parent.focus_on == "playlist":
+                self.scroll_to(self.last_selected, Gtk.ListScrollFlags.FOCUS, None)
+        self.set_current(mpd_currentsong)
+
+    def set_current(self, mpd_currentsong:dict):
+        """
+        Marks the row of the current song and clears the mark from the previous one. The list model is not touched.
+        The row at the song's position is only marked if it holds the same song id, otherwise the playlist change
+        that is on its way will mark it.
+        :param mpd_currentsong: current song
+        """
+        self.current_pos = None
+        if mpd_currentsong and 'pos' in mpd_currentsong:
+            pos = int(mpd_currentsong['pos'])
+            node = self.liststore.get_item(pos) if pos < self.liststore.get_n_items() else None
+            if node and node.get_metadata('id') == mpd_currentsong.get('id'):
+                self.current_pos = pos
+            else:
+                self.log.debug("row %d does not hold song id %s yet", pos, mpd_currentsong.get('id'))
+        for list_item in self.bound_items:
+            self.mark_current(list_item)
+
+    def mark_current(self, list_item:Gtk.ListItem):
+        """
+        Sets or clears the current song mark on the row widget of a list item.
+        """
+        if self.current_pos is not None and list_item.get_position() == self.current_pos:
+            list_item.get_child().set_name(self.current_row_name)
+        else:
+            list_item.get_child().set_name("")
+
+    def on_factory_setup(self, factory, list_item):
+        label = ContentTreeLabel()
+        label.set_halign(Gtk.Align.FILL)
+        label.set_valign(Gtk.Align.START)
+        label.set_hexpand(True)
+        label.set_xalign(0)
+        list_item.set_child(label)
+
+    def on_factory_bind(self, factory, list_item):
+        label = list_item.get_child()
+        node = list_item.get_item()
+        label.node = node
         if node.get_metadata('track') and node.get_metadata('time') and node.get_metadata('title'):
             label_text = "%s (%s)  <b>%s</b>  <small><i>%s - %s</i></small>" % (re.sub(r'/.*', '', html.escape(node.get_metadata('track'))),
                                 html.escape(pp_time(node.get_metadata('time'))), html.escape(node.get_metadata('title')),
-                                html.escape(node.get_metadata('artist')), html.escape(node.get_metadata('album')))
+                                html.escape(node.get_metadata('artist') or ""), html.escape(node.get_metadata('album') or ""))
         else:
-            label_text = os.path.basename(node.get_metadata('file'))
-        label = ContentTreeLabel(node=node)
+            label_text = html.escape(os.path.basename(node.get_metadata('file')))
         label.set_markup(label_text)
-        label.set_halign(Gtk.Align.START)
-        label.set_valign(Gtk.Align.START)
-        return label
+        self.bound_items.add(list_item)
+        self.mark_current(list_item)
+
+    def on_factory_unbind(self, factory, list_item):
+        self.bound_items.discard(list_item)
+        list_item.get_child().node = None
+
+    def get_selected_node(self):
+        """
+        :return: node of the selected row, None if nothing is selected
+        """
+        return self.selection.get_selected_item()
+
+    def get_selected_position(self):
+        """
+        :return: position of the selected row, None if nothing is selected
+        """
+        position = self.selection.get_selected()
+        if position == Gtk.INVALID_LIST_POSITION:
+            return None
+        return position
+
+    def on_row_activated(self, listview, position):
+        """
+        Handles Return and double-clicks on a row.
+        """
+        self.edit_popup()
+
+    def prefetch_albumart(self, mpd_status:dict):
+        """
+        Loads the album art of the next songs in the playlist into the album art cache in the background, so
+        it can be shown as soon as the track changes. Starts at the next song reported by MPD, which also covers
+        random playback, followed by the songs after it in the playlist.
+        :param mpd_status: player status
+        """
+        if not mpd_status or 'nextsong' not in mpd_status:
+            return
+        start = int(mpd_status['nextsong'])
+        end = min(start + Constants.albumart_prefetch_count, self.liststore.get_n_items())
+        for i in range(start, end):
+            node = self.liststore.get_item(i)
+            if node.get_metadata('file'):
+                self.app.albumart_cache.prefetch(self.app.music_dir + "/" + node.get_metadata('file'),
+                                                 node.get_metadata('album'))
 
     def edit_popup(self):
         """
         Displays dialog with playlist edit options. Performs task based on user input.
         Play, move song up in playlist, down in playlist, delete from playlist.
         """
-        song = self.get_selected_row().get_child().node.get_metadata()
-        edit_playlist_dialog = PlaylistEditDialog(parent=self.parent, song=song)
+        node = self.get_selected_node()
+        if not node:
+            self.log.error("no row selected")
+            return
+        edit_playlist_dialog = PlaylistEditDialog(parent=self.parent, song=node)
         edit_playlist_dialog.connect('response', self.edit_response)
         edit_playlist_dialog.show()
 
@@ -1010,8 +1384,7 @@ class PlaylistDisplay(Gtk.ListBox, KeyPressedReceiver):
             dialog.destroy()
             self.track_delete()
         elif response == Constants.playlist_edit_response_play:
-            song = self.get_selected_row().get_child().node.get_metadata()
-            self.parent.mpd_playid(song['id'])
+            self.app.mpd_playid(self.get_selected_node().get_metadata('id'))
             dialog.destroy()
         elif response == Constants.playlist_edit_response_cancel:
             dialog.destroy()
@@ -1020,52 +1393,52 @@ class PlaylistDisplay(Gtk.ListBox, KeyPressedReceiver):
         """
         Call SongInfoDialog to display the song data from the selected playlist row
         """
-        selected = self.get_selected_row()
-        if not selected:
-            log.error("no row selected")
-            return
-        label = selected.get_child()
-        if not label or not isinstance(label, ContentTreeLabel):
-            log.error("invalid child of row")
-        song = label.node.get_metadata()
-        if song is None:
+        node = self.get_selected_node()
+        if not node:
+            self.log.error("no row selected")
             return
-        log.debug("song info: %s" % song)
-        dialog = SongInfoDialog(self.parent, label.node)
+        self.log.debug("song info: %s", node)
+        dialog = SongInfoDialog(self.parent, node)
         dialog.show()
 
     def track_moveup(self):
-        index = self.get_selected_row().get_index()
-        song = self.get_selected_row().get_child().node.get_metadata()
-        log.debug("moving song up 1: '%s'" % song['title'])
+        index = self.get_selected_position()
+        if index is None:
+            return
+        node = self.get_selected_node()
+        self.log.debug("moving song up 1: %s", node)
         if index > 0:
             index -= 1
-            self.app.mpd_moveid(song['id'], index)
+            self.app.mpd_moveid(node.get_metadata('id'), index)
         self.last_selected = index
 
     def track_movedown(self):
-        index = self.get_selected_row().get_index()
-        song = self.get_selected_row().get_child().node.get_metadata()
-        log.debug("moving song down 1: '%s'" % song['title'])
+        index = self.get_selected_position()
+        if index is None:
+            return
+        node = self.get_selected_node()
+        self.log.debug("moving song down 1: %s", node)
         if index + 1 < len(self.liststore):
-            self.app.mpd_moveid(song['id'], index+1)
+            self.app.mpd_moveid(node.get_metadata('id'), index+1)
         self.last_selected = index+1
 
     def track_delete(self):
-        index = self.get_selected_row().get_index()
-        song = self.get_selected_row().get_child().node.get_metadata()
-        log.debug("deleting song: '%s'" % song)
+        index = self.get_selected_position()
+        if index is None:
+            return
+        node = self.get_selected_node()
+        self.log.debug("deleting song: %s", node)
         index -= 1
         if index < 0:
             index = 0
-        self.app.mpd_deleteid(song['id'])
+        self.app.mpd_deleteid(node.get_metadata('id'))
         self.last_selected = index
 
 class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
+    log = logging.getLogger(__name__ + ".MpdFrontWindow")
     focus_on = "broswer"        ## Either 'playlist' or 'browser'
 
     def __init__(self, config:configparser, application:Gtk.ApplicationWindow, content_tree:Gio.ListStore, *args, **kwargs):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         super().__init__(title=Constants.window_title, application=application, *args, **kwargs)
         self.config = config
         self.app = application
@@ -1099,24 +1472,23 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         self.mainpaned.set_name("mainpaned")
         self.set_child(self.mainpaned)
 
-        ## Setup browser columns
+        ## Setup browser columns, the search panel takes their place while searching
         self.browser = ColumnBrowser(parent=self, app=self.app, content_tree=self.content_tree,
                                          cols=Constants.browser_num_columnns, spacing=0, hexpand=True, vexpand=True)
         self.browser.set_name("browser")
-        self.mainpaned.set_start_child(self.browser)
+        self.search_panel = SearchPanel(parent=self, app=self.app)
+        self.search_panel.set_name("search")
+        self.browser_stack = Gtk.Stack()
+        self.browser_stack.add_named(self.browser, "browser")
+        self.browser_stack.add_named(self.search_panel, "search")
+        self.mainpaned.set_start_child(self.browser_stack)
 
         ## Setup bottom half
         self.bottompaned = Gtk.Paned(orientation=Gtk.Orientation.HORIZONTAL)
         self.mainpaned.set_end_child(self.bottompaned)
 
         ## Setup playback display
-        sound_card = None
-        sound_device = None
-        if self.config.has_option(Constants.config_section_main, "sound_card"):
-            sound_card = self.config.get(Constants.config_section_main, "sound_card")
-        if self.config.has_option(Constants.config_section_main, "sound_device"):
-            sound_device = self.config.get(Constants.config_section_main, "sound_device")
-        self.playback_display = PlaybackDisplay(parent=self, app=self.app, sound_card=sound_card, sound_device=sound_device)
+        self.playback_display = PlaybackDisplay(parent=self, app=self.app)
         self.bottompaned.set_start_child(self.playback_display)
 
         ## Setup playlist
@@ -1131,12 +1503,12 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         self.set_key_pressed_controller()
         self.key_pressed_callbacks = {
             Gdk.KEY_VoidSymbol:         (lambda: True,),
-            Gdk.KEY_Up:                 (log.debug, ("UP",)), #(lambda: True,),
-            Gdk.KEY_Down:               (log.debug, ("DOWN",)), #(lambda: True,),
-            Gdk.KEY_Right:              (log.debug, ("RIGHT",)), #(lambda: True,),
-            Gdk.KEY_Left:               (log.debug, ("LEFT",)), #(lambda: True,),
-            Gdk.KEY_Return:             (log.debug, ("RETURN",)), #(lambda: True,),
-            Gdk.KEY_Escape:             (log.debug, ("ESC",)), #(lambda: True,),
+            Gdk.KEY_Up:                 (self.log.debug, ("UP",)), #(lambda: True,),
+            Gdk.KEY_Down:               (self.log.debug, ("DOWN",)), #(lambda: True,),
+            Gdk.KEY_Right:              (self.log.debug, ("RIGHT",)), #(lambda: True,),
+            Gdk.KEY_Left:               (self.log.debug, ("LEFT",)), #(lambda: True,),
+            Gdk.KEY_Return:             (self.log.debug, ("RETURN",)), #(lambda: True,),
+            Gdk.KEY_Escape:             (self.log.debug, ("ESC",)), #(lambda: True,),
             Gdk.KEY_AudioPlay:          (self.app.mpd_toggle,),
             Gdk.KEY_AudioStop:          (self.app.mpd_stop,),
             Gdk.KEY_AudioPrev:          (self.app.mpd_previous,),
@@ -1169,6 +1541,7 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
             (Constants.config_section_keys, "cardselect"):      (self.event_cardselect_dialog,),
             (Constants.config_section_keys, "browser"):         (self.event_focus_browser,),
             (Constants.config_section_keys, "playlist"):        (self.event_focus_playlist,),
+            (Constants.config_section_keys, "search"):          (self.event_search,),
             (Constants.config_section_keys, "toggle_main"):     (self.event_toggle_main,),
             (Constants.config_section_keys, "toggle_bottom"):   (self.event_toggle_bottom,),
             (Constants.config_section_keys, "layout1"):    (self.set_layout1,),
@@ -1178,7 +1551,8 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
 
         ## Set initially selected widgets
         self._playlist_last_selected = 0
-        self.playlist_list.select_row(self.playlist_list.get_row_at_index(self._playlist_last_selected))
+        if self.playlist_list.liststore.get_n_items():
+            self.playlist_list.selection.set_selected(self._playlist_last_selected)
         #self.browser.columns[0].select_row(self.browser.columns[0].get_row_at_index(0))
 
         ## Set event handlers
@@ -1189,8 +1563,12 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         self.outputs_dialog = OutputsDialog(self, self.outputs_changed)
 
     def event_options_dialog(self):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        mpd_status = self.app.mpd_status()
+        self.app.mpd_command("status", callback=self.show_options_dialog)
+
+    def show_options_dialog(self, mpd_status:dict):
+        if not mpd_status:
+            self.log.error("no status to show options for")
+            return
         options_dialog = OptionsDialog(self, self.options_changed, mpd_status)
         options_dialog.show()
 
@@ -1200,18 +1578,28 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
 
     def event_focus_browser(self):
         ## Focus on the last selected row in the browser
-        self.browser.get_last_selected_row().grab_focus()
+        self.browser_stack.set_visible_child_name("browser")
+        self.browser.focus_selected()
         if self.mainpaned.get_position() < Constants.divider_tolerance:
             self.mainpaned.set_position(self.mainpaned.get_height()/2)
         return
 
+    def event_search(self):
+        self.browser_stack.set_visible_child_name("search")
+        self.search_panel.start()
+        if self.mainpaned.get_position() < Constants.divider_tolerance:
+            self.mainpaned.set_position(self.mainpaned.get_height()/2)
+
     def event_focus_playlist(self):
         ## Focus on the selected row in the playlist
-        selected_row = self.playlist_list.get_selected_row()
-        if not selected_row:
-            selected_row = self.playlist_list.get_row_at_index(0)
-            self.playlist_list.select_row(selected_row)
-        selected_row.grab_focus()
+        position = self.playlist_list.get_selected_position()
+        if position is None and self.playlist_list.liststore.get_n_items():
+            position = 0
+            self.playlist_list.selection.set_selected(position)
+        if position is None:
+            self.playlist_list.grab_focus()
+        else:
+            self.playlist_list.scroll_to(position, Gtk.ListScrollFlags.FOCUS, None)
         if self.mainpaned.get_position() > (self.mainpaned.get_height() - Constants.divider_tolerance):
             self.mainpaned.set_position(self.mainpaned.get_height()/2)
         if self.bottompaned.get_position() > (self.bottompaned.get_width() - Constants.divider_tolerance):
@@ -1221,17 +1609,16 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         """
         Rotates through full and split screen for the main window. Rotation: split, browser full, bottom full
         """
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
         height = self.get_height()
         position = self.mainpaned.get_position()
         if position < Constants.divider_tolerance:
-            log.debug("setting main to split screen")
+            self.log.debug("setting main to split screen")
             self.mainpaned.set_position(height/2)
         elif position > (height - Constants.divider_tolerance):
-            log.debug("setting bottom to full screen")
+            self.log.debug("setting bottom to full screen")
             self.mainpaned.set_position(0)
         else:
-            log.debug("setting browser to full screen")
+            self.log.debug("setting browser to full screen")
             self.mainpaned.set_position(height)
 
     def event_toggle_bottom(self):
@@ -1239,7 +1626,6 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         Rotates through full and split screen for the bottom paned. Rotation: split, playlist full, playlist full
         :return:
         """
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
         width = self.get_width()
         position = self.bottompaned.get_position()
         if position < Constants.divider_tolerance:
@@ -1249,23 +1635,21 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         else:
             self.bottompaned.set_position(width)
 
-    def add_to_playlist(self):
+    def add_to_playlist(self, node:data.ContentTreeNode=None):
         """
         Displays playlist confirmation dialog
+        :param node: node to add, the node selected in the browser if None
         """
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        selected = self.browser.get_last_selected_row()
-        if not selected:
-            return
-        label = selected.get_child()
-        if not label or not isinstance(label, ContentTreeLabel):
+        if node is None:
+            node = self.browser.get_selected_node()
+        if not node:
             return
-        log.debug("selected metatype: %s" % label.node.metatype)
-        if not label.node.metatype in (Constants.node_t_song, Constants.node_t_album, Constants.node_t_file):
-            log.debug("Not adding this node type: %s" % label.node.metatype)
+        self.log.debug("selected metatype: %s", node.metatype)
+        if not node.metatype in (Constants.node_t_song, Constants.node_t_album, Constants.node_t_file):
+            self.log.debug("Not adding this node type: %s", node.metatype)
             return
-        log.debug("confirming add item: %s" % label.node.get_metadata())
-        playlist_confirm_dialog = PlaylistConfirmDialog(parent=self, add_item=label.node)
+        self.log.debug("confirming add item: %s", node)
+        playlist_confirm_dialog = PlaylistConfirmDialog(parent=self, add_item=node)
         playlist_confirm_dialog.connect('response', self.playlist_confirm_dialog_response)
         playlist_confirm_dialog.show()
 
@@ -1277,10 +1661,13 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         :param outputid: output ID from the button
         """
         if button.get_active():
-            self.app.mpd_enableoutput.enableoutput(outputid)
+            self.app.mpd_enableoutput(outputid)
         else:
             self.app.mpd_disableoutput(outputid)
-        self.app.mpd_outputs = self.app.get_mpd_outputs()
+        self.app.mpd_command("outputs", callback=self.on_outputs_refreshed)
+
+    def on_outputs_refreshed(self, outputs:list):
+        self.app.mpd_outputs = outputs
 
     def options_changed(self, button, option):
         """
@@ -1288,7 +1675,6 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         :param button: Gtk.Button, event source
         :param option: name of the option to change
         """
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
         if option == "consume":
             self.app.mpd_consume(int(button.get_active()))
         elif option == "random":
@@ -1298,29 +1684,23 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
         elif option == "single":
             self.app.mpd_single(int(button.get_active()))
         else:
-            log.info("unhandled option: %s" % option)
+            self.log.info("unhandled option: %s", option)
 
     def soundcard_changed(self, button, change):
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
-        log.debug("changing sound card: %s = %s" % (change, button.get_value_as_int()))
+        self.log.debug("changing sound card: %s = %s", change, button.get_value_as_int())
         if change == "card_id":
-            self.card_id = button.get_value_as_int()
+            self.app.card_id = button.get_value_as_int()
         elif change == "device_id":
-            self.device_id = button.get_value_as_int()
+            self.app.device_id = button.get_value_as_int()
+        self.app.alsa_monitor.set_device(0, self.app.card_id, self.app.device_id)
 
     def playlist_confirm_dialog_response(self, dialog, response):
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
-        log.debug("dialog response: %s" % response)
+        self.log.debug("dialog response: %s", response)
         dialog.destroy()
-        selected = self.browser.get_last_selected_row()
-        if not selected:
-            log.error("attempting to add with nothing selected")
-            return
-        label = selected.get_child()
-        if not label or not isinstance(label, ContentTreeLabel):
-            log.error("no valid label returned from row: %s" % label)
+        node = dialog.add_item
+        if not node:
+            self.log.error("attempting to add with nothing selected")
             return
-        node = label.node
         if response == Constants.playlist_confirm_reponse_replace:
             ## Clear list before adding for "replace"
             self.app.mpd_clear()
@@ -1328,15 +1708,13 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
             self.app.add_to_playlist(node)
 
     def on_state_flags_changed(self, widget, flags):
-        log = logging.getLogger(__name__ + "." + self.__class__.__name__ + "." + inspect.stack()[0].function)
-        log.debug("state flags: %s" % flags)
+        self.log.debug("state flags: %s", flags)
         #if not self._initial_resized and (flags & Gtk.StateFlags.FOCUS_WITHIN):
         #    self.set_dividers()
         #    self._initial_resized = True
 
     def set_layout1(self):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
-        log.debug("setting dividers")
+        self.log.debug("setting dividers")
         if self.mainpaned.get_height():
             self.mainpaned.set_position(self.mainpaned.get_height()/2)
         else:
@@ -1347,14 +1725,13 @@ class MpdFrontWindow(Gtk.Window, KeyPressedReceiver):
             self.bottompaned.set_position(self.props.default_width/2)
 
     def set_layout2(self):
-        log = logging.getLogger(__name__+"."+self.__class__.__name__+"."+inspect.stack()[0].function)
         img_width = self.playback_display.current_albumart.get_paintable().get_width()
         img_height = self.playback_display.current_albumart.get_paintable().get_height()
-        log.debug("img size: %d x %d" % (img_width, img_height))
+        self.log.debug("img size: %d x %d", img_width, img_height)
         pic_width = self.playback_display.current_albumart.get_width()
         pic_height = self.playback_display.current_albumart.get_height()
-        log.debug("pic size: %d x %d" % (pic_width, pic_height))
+        self.log.debug("pic size: %d x %d", pic_width, pic_height)
         aspect_ratio = img_width/img_height
         new_position = int(pic_height/aspect_ratio)
-        log.debug("setting position to: %d, aspect ratio: %f" % (new_position, aspect_ratio))
+        self.log.debug("setting position to: %d, aspect ratio: %f", new_position, aspect_ratio)
         self.bottompaned.set_position(new_position)
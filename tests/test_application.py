@@ -0,0 +1,75 @@
+import logging
+import unittest
+from unittest import mock
+try:
+    from mpdfront import data
+    from mpdfront.application import MpdFrontApp
+    from mpdfront.constants import Constants
+except ImportError as e:
+    raise unittest.SkipTest("mpdfront dependencies are not installed: %s" % e)
+
+class FilesApp:
+    """
+    Just the file loading methods of MpdFrontApp, without starting the application.
+    """
+    log = logging.getLogger(__name__)
+    get_files_list = MpdFrontApp.get_files_list
+    files_to_rows = MpdFrontApp.files_to_rows
+    load_first_directory_level = MpdFrontApp.load_first_directory_level
+
+class FilesClient:
+    """
+    Answers lsinfo like mpd.Client, None for the directories in failing. A command list fails if any of its
+    commands does.
+    """
+    def __init__(self, tree:dict, failing:set=()):
+        self.tree = tree
+        self.failing = failing
+        self.n_lsinfo = 0
+        self.n_command_lists = 0
+
+    def lsinfo(self, path:str=""):
+        self.n_lsinfo += 1
+        if path in self.failing:
+            return None
+        return self.tree[path]
+
+    def command_list(self, commands:list):
+        self.n_command_lists += 1
+        if any([ c[1] in self.failing for c in commands ]):
+            return None
+        return [ self.tree[c[1]] for c in commands ]
+
+class LoadFirstDirectoryLevelTest(unittest.TestCase):
+    tree = {
+        "": [ { 'directory': "a" }, { 'directory': "b" }, { 'file': "c.flac" }, { 'directory': "d" } ],
+        "a": [ { 'file': "a/1.flac" }, { 'directory': "a/x" } ],
+        "b": [ { 'file': "b/1.flac" } ],
+        "d": [ { 'file': "d/1.flac" } ],
+    }
+
+    def load(self, client:FilesClient):
+        node = data.ContentTreeNode(metadata={ 'type': Constants.node_t_category, 'name': "Files",
+                                               'next_type': Constants.node_t_directory })
+        return [ n.metaname for n in FilesApp().load_first_directory_level(client, node) ]
+
+    def test_command_list(self):
+        client = FilesClient(self.tree)
+        self.assertEqual(self.load(client), [ "a/1.flac", "a/x", "b/1.flac", "d/1.flac", "c.flac" ])
+        self.assertEqual(client.n_lsinfo, 1)
+        self.assertEqual(client.n_command_lists, 1)
+
+    def test_failing_directory(self):
+        self.assertEqual(self.load(FilesClient(self.tree, failing={ "b" })), [ "a/1.flac", "a/x", "d/1.flac",
+                                                                              "c.flac" ])
+
+    @mock.patch.object(Constants, "directory_list_chunk_size", 2)
+    def test_chunks(self):
+        ## only the chunk with the failing directory is listed one by one
+        client = FilesClient(self.tree, failing={ "d" })
+        self.assertEqual(self.load(client), [ "a/1.flac", "a/x", "b/1.flac", "c.flac" ])
+        self.assertEqual(client.n_command_lists, 2)
+        self.assertEqual(client.n_lsinfo, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+try:
+    from mpdfront import data
+except ImportError as e:
+    raise unittest.SkipTest("mpdfront dependencies are not installed: %s" % e)
+
+class ParseNumberTest(unittest.TestCase):
+    def test_number(self):
+        self.assertEqual(data.parse_number("3"), 3)
+        self.assertEqual(data.parse_number("3/12"), 3)
+
+    def test_missing(self):
+        self.assertEqual(data.parse_number(None), 0)
+        self.assertEqual(data.parse_number(""), 0)
+
+    def test_not_a_number(self):
+        self.assertEqual(data.parse_number("A1"), 0)
+        self.assertEqual(data.parse_number("/"), 0)
+
+    def test_repeated_tag(self):
+        self.assertEqual(data.parse_number([ "2", "5" ]), 2)
+        self.assertEqual(data.parse_number([]), 0)
+
+    def test_other_types(self):
+        self.assertEqual(data.parse_number(7), 0)
+        self.assertEqual(data.parse_number({ 'track': "1" }), 0)
+
+def named(*names):
+    return [ data.ContentTreeNode(metadata={ 'type': "album", 'name': n }) for n in names ]
+
+class JumpIndexTest(unittest.TestCase):
+    def test_sorted(self):
+        index = data.JumpIndex(named("abba", "acdc", "cream", "doors"))
+        self.assertEqual(index.find("a"), 0)
+        self.assertEqual(index.find("c"), 2)
+        ## no b, the next letter that has rows
+        self.assertEqual(index.find("b"), 2)
+        self.assertIsNone(index.find("z"))
+
+    def test_unsorted(self):
+        ## MPD sorts by bytes, upper case before lower case
+        index = data.JumpIndex(named("Zappa", "Abba", "cream", "doors"))
+        self.assertFalse(index.ordered)
+        self.assertEqual(index.find("a"), 1)
+        self.assertEqual(index.find("z"), 0)
+        self.assertEqual(index.find("c"), 2)
+        self.assertIsNone(index.find("b"))
+
+    def test_chunks(self):
+        index = data.JumpIndex()
+        index.add(named("b", "c"))
+        index.add(named("a"), 2)
+        self.assertFalse(index.ordered)
+        self.assertEqual(index.find("a"), 2)
+
+class CompactMetadataTest(unittest.TestCase):
+    def test_key_order(self):
+        ## the same tags in another order share the key index
+        index1, values1 = data.compact_metadata({ 'title': "a", 'artist': "b" })
+        index2, values2 = data.compact_metadata({ 'artist': "b", 'title': "a" })
+        self.assertIs(index1, index2)
+        self.assertEqual(values1, values2)
+
+    def test_get_metadata(self):
+        n = data.ContentTreeNode(metadata={ 'type': "song", 'name': "x", 'track': "2" })
+        self.assertEqual(n.get_metadata('track'), "2")
+        self.assertIsNone(n.get_metadata('disc'))
+        self.assertEqual(n.get_metadata(), { 'type': "song", 'name': "x", 'track': "2" })
+
+def node(name:str, previous=None, children:list=None):
+    n = data.ContentTreeNode(metadata={ 'type': "album", 'name': name }, previous=previous)
+    if children is not None:
+        for c in children:
+            c.previous = n
+        n.get_child_layer().splice(0, 0, children)
+        n.loaded = True
+    return n
+
+class ContentTreeNodeTest(unittest.TestCase):
+    def setUp(self):
+        self.song = node("song")
+        self.album = node("album", children=[ self.song ])
+        self.empty = node("empty", children=[])
+        self.root = node("root", children=[ self.album, self.empty ])
+
+    def test_tree_size(self):
+        ## the empty layer counts as loaded
+        self.assertEqual(data.get_tree_size(self.root.get_child_layer()), (3, 2))
+
+    def test_clear_child_layer(self):
+        self.root.clear_child_layer()
+        self.assertFalse(self.root.loaded)
+        self.assertIsNone(self.root.get_child_layer(create=False))
+        self.assertTrue(self.root.in_tree())
+        self.assertFalse(self.album.in_tree())
+        self.assertFalse(self.song.in_tree())
+
+    def test_has_ancestor(self):
+        self.assertTrue(self.song.has_ancestor({ self.root }))
+        self.assertFalse(self.root.has_ancestor({ self.root }))
+
+if __name__ == "__main__":
+    unittest.main()
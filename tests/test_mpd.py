@@ -0,0 +1,100 @@
+import logging
+import unittest
+from unittest import mock
+try:
+    import musicpd
+    from mpdfront import mpd, Constants
+except ImportError as e:
+    raise unittest.SkipTest("mpdfront dependencies are not installed: %s" % e)
+
+class PlaylistClient:
+    """
+    Answers the playlist commands like mpd.Client, None for the commands in failing.
+    """
+    def __init__(self, failing:set=()):
+        self.failing = failing
+        self.songs = [ { 'pos': str(i), 'file': "%d.flac" % i } for i in range(3) ]
+
+    def status(self):
+        return None if "status" in self.failing else { 'playlist': "7", 'playlistlength': "3" }
+
+    def plchanges(self, version:str):
+        return None if "plchanges" in self.failing else self.songs[2:]
+
+    def playlistinfo(self):
+        return None if "playlistinfo" in self.failing else self.songs
+
+class PlaylistIdleThread:
+    """
+    Just the playlist methods of IdleClientThread, without connecting.
+    """
+    log = logging.getLogger(__name__)
+    fetch_playlist = mpd.IdleClientThread.fetch_playlist
+    put_playlist = mpd.IdleClientThread.put_playlist
+
+    def __init__(self, client:PlaylistClient, playlist_version:str=None):
+        self.mpd = client
+        self.playlist_version = playlist_version
+        self.messages = []
+
+    def put(self, msg):
+        self.messages.append(msg.get_data())
+
+class FetchPlaylistTest(unittest.TestCase):
+    def test_changes(self):
+        thread = PlaylistIdleThread(PlaylistClient(), "5")
+        thread.put_playlist(None)
+        self.assertEqual(thread.messages, [ { 'playlist': thread.mpd.songs[2:], 'current': None, 'full': False,
+                                              'length': 3 } ])
+        self.assertEqual(thread.playlist_version, "7")
+
+    def test_failed_plchanges(self):
+        ## the full playlist is sent instead
+        thread = PlaylistIdleThread(PlaylistClient(failing={ "plchanges" }), "5")
+        thread.put_playlist(None)
+        self.assertEqual(thread.messages, [ { 'playlist': thread.mpd.songs, 'current': None, 'full': True,
+                                              'length': 3 } ])
+        self.assertEqual(thread.playlist_version, "7")
+
+    def test_failed_playlist(self):
+        thread = PlaylistIdleThread(PlaylistClient(failing={ "plchanges", "playlistinfo" }), "5")
+        thread.put_playlist(None)
+        self.assertEqual(thread.messages, [])
+        self.assertIsNone(thread.playlist_version)
+
+    def test_failed_status(self):
+        thread = PlaylistIdleThread(PlaylistClient(failing={ "status" }), "5")
+        thread.put_playlist(None)
+        self.assertEqual(thread.messages[0]['length'], 3)
+        self.assertTrue(thread.messages[0]['full'])
+        self.assertIsNone(thread.playlist_version)
+
+if __name__ == "__main__":
+    unittest.main()
+
+class RefusingMPDClient:
+    """
+    Stands in for musicpd.MPDClient with a server that refuses connections.
+    """
+    def connect(self, host:str, port:int):
+        raise ConnectionRefusedError("refused")
+
+    def disconnect(self):
+        pass
+
+@mock.patch.object(mpd.musicpd, "MPDClient", RefusingMPDClient)
+class ConnectionErrorTest(unittest.TestCase):
+    @mock.patch.object(Constants, "connect_timeout_secs", 0.2)
+    @mock.patch.object(Constants, "reconnect_backoff_min_secs", 0.05)
+    def test_connect_default_deadline(self):
+        pool = mpd.ClientPool("localhost", 6600, size=1)
+        with self.assertRaises(mpd.CommandTimeoutError):
+            pool.connect()
+        self.assertGreater(pool.connect_failures, 0)
+
+    def test_failed_reset(self):
+        client = object.__new__(mpd.Client)
+        client.host, client.port = "localhost", 6600
+        client.mpd_client = RefusingMPDClient()
+        with self.assertRaises(musicpd.ConnectionError):
+            client.reset_connection()
@@ -0,0 +1,57 @@
+import unittest
+try:
+    from mpdfront import search
+except ImportError as e:
+    raise unittest.SkipTest("mpdfront dependencies are not installed: %s" % e)
+
+def song(file:str, **tags):
+    return search.get_search_row(dict(file=file, **tags))
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = search.SearchIndex([
+            song("b/2.flac", artist="Björk", album="Post", title="Hyperballad", track="2"),
+            song("b/1.flac", artist="Björk", album="Post", title="Army of Me", track="1"),
+            song("c/1.flac", artist=[ "Chick Corea", "Gary Burton" ], albumartist=[ "Chick Corea", "Gary Burton" ],
+                 album="Crystal Silence", title="Señor Mouse", disc=[ "1", "1" ], track=[ "1/5", "1/5" ]),
+        ])
+
+    def test_fold(self):
+        rows, total = self.index.search("bjork")
+        self.assertEqual(total, 2)
+        self.assertEqual([ r['file'] for r in rows ], [ "b/1.flac", "b/2.flac" ])
+
+    def test_prefix(self):
+        rows, total = self.index.search("hyp")
+        self.assertEqual([ r['file'] for r in rows ], [ "b/2.flac" ])
+
+    def test_repeated_tags(self):
+        rows, total = self.index.search("burton senor")
+        self.assertEqual(total, 1)
+        self.assertEqual(rows[0]['artist'], "Chick Corea; Gary Burton")
+        self.assertEqual(rows[0]['track'], "1/5")
+
+    def test_sort_key_of_repeated_tags(self):
+        row = { 'file': "c/1.flac", 'albumartist': [ "Chick Corea", "Gary Burton" ], 'track': [ "3", "3" ] }
+        self.assertEqual(search.get_sort_key(row), ("chick corea; gary burton", "", 0, 3, "c/1.flac"))
+
+    def test_apply(self):
+        changed = [ song("b/1.flac", artist="Björk", album="Post", title="Army of You", track="1") ]
+        self.index.apply(*self.index.diff([ changed[0], song("b/2.flac", artist="Björk", album="Post",
+                                                              title="Hyperballad", track="2") ]))
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.search("army you")[1], 1)
+        self.assertEqual(self.index.search("army me")[1], 0)
+        self.assertEqual(self.index.search("corea")[1], 0)
+
+    def test_needs_rebuild(self):
+        self.assertFalse(self.index.needs_rebuild([], []))
+        ## two of three ids would be unused
+        self.assertTrue(self.index.needs_rebuild([], [ "b/1.flac", "b/2.flac" ]))
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search("zappa"), ([], 0))
+        self.assertEqual(self.index.search(""), ([], 0))
+
+if __name__ == "__main__":
+    unittest.main()